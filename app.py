@@ -1,21 +1,155 @@
-from flask import Flask, request, jsonify, send_file, send_from_directory
+from flask import Flask, Response, abort, g, has_request_context, request, jsonify, make_response, send_file, send_from_directory, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate, upgrade
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict, defaultdict, namedtuple
 import os
+import sys
+import click
+import re
+import gzip
+import json
+import math
+import time
+import uuid
+import queue
+import atexit
 import base64
+import heapq
+import bisect
+import pickle
+import hashlib
+import itertools
+import logging
+import sqlite3
+import importlib.util
+import multiprocessing
+import functools
+import threading
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///learncircle.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///learncircle.db').replace(
+    'postgres://', 'postgresql://', 1
+)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 10))
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+app.config['SQLITE_JOURNAL_MODE'] = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+app.config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))  # milliseconds
+app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'uploads')
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max request body, so max upload chunk
+app.config['UPLOAD_CHUNK_SIZE'] = 8 * 1024 * 1024
+app.config['MAX_UPLOAD_SIZE'] = 2 * 1024 * 1024 * 1024  # 2GB max file via chunked upload
+app.config['PARTIAL_UPLOAD_EXPIRY'] = 24 * 60 * 60  # seconds before abandoned chunked uploads are removed
+app.config['UPLOAD_LOCK_TIMEOUT'] = 10 * 60  # seconds before a chunk's lock file is taken to be left by a crash
+app.config['PAGE_SIZE_DEFAULT'] = 50
+app.config['PAGE_SIZE_MAX'] = 200
+app.config['CHAT_STREAM_QUEUE_SIZE'] = 256
+app.config['CHAT_STREAM_HEARTBEAT'] = 15  # seconds
+app.config['CHAT_BROKER'] = os.environ.get('CHAT_BROKER', 'memory')  # 'memory', or 'redis' with several worker processes
+app.config['CHAT_REDIS_URL'] = os.environ.get('CHAT_REDIS_URL', os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'))
+app.config['VIEW_FLUSH_INTERVAL'] = 2  # seconds between view count flushes
+app.config['POINTS_WORKER_INTERVAL'] = 1  # seconds between points event batches
+app.config['POINTS_BATCH_SIZE'] = 500
+app.config['LEADERBOARD_RANK_SYNC_INTERVAL'] = 1  # seconds between folding new points history into rank indexes
+app.config['LEADERBOARD_RANK_GAP_TIMEOUT'] = 60  # seconds to wait for a points history id committed out of order
+app.config['CACHE_BACKEND'] = os.environ.get('CACHE_BACKEND', 'memory')  # 'memory' or 'redis'
+app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+app.config['CACHE_TTL'] = 60  # seconds
+app.config['CACHE_MAX_ENTRIES'] = 10000
+app.config['BULK_IMPORT_MAX_ITEMS'] = 2000
+app.config['EXPORT_BATCH_SIZE'] = 500  # rows fetched per round trip while exporting
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')  # signs session tokens; must be the same on every worker
+app.config['SESSION_TOKEN_TTL'] = 7 * 24 * 60 * 60  # seconds
+app.config['REQUIRE_SESSION_TOKEN'] = os.environ.get('REQUIRE_SESSION_TOKEN') == '1'  # reject requests that only send a user_id
+app.config['IDENTITY_CACHE_SIZE'] = 10000
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')  # werkzeug method with every parameter
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+app.config['PASSWORD_HASH_QUEUE_LIMIT'] = 64  # logins waiting for a hash before answering 503
+app.config['SLOW_QUERY_THRESHOLD'] = float(os.environ.get('SLOW_QUERY_THRESHOLD', 0.1))  # seconds; slower statements are logged
+app.config['PROFILER_ENABLED'] = os.environ.get('PROFILER_ENABLED') == '1'  # allow /api/profiler to switch sampling on
+app.config['PROFILER_INTERVAL'] = 0.005  # seconds between stack samples
+app.config['RECOMMENDATION_NEIGHBORS'] = 50  # most similar circles stored per circle
+app.config['RECOMMENDATION_TAG_WEIGHT'] = 0.5  # share of similarity from tags; the rest is from shared members
+app.config['RECOMMENDATION_REFRESH_INTERVAL'] = 30  # seconds between refreshes of changed circles
+app.config['REMINDER_INTERVAL'] = 60  # seconds between reminder scheduler runs
+app.config['REMINDER_LEAD_TIME'] = 24 * 60 * 60  # seconds before a task's due date its reminder is sent
+app.config['REMINDER_BUCKET'] = 60  # seconds of due dates sharing one reminder queue entry
+app.config['REMINDER_LOOKAHEAD'] = 60 * 60  # seconds of upcoming reminders held in memory
+app.config['OVERDUE_DIGEST_HOUR'] = 8  # UTC hour after which the daily overdue digest goes out
+app.config['OVERDUE_DIGEST_DAYS'] = 7  # tasks overdue for longer drop out of the digest
+app.config['NOTIFICATION_BATCH_SIZE'] = 1000  # notifications written per transaction
+app.config['PREVIEW_WORKERS'] = int(os.environ.get('PREVIEW_WORKERS', 2))  # PDF processing processes per server process
+app.config['PREVIEW_THUMBNAIL_WIDTH'] = 320  # pixels
+app.config['PREVIEW_TEXT_MAX_PAGES'] = 200
+app.config['PREVIEW_TEXT_MAX_CHARS'] = 200000  # extracted text kept for search
+app.config['PREVIEW_SWEEP_INTERVAL'] = 60  # seconds between checks for PDFs left pending
+app.config['PREVIEW_RETRY_AFTER'] = 10 * 60  # seconds before a pending PDF is picked up by the sweep
+app.config['JSON_SERIALIZER'] = os.environ.get(  # 'orjson' or 'json'
+    'JSON_SERIALIZER', 'orjson' if importlib.util.find_spec('orjson') else 'json'
+)
+app.config['COMPRESS_MIN_SIZE'] = 1024  # bytes; smaller bodies gain little and cost a round of compression
+app.config['COMPRESS_MIMETYPES'] = {'application/json', 'text/html', 'text/plain', 'text/css', 'text/javascript'}
+app.config['COMPRESS_ENCODINGS'] = ['br', 'gzip'] if importlib.util.find_spec('brotli') else ['gzip']  # server's preference
+app.config['COMPRESS_GZIP_LEVEL'] = 6
+app.config['COMPRESS_BROTLI_QUALITY'] = 5  # about gzip level 6's CPU; 11 compresses best but is far too slow per request
+app.config['COMPRESS_CACHE_SIZE'] = 1000  # compressed bodies of cached responses kept
+
+if app.config['SQLALCHEMY_DATABASE_URI'] in ('sqlite://', 'sqlite:///:memory:'):
+    # In-memory databases live on a single connection; keep SQLAlchemy's pool
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+elif app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    # One writer at a time regardless, so a small pool of long-lived
+    # connections is enough; waiting for the write lock is done by SQLite
+    # itself via busy_timeout rather than failing with "database is locked"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': app.config['DB_POOL_SIZE'],
+        'max_overflow': app.config['DB_MAX_OVERFLOW'],
+        'connect_args': {'timeout': app.config['SQLITE_BUSY_TIMEOUT'] / 1000, 'check_same_thread': False},
+    }
+else:
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': app.config['DB_POOL_SIZE'],
+        'max_overflow': app.config['DB_MAX_OVERFLOW'],
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+    }
+
+@event.listens_for(Engine, 'connect')
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    # WAL lets readers run alongside the writer, and synchronous=NORMAL only
+    # fsyncs at checkpoints, which is still crash-safe in WAL mode
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={app.config['SQLITE_JOURNAL_MODE']}")
+    cursor.execute(f"PRAGMA synchronous={app.config['SQLITE_SYNCHRONOUS']}")
+    cursor.execute(f"PRAGMA busy_timeout={app.config['SQLITE_BUSY_TIMEOUT']}")
+    cursor.close()
 
 db = SQLAlchemy(app)
 
-# Ensure upload folder exists
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+def include_in_migrations(object, name, type_, reflected, compare_to):
+    # circle_fts, resource_fts and their shadow tables are managed by hand in the migrations
+    return not (type_ == 'table' and name.startswith(('circle_fts', 'resource_fts')))
+
+# Schema changes ship as Alembic migrations in migrations/: run `flask db upgrade`
+migrate = Migrate(app, db, directory=os.path.join(app.root_path, 'migrations'),
+                  render_as_batch=True, include_object=include_in_migrations)
+
+# Ensure upload folder exists; in-progress chunked uploads live in .partial
+PARTIAL_FOLDER = os.path.join(app.config['UPLOAD_FOLDER'], '.partial')
+os.makedirs(PARTIAL_FOLDER, exist_ok=True)
 
 # Database Models
 class User(db.Model):
@@ -27,6 +161,7 @@ class User(db.Model):
     points = db.Column(db.Integer, default=0)
     badges = db.Column(db.String(500), default='')
     reputation_level = db.Column(db.Integer, default=1)
+    completed_tasks_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     created_circles = db.relationship('Circle', backref='creator', lazy=True, foreign_keys='Circle.creator_id')
@@ -41,13 +176,37 @@ class Circle(db.Model):
     tags = db.Column(db.String(500))
     creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     privacy = db.Column(db.String(20), default='public')  # 'public' or 'private'
+    member_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    follower_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_circle_creator_id', 'creator_id'),
+        db.Index('ix_circle_privacy_created', 'privacy', 'created_at', 'id'),
+        db.Index('ix_circle_privacy_member_count', 'privacy', 'member_count', 'id'),
+    )
+    
     resources = db.relationship('Resource', backref='circle', lazy=True, cascade='all, delete-orphan')
     tasks = db.relationship('Task', backref='circle', lazy=True, cascade='all, delete-orphan')
+    tag_links = db.relationship('CircleTag', backref='circle', lazy=True, cascade='all, delete-orphan')
     members = db.relationship('CircleMember', backref='circle', lazy=True, cascade='all, delete-orphan')
     messages = db.relationship('Message', backref='circle', lazy=True, cascade='all, delete-orphan')
 
+class Tag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)  # normalized by normalize_tags()
+    circle_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # public circles only
+    
+    # The unique index on name also serves prefix lookups
+    __table_args__ = (db.Index('ix_tag_circle_count', 'circle_count', 'name'),)
+
+class CircleTag(db.Model):
+    # Inverted index from tags to circles; Circle.tags keeps the display string
+    circle_id = db.Column(db.Integer, db.ForeignKey('circle.id'), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey('tag.id'), primary_key=True)
+    
+    __table_args__ = (db.Index('ix_circle_tag_tag_id', 'tag_id', 'circle_id'),)
+
 class CircleMember(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -57,6 +216,12 @@ class CircleMember(db.Model):
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     user = db.relationship('User', backref='circle_memberships')
+    
+    # The unique index also serves lookups by user_id alone
+    __table_args__ = (
+        db.Index('uq_circle_member_user_circle', 'user_id', 'circle_id', unique=True),
+        db.Index('ix_circle_member_circle_id', 'circle_id'),
+    )
 
 class Resource(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -67,9 +232,18 @@ class Resource(db.Model):
     content = db.Column(db.Text)  # File path or URL
     upload_date = db.Column(db.DateTime, default=datetime.utcnow)
     view_count = db.Column(db.Integer, default=0)
+    processing_status = db.Column(db.String(20))  # uploaded PDFs: 'pending', 'ready', 'failed' or 'unavailable'
+    thumbnail = db.Column(db.String(100))  # first-page image in PREVIEW_FOLDER
+    extracted_text = db.deferred(db.Column(db.Text))  # only loaded when asked for; lists never need it
     
     creator = db.relationship('User', backref='resources')
     comments = db.relationship('Comment', backref='resource', lazy=True, cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.Index('ix_resource_circle_upload_date', 'circle_id', 'upload_date', 'id'),
+        db.Index('ix_resource_creator_id', 'creator_id'),
+        db.Index('ix_resource_processing_status', 'processing_status', 'upload_date'),
+    )
 
 class Task(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -77,15 +251,26 @@ class Task(db.Model):
     description = db.Column(db.Text, nullable=False)
     due_date = db.Column(db.DateTime, nullable=False)
     circle_id = db.Column(db.Integer, db.ForeignKey('circle.id'), nullable=False)
+    completion_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     completions = db.relationship('TaskCompletion', backref='task', lazy=True, cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.Index('ix_task_circle_id', 'circle_id'),
+        db.Index('ix_task_due_date', 'due_date', 'id'),
+    )
 
 class TaskCompletion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     completion_date = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('uq_task_completion_task_user', 'task_id', 'user_id', unique=True),
+        db.Index('ix_task_completion_user_id', 'user_id'),
+    )
 
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -93,6 +278,8 @@ class Comment(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     resource_id = db.Column(db.Integer, db.ForeignKey('resource.id'), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_comment_resource_timestamp', 'resource_id', 'timestamp', 'id'),)
 
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -100,44 +287,2151 @@ class Message(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     circle_id = db.Column(db.Integer, db.ForeignKey('circle.id'), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_message_circle_timestamp', 'circle_id', 'timestamp', 'id'),)
 
 class PointsHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     points = db.Column(db.Integer, nullable=False)
     reason = db.Column(db.String(200), nullable=False)
+    circle_id = db.Column(db.Integer, db.ForeignKey('circle.id'))
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
     user = db.relationship('User', backref='points_history')
+    
+    __table_args__ = (db.Index('ix_points_history_user_id', 'user_id'),)
+
+class PointsEvent(db.Model):
+    # Outbox of point awards, written in the same transaction as the action
+    # that earned them and applied to User by the points worker
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    points = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(200), nullable=False)
+    circle_id = db.Column(db.Integer, db.ForeignKey('circle.id'))
+    idempotency_key = db.Column(db.String(200), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+    
+    __table_args__ = (db.Index('ix_points_event_pending', 'processed_at', 'id'),)
+
+class LeaderboardEntry(db.Model):
+    # Materialized leaderboards, one row per (board, user). Boards are
+    # 'global', 'week:<iso week>', 'month:<yyyy-mm>' and 'circle:<id>'
+    # (points earned through that circle). Maintained by the points worker.
+    board = db.Column(db.String(40), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    points = db.Column(db.Integer, nullable=False, default=0)
+    
+    user = db.relationship('User')
+    
+    __table_args__ = (db.Index('ix_leaderboard_rank', 'board', 'points', 'user_id'),)
+
+class Notification(db.Model):
+    # In-app notifications from the reminder scheduler. key makes each one
+    # idempotent: 'due:<task_id>:<user_id>' or 'overdue:<yyyy-mm-dd>:<user_id>'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # 'task_due' or 'overdue_digest'
+    message = db.Column(db.String(500), nullable=False)
+    task_id = db.Column(db.Integer, db.ForeignKey('task.id'))
+    circle_id = db.Column(db.Integer, db.ForeignKey('circle.id'))
+    key = db.Column(db.String(100), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    read_at = db.Column(db.DateTime)
+    
+    __table_args__ = (db.Index('ix_notification_user_created', 'user_id', 'created_at', 'id'),)
+
+class CircleSimilarity(db.Model):
+    # The RECOMMENDATION_NEIGHBORS public circles most similar to each
+    # circle, precomputed for recommendations. The primary key serves the
+    # lookup by circle_id.
+    circle_id = db.Column(db.Integer, db.ForeignKey('circle.id'), primary_key=True)
+    similar_circle_id = db.Column(db.Integer, db.ForeignKey('circle.id'), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
 
 # Helper Functions
-def award_points(user_id, points, reason):
-    user = User.query.get(user_id)
-    if user:
-        user.points += points
-        history = PointsHistory(user_id=user_id, points=points, reason=reason)
-        db.session.add(history)
+def dialect_insert(model):
+    # INSERT construct with on_conflict_* support where the backend has it
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return db.insert(model)
+    return insert(model)
+
+def insert_ignoring_duplicates(model):
+    insert = dialect_insert(model)
+    if hasattr(insert, 'on_conflict_do_nothing'):
+        return insert.on_conflict_do_nothing()
+    return insert
+
+def award_points(user_id, points, reason, idempotency_key, circle_id=None):
+    """Queue a points award in the current transaction.
+
+    Nothing is committed here: the award lands atomically with the caller's
+    own changes. A second award with the same idempotency_key is ignored,
+    so retried requests never double-award.
+    """
+    db.session.execute(insert_ignoring_duplicates(PointsEvent).values(
+        user_id=user_id,
+        points=points,
+        reason=reason,
+        idempotency_key=idempotency_key,
+        circle_id=circle_id,
+        created_at=datetime.utcnow()
+    ))
+
+def reputation_level_for(points):
+    if points >= 1000:
+        return 5
+    elif points >= 500:
+        return 4
+    elif points >= 200:
+        return 3
+    elif points >= 50:
+        return 2
+    return 1
+
+def process_points_events(batch_size=None):
+    """Apply pending PointsEvents to User points in batched transactions.
+    
+    Safe to run in several processes at once (every server worker, the exit
+    drain, 'flask rebuild-points'): each batch is claimed by an UPDATE that
+    only matches events still unprocessed, and only the events that UPDATE
+    returned are applied, in the same transaction. User points are bumped
+    with relative UPDATEs, so two batches for one user never lose a write.
+    """
+    batch_size = batch_size or app.config['POINTS_BATCH_SIZE']
+    processed = 0
+    while True:
+        candidates = db.session.scalars(db.select(PointsEvent.id).where(
+            PointsEvent.processed_at.is_(None)
+        ).order_by(PointsEvent.id).limit(batch_size)).all()
+        db.session.rollback()  # end the read, so the claim below starts the write transaction
+        if not candidates:
+            return processed
+        
+        now = datetime.utcnow()
+        claimed = db.session.scalars(db.update(PointsEvent).where(
+            PointsEvent.id.in_(candidates), PointsEvent.processed_at.is_(None)
+        ).values(processed_at=now).returning(PointsEvent.id).execution_options(synchronize_session=False)).all()
+        events = db.session.execute(db.select(
+            PointsEvent.user_id, PointsEvent.points, PointsEvent.reason, PointsEvent.circle_id, PointsEvent.created_at
+        ).where(PointsEvent.id.in_(claimed)).order_by(PointsEvent.id)).all() if claimed else []
+        
+        totals = defaultdict(int)
+        board_deltas = defaultdict(int)
+        for event in events:
+            totals[event.user_id] += event.points
+            for board in leaderboards_for(event.created_at, event.circle_id):
+                board_deltas[(board, event.user_id)] += event.points
+            db.session.add(PointsHistory(user_id=event.user_id, points=event.points, reason=event.reason,
+                                         circle_id=event.circle_id, timestamp=event.created_at))
+        for user_id, points in totals.items():
+            increment(User, user_id, points=points)
+        for user in User.query.filter(User.id.in_(totals)).populate_existing().all():
+            user.reputation_level = max(user.reputation_level or 1, reputation_level_for(user.points))
+        add_leaderboard_points(board_deltas)
+        db.session.commit()
+        invalidate(*(f'user:{user_id}' for user_id in totals))
+        
+        processed += len(events)
+        if len(candidates) < batch_size:
+            return processed
+
+# Leaderboards
+def week_board(when):
+    year, week, _ = when.isocalendar()
+    return f'week:{year}-W{week:02d}'
+
+def month_board(when):
+    return f'month:{when:%Y-%m}'
+
+def leaderboards_for(when, circle_id=None):
+    boards = ['global', week_board(when), month_board(when)]
+    if circle_id is not None:
+        boards.append(f'circle:{circle_id}')
+    return boards
+
+def add_leaderboard_points(board_deltas):
+    """Upsert {(board, user_id): delta} into leaderboard_entry."""
+    if not board_deltas:
+        return
+    insert = dialect_insert(LeaderboardEntry)
+    db.session.execute(
+        insert.on_conflict_do_update(
+            index_elements=['board', 'user_id'],
+            set_={'points': LeaderboardEntry.points + insert.excluded.points}
+        ),
+        [{'board': board, 'user_id': user_id, 'points': delta}
+         for (board, user_id), delta in board_deltas.items()]
+    )
+
+class RankIndex:
+    """Fenwick tree counting users per point total on one board.
+
+    rank() and update() are O(log max_points), so a user's rank never needs
+    a COUNT over everyone above them.
+    """
+    
+    def __init__(self, points_by_user):
+        self.points = dict(points_by_user)
+        self.size = 1
+        while self.size <= max(self.points.values(), default=0):
+            self.size *= 2
+        self._rebuild()
+    
+    def _rebuild(self):
+        # Linear-time build: bucket counts, then push each node into its parent
+        tree = [0] * (self.size + 1)
+        for points in self.points.values():
+            tree[points + 1] += 1
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                tree[parent] += tree[i]
+        self.tree = tree
+    
+    def _add(self, points, count):
+        i = points + 1
+        while i <= self.size:
+            self.tree[i] += count
+            i += i & -i
+    
+    def _count_at_most(self, points):
+        i, total = min(points + 1, self.size), 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+    
+    def update(self, user_id, delta):
+        old = self.points.get(user_id)
+        new = (old or 0) + delta
+        self.points[user_id] = new
+        if new >= self.size:
+            while new >= self.size:
+                self.size *= 2
+            self._rebuild()
+            return
+        if old is not None:
+            self._add(old, -1)
+        self._add(new, 1)
+    
+    def rank(self, user_id):
+        # Competition ranking: 1 + number of users with strictly more points
+        points = self.points.get(user_id)
+        if points is None:
+            return None
+        return len(self.points) - self._count_at_most(points) + 1
+
+class RankIndexCache:
+    """Per-board RankIndexes, loaded once and then kept current from points_history.
+    
+    Loading a board scans its leaderboard_entry rows, once per process.
+    After that, sync() folds in the points_history rows that the points
+    worker in any process has written since, so an index is never reloaded.
+    An id missing below the newest one seen (a transaction that committed
+    out of order, which SQLite never does) is looked for again on each sync
+    for LEADERBOARD_RANK_GAP_TIMEOUT seconds.
+    """
+    
+    def __init__(self, max_boards=64):
+        self.max_boards = max_boards
+        self._lock = threading.RLock()
+        self._indexes = {}  # board -> (RankIndex, last used)
+        self._seen = None  # newest points_history id folded into the indexes
+        self._gaps = {}  # missing points_history id -> when it was first missed
+    
+    def get(self, board):
+        with self._lock:
+            self.sync()
+            cached = self._indexes.get(board)
+            index = cached[0] if cached else self._load(board)
+            self._indexes[board] = (index, time.monotonic())
+            return index
+    
+    def _load(self, board):
+        # One statement, so the rows and the history id they include come from the same snapshot
+        head = db.select(db.func.max(PointsHistory.id).label('id')).subquery()
+        rows = db.session.execute(
+            db.select(head.c.id, LeaderboardEntry.user_id, LeaderboardEntry.points).select_from(head).outerjoin(
+                LeaderboardEntry, LeaderboardEntry.board == board
+            )
+        ).all()
+        # Bring the other boards up to the same history id before this one joins them
+        self.sync(upto=rows[0].id or 0)
+        if len(self._indexes) >= self.max_boards:
+            oldest = min(self._indexes, key=lambda key: self._indexes[key][1])
+            del self._indexes[oldest]
+        return RankIndex((user_id, points) for _, user_id, points in rows if user_id is not None)
+    
+    def sync(self, upto=None):
+        """Apply points_history rows newer than the last sync to the loaded indexes."""
+        with self._lock:
+            if self._seen is None or not self._indexes:
+                # Nothing loaded to update; just note how far history goes
+                self._seen = upto if upto is not None else db.session.scalar(
+                    db.select(db.func.coalesce(db.func.max(PointsHistory.id), 0))
+                )
+                self._gaps.clear()
+                return
+            now = time.monotonic()
+            timeout = app.config['LEADERBOARD_RANK_GAP_TIMEOUT']
+            self._gaps = {row_id: missed for row_id, missed in self._gaps.items() if now - missed < timeout}
+            condition = PointsHistory.id > self._seen
+            if upto is not None:
+                condition = db.and_(condition, PointsHistory.id <= upto)
+            if self._gaps:
+                condition = db.or_(condition, PointsHistory.id.in_(self._gaps))
+            rows = db.session.execute(db.select(
+                PointsHistory.id, PointsHistory.user_id, PointsHistory.points, PointsHistory.circle_id,
+                PointsHistory.timestamp
+            ).where(condition).order_by(PointsHistory.id)).all()
+            
+            board_deltas = defaultdict(int)
+            for row_id, user_id, points, circle_id, timestamp in rows:
+                if self._gaps.pop(row_id, None) is None:
+                    self._gaps.update(dict.fromkeys(range(self._seen + 1, row_id), now))
+                    self._seen = row_id
+                for board in leaderboards_for(timestamp or datetime.utcnow(), circle_id):
+                    board_deltas[(board, user_id)] += points
+            for (board, user_id), delta in board_deltas.items():
+                cached = self._indexes.get(board)
+                if cached:
+                    cached[0].update(user_id, delta)
+    
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+            self._seen = None
+            self._gaps.clear()
+
+rank_indexes = RankIndexCache()
+
+def sync_rank_indexes():
+    # Keeps the catch-up in get() small when leaderboards are rarely asked for
+    rank_indexes.sync()
+
+def current_board(period):
+    now = datetime.utcnow()
+    if period == 'week':
+        return week_board(now)
+    if period == 'month':
+        return month_board(now)
+    if period == 'all':
+        return 'global'
+    raise ValueError('period must be one of all, week, month')
+
+def leaderboard_response(board):
+    limit = page_limit()
+    entries = LeaderboardEntry.query.filter_by(board=board).options(
+        db.joinedload(LeaderboardEntry.user)
+    ).order_by(LeaderboardEntry.points.desc(), LeaderboardEntry.user_id.asc()).limit(limit).all()
+    
+    ranked = []
+    for position, entry in enumerate(entries, start=1):
+        rank = ranked[-1]['rank'] if ranked and ranked[-1]['points'] == entry.points else position
+        ranked.append({
+            'rank': rank,
+            'user_id': entry.user_id,
+            'username': entry.user.username,
+            'points': entry.points
+        })
+    
+    result = {'board': board, 'entries': ranked}
+    user_id = request.args.get('user_id', type=int)
+    if user_id is not None:
+        index = rank_indexes.get(board)
+        result['user'] = {
+            'user_id': user_id,
+            'rank': index.rank(user_id),
+            'points': index.points.get(user_id, 0)
+        }
+    return jsonify(result)
+
+def rebuild_points():
+    """Recompute every user's points, reputation and leaderboards from PointsHistory."""
+    process_points_events()
+    totals = dict(db.session.query(PointsHistory.user_id, db.func.sum(PointsHistory.points)).group_by(
+        PointsHistory.user_id
+    ).all())
+    user_table = User.__table__
+    db.session.execute(user_table.update().values(points=0, reputation_level=1))
+    if totals:
+        db.session.execute(
+            user_table.update().where(user_table.c.id == db.bindparam('user_id')).values(
+                points=db.bindparam('total'), reputation_level=db.bindparam('level')
+            ),
+            [{'user_id': user_id, 'total': total, 'level': reputation_level_for(total)}
+             for user_id, total in totals.items()]
+        )
+    
+    db.session.execute(db.delete(LeaderboardEntry))
+    board_deltas = defaultdict(int)
+    history = db.session.query(PointsHistory.user_id, PointsHistory.points, PointsHistory.circle_id,
+                               PointsHistory.timestamp).yield_per(10000)
+    for user_id, points, circle_id, timestamp in history:
+        for board in leaderboards_for(timestamp or datetime.utcnow(), circle_id):
+            board_deltas[(board, user_id)] += points
+    add_leaderboard_points(board_deltas)
+    db.session.commit()
+    rank_indexes.clear()
+    return len(totals)
+
+@app.cli.command('rebuild-points')
+def rebuild_points_command():
+    """Rebuild User.points and reputation_level from PointsHistory."""
+    print(f'Rebuilt points for {rebuild_points()} users')
+
+# Denormalized counters
+# Circle.member_count/follower_count, Task.completion_count,
+# User.completed_tasks_count and Tag.circle_count are updated with relative
+# UPDATEs in the same transaction as the row they count. 'flask
+# check-counters' verifies them.
+def increment(model, row_id, **deltas):
+    db.session.execute(db.update(model).where(model.id == row_id).values(
+        {name: getattr(model, name) + delta for name, delta in deltas.items()}
+    ).execution_options(synchronize_session=False))
+
+def counter_drift():
+    """Yield (model, id, column, stored, actual) for every counter that is off."""
+    checks = [
+        (Circle, 'member_count', CircleMember.circle_id, CircleMember.is_member == True),
+        (Circle, 'follower_count', CircleMember.circle_id, CircleMember.is_following == True),
+        (Task, 'completion_count', TaskCompletion.task_id, None),
+        (User, 'completed_tasks_count', TaskCompletion.user_id, None),
+        (Tag, 'circle_count', CircleTag.tag_id, db.and_(CircleTag.circle_id == Circle.id, Circle.privacy == 'public')),
+    ]
+    for model, column, key, condition in checks:
+        actual = db.select(key.label('row_id'), db.func.count().label('actual')).group_by(key)
+        if condition is not None:
+            actual = actual.where(condition)
+        actual = actual.subquery()
+        stored = getattr(model, column)
+        rows = db.session.query(model.id, stored, db.func.coalesce(actual.c.actual, 0)).outerjoin(
+            actual, actual.c.row_id == model.id
+        ).filter(stored != db.func.coalesce(actual.c.actual, 0))
+        for row_id, stored_value, actual_value in rows:
+            yield model, row_id, column, stored_value, actual_value
+
+@app.cli.command('check-counters')
+@click.option('--repair', is_flag=True, help='Overwrite drifted counters with the recounted value.')
+def check_counters_command(repair):
+    """Compare denormalized counters with a recount, optionally repairing them."""
+    drift = list(counter_drift())
+    for model, row_id, column, stored, actual in drift:
+        print(f'{model.__tablename__} {row_id}: {column} is {stored}, expected {actual}')
+        if repair:
+            db.session.execute(db.update(model).where(model.id == row_id).values({column: actual}))
+    if repair:
+        db.session.commit()
+    print(f'{len(drift)} counters {"repaired" if repair else "out of sync"}')
+
+def circles_with_creator():
+    return Circle.query.join(Circle.creator).options(db.contains_eager(Circle.creator))
+
+def serialize_circle(circle):
+    return {
+        'id': circle.id,
+        'title': circle.title,
+        'description': circle.description,
+        'tags': circle.tags,
+        'creator_id': circle.creator_id,
+        'creator_username': circle.creator.username,
+        'privacy': circle.privacy,
+        'created_at': circle.created_at.isoformat(),
+        'member_count': circle.member_count,
+        'follower_count': circle.follower_count
+    }
+
+# Cursor pagination
+# Pages are keyed on (timestamp, id) so a page costs one index range scan no
+# matter how deep into the history it is. Cursors are opaque to clients.
+Page = namedtuple('Page', ['items', 'before', 'after', 'has_more'])
+
+def encode_cursor(timestamp, row_id):
+    return base64.urlsafe_b64encode(f'{timestamp.isoformat()}|{row_id}'.encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        raise ValueError('Invalid cursor')
+
+def page_limit():
+    limit = request.args.get('limit', app.config['PAGE_SIZE_DEFAULT'], type=int)
+    return max(1, min(limit, app.config['PAGE_SIZE_MAX']))
+
+def keyset_page(query, timestamp_column, id_column):
+    """Return one page of `query` in ascending (timestamp, id) order.
+
+    ?after=<cursor> pages forward from a cursor, ?before=<cursor> pages
+    back, and with neither the newest page is returned. Raises ValueError
+    for a malformed cursor.
+    """
+    limit = page_limit()
+    before = request.args.get('before')
+    after = request.args.get('after')
+    key = db.tuple_(timestamp_column, id_column)
+    
+    if after:
+        query = query.filter(key > db.tuple_(*decode_cursor(after)))
+        query = query.order_by(timestamp_column.asc(), id_column.asc())
+    else:
+        if before:
+            query = query.filter(key < db.tuple_(*decode_cursor(before)))
+        query = query.order_by(timestamp_column.desc(), id_column.desc())
+    
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not after:
+        rows.reverse()
+    
+    def cursor(row):
+        entity = row[0] if hasattr(row, '_mapping') else row
+        return encode_cursor(getattr(entity, timestamp_column.key), getattr(entity, id_column.key))
+    
+    if not rows:
+        return Page(rows, None, None, has_more)
+    return Page(rows, cursor(rows[0]), cursor(rows[-1]), has_more)
+
+def paged_response(data, page):
+    response = jsonify(data)
+    if page.before:
+        response.headers['X-Before-Cursor'] = page.before
+        response.headers['X-After-Cursor'] = page.after
+    response.headers['X-Has-More'] = 'true' if page.has_more else 'false'
+    return response
+
+def wants_columns():
+    # ?format=columns asks a list endpoint for columnar() instead of one object per row
+    shape = request.args.get('format', 'rows')
+    if shape not in ('rows', 'columns'):
+        raise ValueError('format must be rows or columns')
+    return shape == 'columns'
+
+def columnar(items, user_id_field, username_field):
+    """Serialized rows as {'fields', 'rows', 'users'}.
+    
+    Each row is a list of values in the order of 'fields', so the keys are
+    sent once per page instead of once per row, and the username is left out
+    of the rows and sent once per user in 'users' (id -> username).
+    """
+    fields = [field for field in items[0] if field != username_field] if items else []
+    users = {}
+    rows = []
+    for item in items:
+        users[str(item[user_id_field])] = item[username_field]
+        rows.append([item[field] for field in fields])
+    return {'fields': fields, 'rows': rows, 'users': users}
+
+# View counting
+class ViewCounter:
+    """Sharded in-memory view tally, flushed to the database in batches.
+
+    Views only touch one shard's lock, so concurrent viewers never wait on
+    the database writer. flush_view_counts() drains every shard and applies
+    the deltas with relative UPDATEs, so no increment is lost to a
+    read-modify-write race.
+    """
+    
+    def __init__(self, shards=16):
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+    
+    def _shard(self, resource_id):
+        return self._shards[resource_id % len(self._shards)]
+    
+    def increment(self, resource_id, count=1):
+        counts, lock = self._shard(resource_id)
+        with lock:
+            counts[resource_id] = counts.get(resource_id, 0) + count
+            return counts[resource_id]
+    
+    def pending(self, resource_id):
+        counts, lock = self._shard(resource_id)
+        with lock:
+            return counts.get(resource_id, 0)
+    
+    def drain(self):
+        deltas = {}
+        for counts, lock in self._shards:
+            with lock:
+                deltas.update(counts)
+                counts.clear()
+        return deltas
+    
+    def restore(self, deltas):
+        for resource_id, count in deltas.items():
+            self.increment(resource_id, count)
+
+view_counter = ViewCounter()
+
+def flush_view_counts():
+    """Apply pending views in one transaction and award milestone points."""
+    deltas = view_counter.drain()
+    if not deltas:
+        return 0
+    try:
+        resource_table = Resource.__table__
+        db.session.execute(
+            resource_table.update().where(resource_table.c.id == db.bindparam('resource_id')).values(
+                view_count=db.func.coalesce(resource_table.c.view_count, 0) + db.bindparam('delta')
+            ),
+            [{'resource_id': resource_id, 'delta': delta} for resource_id, delta in deltas.items()]
+        )
+        resources = Resource.query.filter(Resource.id.in_(deltas)).populate_existing().all()
+        for resource in resources:
+            # Award 5 points for every multiple of 10 this batch crossed
+            previous = resource.view_count - deltas[resource.id]
+            for milestone in range(previous // 10 + 1, resource.view_count // 10 + 1):
+                award_points(resource.creator_id, 5,
+                             f'Resource "{resource.title}" reached {milestone * 10} views',
+                             f'views:{resource.id}:{milestone * 10}', resource.circle_id)
+        db.session.commit()
+        invalidate(*{f'circle:{resource.circle_id}:resources' for resource in resources})
+    except Exception:
+        db.session.rollback()
+        view_counter.restore(deltas)
+        raise
+    return len(deltas)
+
+# Task reminders
+# Each scheduler run loads the tasks coming due from the Task.due_date index
+# into a bucketed priority queue, at most REMINDER_LOOKAHEAD ahead. When a
+# bucket comes up, every member who has not completed its tasks gets a
+# reminder. Once a day each member also gets one digest of their overdue
+# tasks. Members x tasks are streamed from a connection of their own and
+# written NOTIFICATION_BATCH_SIZE per transaction, so even a 100k-member
+# circle takes bounded memory and never holds the write lock for long.
+# Notification keys make every write idempotent, so a restart or a second
+# worker process never sends a reminder twice.
+class ReminderQueue:
+    """Tasks waiting for their reminder, grouped into time buckets.
+    
+    The heap holds one entry per bucket rather than per task, so a deadline
+    shared by many tasks (everything due Friday 09:00) is one push and one
+    pop.
+    """
+    
+    def __init__(self, bucket_seconds):
+        self.bucket_seconds = bucket_seconds
+        self._lock = threading.Lock()
+        self._heap = []
+        self._buckets = {}
+        self.loaded_until = None  # tasks due up to here are queued
+        self.last_task_id = 0  # tasks created after this one are checked separately
+        self.digest_date = None
+    
+    def _bucket(self, when):
+        return int(when.replace(tzinfo=timezone.utc).timestamp() // self.bucket_seconds)
+    
+    def push(self, send_at, task_id):
+        bucket = self._bucket(send_at)
+        with self._lock:
+            if bucket not in self._buckets:
+                self._buckets[bucket] = set()
+                heapq.heappush(self._heap, bucket)
+            self._buckets[bucket].add(task_id)
+    
+    def pop_due(self, now):
+        """Remove and return the ids of the tasks in every bucket that has started."""
+        current, due = self._bucket(now), set()
+        with self._lock:
+            while self._heap and self._heap[0] <= current:
+                due |= self._buckets.pop(heapq.heappop(self._heap))
+        return due
+    
+    def __len__(self):
+        with self._lock:
+            return sum(len(task_ids) for task_ids in self._buckets.values())
+
+reminder_queue = ReminderQueue(app.config['REMINDER_BUCKET'])
+
+def load_upcoming_reminders(now):
+    """Queue the reminders of tasks due before now + lead time + lookahead.
+    
+    Tasks already due are left to the overdue digest.
+    """
+    lead = timedelta(seconds=app.config['REMINDER_LEAD_TIME'])
+    horizon = now + lead + timedelta(seconds=app.config['REMINDER_LOOKAHEAD'])
+    loaded_until = reminder_queue.loaded_until or now
+    # Tasks created while this runs are past last_task_id, so the next load
+    # picks them up instead of them falling between the two queries
+    last_task_id = db.session.query(db.func.max(Task.id)).scalar() or 0
+    tasks = db.session.query(Task.id, Task.due_date).filter(Task.id <= last_task_id)
+    rows = tasks.filter(Task.due_date > loaded_until, Task.due_date <= horizon).all()
+    if reminder_queue.loaded_until is not None:
+        # Tasks created since the last load that are due inside the loaded window
+        rows += tasks.filter(Task.id > reminder_queue.last_task_id, Task.due_date > now,
+                             Task.due_date <= loaded_until).all()
+    for task_id, due_date in rows:
+        reminder_queue.push(max(due_date - lead, now), task_id)
+    reminder_queue.last_task_id = last_task_id
+    reminder_queue.loaded_until = max(loaded_until, horizon)
+    db.session.commit()
+    return len(rows)
+
+def stream_rows(statement):
+    # Read on a connection of its own, so the caller can commit between batches
+    with db.engine.connect() as connection:
+        result = connection.execution_options(yield_per=app.config['NOTIFICATION_BATCH_SIZE']).execute(statement)
+        yield from result
+
+def write_notifications(rows):
+    """Insert notification dicts in batches, one transaction each.
+    
+    Returns the number inserted; rows whose key exists are skipped.
+    """
+    inserted = 0
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, app.config['NOTIFICATION_BATCH_SIZE'])):
+        inserted += db.session.execute(insert_ignoring_duplicates(Notification.__table__), batch).rowcount
+        db.session.commit()
+    return inserted
+
+def open_tasks(*criteria):
+    """(user_id, task) rows for each member of a task's circle who has not completed it."""
+    completed = db.select(TaskCompletion.id).where(TaskCompletion.task_id == Task.id,
+                                                   TaskCompletion.user_id == CircleMember.user_id)
+    return db.select(CircleMember.user_id, Task.id, Task.circle_id, Task.title, Task.due_date).select_from(Task).join(
+        CircleMember, CircleMember.circle_id == Task.circle_id
+    ).where(CircleMember.is_member == True, ~db.exists(completed), *criteria)
+
+def send_due_reminders(task_ids):
+    if not task_ids:
+        return 0
+    return write_notifications(
+        {'user_id': user_id, 'kind': 'task_due', 'task_id': task_id, 'circle_id': circle_id,
+         'message': f'"{title}" is due {due_date:%Y-%m-%d %H:%M} UTC'[:500], 'key': f'due:{task_id}:{user_id}'}
+        for user_id, task_id, circle_id, title, due_date in stream_rows(
+            # In key order, so notification index inserts land together rather than all over
+            open_tasks(Task.id.in_(task_ids)).order_by(CircleMember.user_id, Task.id)
+        )
+    )
+
+def send_overdue_digests(now):
+    """One notification per member listing the tasks they let go overdue."""
+    since = now - timedelta(days=app.config['OVERDUE_DIGEST_DAYS'])
+    rows = stream_rows(open_tasks(Task.due_date > since, Task.due_date <= now).order_by(
+        CircleMember.user_id, Task.due_date
+    ))
+    
+    def digests():
+        for user_id, tasks in itertools.groupby(rows, key=lambda row: row.user_id):
+            titles = [f'"{row.title}"' for row in tasks]
+            listed = ', '.join(titles[:3]) + (f' and {len(titles) - 3} more' if len(titles) > 3 else '')
+            yield {'user_id': user_id, 'kind': 'overdue_digest',
+                   'message': f'{len(titles)} overdue task{"s" if len(titles) > 1 else ""}: {listed}'[:500],
+                   'key': f'overdue:{now:%Y-%m-%d}:{user_id}'}
+    return write_notifications(digests())
+
+def run_reminders():
+    now = datetime.utcnow()
+    load_upcoming_reminders(now)
+    due = reminder_queue.pop_due(now)
+    try:
+        sent = send_due_reminders(due)
+    except Exception:
+        db.session.rollback()
+        for task_id in due:
+            reminder_queue.push(now, task_id)
+        raise
+    if now.hour >= app.config['OVERDUE_DIGEST_HOUR'] and reminder_queue.digest_date != now.date():
+        sent += send_overdue_digests(now)
+        reminder_queue.digest_date = now.date()
+    return sent
+
+@app.cli.command('send-reminders')
+def send_reminders_command():
+    """Run the reminder scheduler once, digest included."""
+    app.config['OVERDUE_DIGEST_HOUR'] = 0
+    print(f'Sent {run_reminders()} notifications')
+
+# Background workers
+# Started on the first request in each process, so forked server workers
+# each get their own threads.
+background_workers = {}
+background_workers_lock = threading.Lock()
+
+def run_periodically(job, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            with app.app_context():
+                job()
+        except Exception:
+            logging.exception('Background job %s failed; will retry', job.__name__)
+
+def background_jobs():
+    jobs = (
+        (flush_view_counts, app.config['VIEW_FLUSH_INTERVAL']),
+        (process_points_events, app.config['POINTS_WORKER_INTERVAL']),
+        (sync_rank_indexes, app.config['LEADERBOARD_RANK_SYNC_INTERVAL']),
+        (expire_partial_uploads, 60 * 60),
+        (refresh_recommendations, app.config['RECOMMENDATION_REFRESH_INTERVAL']),
+        (run_reminders, app.config['REMINDER_INTERVAL']),
+        (process_pending_previews, app.config['PREVIEW_SWEEP_INTERVAL']),
+    )
+    if chat_relay is not None:
+        # Blocks while subscribed; rerun after a second if the connection drops
+        jobs += ((chat_relay.listen, 1),)
+    return jobs
+
+@app.before_request
+def start_background_workers():
+    if len(background_workers) == len(background_jobs()):
+        return
+    with background_workers_lock:
+        for job, interval in background_jobs():
+            worker = background_workers.get(job.__name__)
+            if worker is None or not worker.is_alive():
+                worker = threading.Thread(target=run_periodically, args=(job, interval),
+                                          name=job.__name__, daemon=True)
+                worker.start()
+                background_workers[job.__name__] = worker
+
+@atexit.register
+def drain_background_work():
+    if multiprocessing.parent_process() is not None:
+        # A preview pool process; it imported the app but has nothing to drain
+        return
+    with app.app_context():
+        flush_view_counts()
+        if db.inspect(db.engine).has_table(PointsEvent.__tablename__):
+            process_points_events()
+
+# File storage
+# Uploaded files are stored under the SHA-256 of their content, so the same
+# file uploaded to several circles is kept once and never overwritten.
+CONTENT_ADDRESSED_NAME = re.compile(r'^([0-9a-f]{64})(\.\w+)?$')
+UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+COPY_BUFFER_SIZE = 64 * 1024
+
+def copy_stream(source, target, limit=None):
+    """Copy in fixed-size blocks so memory stays bounded; returns bytes copied."""
+    copied = 0
+    while limit is None or copied < limit:
+        block = source.read(COPY_BUFFER_SIZE if limit is None else min(COPY_BUFFER_SIZE, limit - copied))
+        if not block:
+            break
+        target.write(block)
+        copied += len(block)
+    return copied
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BUFFER_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def store_upload(path, original_filename):
+    """Move a fully received file into content-addressed storage.
+
+    Returns the stored filename. If identical content is already stored the
+    new copy is discarded.
+    """
+    extension = os.path.splitext(secure_filename(original_filename))[1].lower()
+    filename = file_digest(path) + extension
+    destination = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if os.path.exists(destination):
+        os.remove(path)
+    else:
+        os.replace(path, destination)
+    return filename
+
+def partial_upload_paths(upload_id):
+    base = os.path.join(PARTIAL_FOLDER, upload_id)
+    return base, base + '.json'
+
+def lock_upload(partial_path):
+    """Take the upload's lock file; False if another request holds it.
+    
+    O_EXCL makes creating it atomic across threads, greenlets and worker
+    processes. A lock older than UPLOAD_LOCK_TIMEOUT was left by a process
+    that died mid-chunk and is taken over.
+    """
+    lock_path = partial_path + '.lock'
+    for _ in range(2):
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) < app.config['UPLOAD_LOCK_TIMEOUT']:
+                    return False
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+    return False
+
+def unlock_upload(partial_path):
+    os.remove(partial_path + '.lock')
+
+def expire_partial_uploads():
+    cutoff = time.time() - app.config['PARTIAL_UPLOAD_EXPIRY']
+    for entry in os.scandir(PARTIAL_FOLDER):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            # A chunk's lock file, removed as we went
+            pass
+
+# Resource previews
+# Uploaded PDFs get a first-page thumbnail and their text extracted on a
+# pool of processes, so rendering never holds a request or the GIL; uploads
+# return with processing_status 'pending' and the resource turns 'ready' (or
+# 'failed') when its job is done. Results are cached in PREVIEW_FOLDER under
+# the file's content hash like the uploads themselves, so a PDF uploaded to
+# several circles is processed once. The text is stored on the resource and
+# indexed in resource_fts for search.
+# Needs PyMuPDF. Without it PDFs are stored as 'unavailable' rather than
+# left pending, and the sweep queues them (along with any left pending by a
+# restart) once it is installed.
+PREVIEW_FOLDER = os.path.join(app.config['UPLOAD_FOLDER'], '.previews')
+os.makedirs(PREVIEW_FOLDER, exist_ok=True)
+THUMBNAIL_NAME = re.compile(r'^([0-9a-f]{64})\.png$')
+preview_executor = None
+preview_jobs = {}  # content hash -> Future, for the PDFs this process is working on
+preview_lock = threading.Lock()
+
+def preview_paths(digest):
+    base = os.path.join(PREVIEW_FOLDER, digest)
+    return base + '.png', base + '.txt'
+
+def write_atomically(path, data):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+def render_pdf_preview(source, thumbnail_path, text_path, width, max_pages, max_chars):
+    """Write a PDF's first-page thumbnail and its text. Runs in a pool process."""
+    import pymupdf
+    with pymupdf.open(source) as document:
+        if document.needs_pass:
+            raise ValueError('PDF is encrypted')
+        if document.page_count:
+            # Scaled to `width`, but never more than twice as tall as wide
+            rect = document[0].rect
+            zoom = min(width / max(rect.width, 1), 2 * width / max(rect.height, 1))
+            pixmap = document[0].get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+            write_atomically(thumbnail_path, pixmap.tobytes('png'))
+        pages, length = [], 0
+        for page in itertools.islice(document, max_pages):
+            if length >= max_chars:
+                break
+            pages.append(page.get_text())
+            length += len(pages[-1])
+    # Written last: the text file existing means the preview is complete
+    write_atomically(text_path, '\n'.join(pages)[:max_chars].encode('utf-8', 'replace'))
+
+@functools.cache
+def pdf_previews_available():
+    available = importlib.util.find_spec('pymupdf') is not None
+    if not available:
+        app.logger.warning('PyMuPDF is not installed; uploaded PDFs get no preview until it is')
+    return available
+
+def initial_preview_status(resource_type):
+    if resource_type != 'pdf':
+        return None
+    return 'pending' if pdf_previews_available() else 'unavailable'
+
+def preview_pool():
+    global preview_executor
+    if preview_executor is None:
+        # spawn, not fork: a forked child would inherit locks held by the
+        # server's threads, and a gevent worker's patched standard library.
+        # Workers are replaced now and then in case a PDF leaks memory
+        preview_executor = ProcessPoolExecutor(app.config['PREVIEW_WORKERS'], max_tasks_per_child=100,
+                                               mp_context=multiprocessing.get_context('spawn'))
+    return preview_executor
+
+def content_hash(filename):
+    match = CONTENT_ADDRESSED_NAME.match(filename)
+    if match:
+        return match.group(1)
+    # Uploaded before storage was content-addressed
+    return file_digest(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+
+def start_preview(resource_id, filename):
+    """Queue a pending PDF for processing, or finish it now if its preview is cached."""
+    global preview_executor
+    try:
+        digest = content_hash(filename)
+    except OSError as e:
+        finish_preview(resource_id, None, e)
+        return
+    if os.path.exists(preview_paths(digest)[1]):
+        finish_preview(resource_id, digest)
+        return
+    if not pdf_previews_available():
+        return
+    
+    job = (render_pdf_preview, os.path.join(app.config['UPLOAD_FOLDER'], filename), *preview_paths(digest),
+           app.config['PREVIEW_THUMBNAIL_WIDTH'], app.config['PREVIEW_TEXT_MAX_PAGES'],
+           app.config['PREVIEW_TEXT_MAX_CHARS'])
+    with preview_lock:
+        future = preview_jobs.get(digest)
+        if future is None:
+            try:
+                future = preview_pool().submit(*job)
+            except BrokenProcessPool:
+                # A worker died (killed, or crashed on a PDF); start a fresh pool
+                preview_executor = None
+                future = preview_pool().submit(*job)
+            preview_jobs[digest] = future
+            future.add_done_callback(lambda _: preview_jobs.pop(digest, None))
+    future.add_done_callback(functools.partial(preview_done, resource_id, digest))
+
+def preview_done(resource_id, digest, future):
+    # Runs on the pool's management thread
+    with app.app_context():
+        finish_preview(resource_id, digest, future.exception())
+
+def finish_preview(resource_id, digest, error=None):
+    resource = db.session.get(Resource, resource_id)
+    if resource is None or resource.processing_status != 'pending':
+        return
+    if error is None:
+        thumbnail_path, text_path = preview_paths(digest)
+        with open(text_path, encoding='utf-8') as f:
+            resource.extracted_text = f.read()
+        resource.thumbnail = os.path.basename(thumbnail_path) if os.path.exists(thumbnail_path) else None
+        resource.processing_status = 'ready'
+    else:
+        app.logger.warning('Could not process resource %s (%s): %r', resource_id, resource.content, error)
+        resource.processing_status = 'failed'
+    db.session.commit()
+    invalidate(f'circle:{resource.circle_id}:resources')
+
+def process_pending_previews():
+    # PDFs left pending by a restart or by a server process that has not
+    # finished them in PREVIEW_RETRY_AFTER. Queues no more than the pool can
+    # start on soon
+    available = pdf_previews_available()
+    # PDFs stored while PyMuPDF was missing are queued once it is installed,
+    # and pending ones are marked 'unavailable' if it is gone
+    before, after = ('unavailable', 'pending') if available else ('pending', 'unavailable')
+    db.session.execute(db.update(Resource).where(Resource.processing_status == before).values(
+        processing_status=after
+    ).execution_options(synchronize_session=False))
+    db.session.commit()
+    capacity = 2 * app.config['PREVIEW_WORKERS'] - len(preview_jobs)
+    if capacity <= 0 or not available:
+        return
+    cutoff = datetime.utcnow() - timedelta(seconds=app.config['PREVIEW_RETRY_AFTER'])
+    pending = db.session.query(Resource.id, Resource.content).filter(
+        Resource.processing_status == 'pending', Resource.upload_date < cutoff
+    ).order_by(Resource.upload_date).limit(capacity).all()
+    for resource_id, filename in pending:
+        start_preview(resource_id, filename)
+
+# Chat streaming
+class MessageBroker:
+    """Fans each new chat message out to every stream open on its circle.
+
+    The message is serialized once per publish and handed to all subscriber
+    queues, so N listeners cost one DB write plus N queue puts. A subscriber
+    that falls a full queue behind is disconnected; its EventSource
+    reconnects with Last-Event-ID and catches up from the database.
+
+    Subscriptions live in this process. With several worker processes set
+    CHAT_BROKER=redis, so a message posted to one worker reaches the
+    streams held by the others.
+    """
+    
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+    
+    def subscribe(self, circle_id):
+        subscription = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers[circle_id].add(subscription)
+        return subscription
+    
+    def unsubscribe(self, circle_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(circle_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[circle_id]
+    
+    def subscriber_count(self, circle_id=None):
+        with self._lock:
+            if circle_id is not None:
+                return len(self._subscribers.get(circle_id, ()))
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+    
+    def publish(self, circle_id, event_id, data):
+        event = (event_id, f'id: {event_id}\ndata: {json.dumps(data)}\n\n')
+        with self._lock:
+            subscribers = list(self._subscribers.get(circle_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                self.unsubscribe(circle_id, subscription)
+                with subscription.mutex:
+                    subscription.queue.clear()
+                subscription.put_nowait(None)
+
+class RedisMessageRelay:
+    """Carries chat messages between worker processes over Redis pub/sub.
+    Every process listens on one connection and hands what arrives to its
+    own broker. Needs the redis package."""
+    
+    def __init__(self, url, broker):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._broker = broker
+    
+    def publish(self, circle_id, event_id, data):
+        self._redis.publish(f'chat:{circle_id}', json.dumps([event_id, data]))
+    
+    def listen(self):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe('chat:*')
+        try:
+            for message in pubsub.listen():
+                event_id, data = json.loads(message['data'])
+                self._broker.publish(int(message['channel'].split(b':', 1)[1]), event_id, data)
+        finally:
+            pubsub.close()
+
+broker = MessageBroker(app.config['CHAT_STREAM_QUEUE_SIZE'])
+chat_relay = RedisMessageRelay(app.config['CHAT_REDIS_URL'], broker) if app.config['CHAT_BROKER'] == 'redis' else None
+
+def publish_message(message):
+    data = serialize_message(message)
+    if chat_relay is not None:
+        chat_relay.publish(message.circle_id, message.id, data)
+    else:
+        broker.publish(message.circle_id, message.id, data)
+
+def serialize_message(message):
+    return {
+        'id': message.id,
+        'text': message.text,
+        'user_id': message.user_id,
+        'username': message.user.username,
+        'timestamp': message.timestamp.isoformat()
+    }
+
+def sse_stream(circle_id, subscription, backlog, heartbeat):
+    """Yield SSE frames: the backlog first, then live messages until the
+    client goes away or is dropped for falling behind."""
+    last_id = 0
+    try:
+        yield 'retry: 3000\n\n'
+        for data in backlog:
+            last_id = data['id']
+            yield f'id: {last_id}\ndata: {json.dumps(data)}\n\n'
+        while True:
+            try:
+                event = subscription.get(timeout=heartbeat)
+            except queue.Empty:
+                # Comment frame keeps proxies open and surfaces dead clients
+                yield ': keepalive\n\n'
+                continue
+            if event is None:
+                return
+            event_id, frame = event
+            if event_id > last_id:
+                last_id = event_id
+                yield frame
+    finally:
+        broker.unsubscribe(circle_id, subscription)
+
+# Response caching
+# Cached responses live under a namespace per entity ('circle:7',
+# 'circle:7:resources', 'user:3', 'circles'). Writes invalidate a namespace
+# by bumping its version, which is part of every key, so stale entries are
+# never read again and simply age out. This works the same on a shared
+# backend, where deleting every key for a circle would need a scan.
+class MemoryCache:
+    """In-process LRU with per-entry TTL. Only invalidates this process;
+    use the redis backend when running several worker processes."""
+    
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._versions = {}
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def version(self, namespace):
+        # Versions are kept outside the LRU: evicting one would let stale
+        # entries under an old version come back
+        return self._versions.get(namespace, 0)
+    
+    def bump(self, namespace):
+        with self._lock:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+
+class RedisCache:
+    """Shared backend so every worker process sees the same entries and
+    invalidations. Needs the redis package."""
+    
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+    
+    def get(self, key):
+        value = self._redis.get('cache:' + key)
+        return pickle.loads(value) if value is not None else None
+    
+    def set(self, key, value, ttl):
+        self._redis.set('cache:' + key, pickle.dumps(value), ex=ttl)
+    
+    def version(self, namespace):
+        return int(self._redis.get('version:' + namespace) or 0)
+    
+    def bump(self, namespace):
+        self._redis.incr('version:' + namespace)
+
+if app.config['CACHE_BACKEND'] == 'redis':
+    response_cache = RedisCache(app.config['CACHE_REDIS_URL'])
+else:
+    response_cache = MemoryCache(app.config['CACHE_MAX_ENTRIES'])
+
+cache_stats = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+def invalidate(*namespaces):
+    # Call after commit, so a reader can't cache pre-commit data under the new version
+    for namespace in namespaces:
+        response_cache.bump(namespace)
+
+def invalidate_membership(circle, user_id):
+    # Member counts show on the circle, the circle list and the creator's
+    # profile; followed circles show on the member's profile
+    invalidate(f'circle:{circle.id}', 'circles', f'user:{user_id}', f'user:{circle.creator_id}')
+    mark_recommendations_stale(circle.id)
+
+def cached(namespace, bypass=None):
+    """Serve a GET handler's 200 responses from response_cache.
+
+    `namespace` maps the view arguments to the entity namespace the response
+    depends on. Every response gets an ETag so clients can revalidate with
+    If-None-Match and get a 304.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            if request.method != 'GET' or (bypass and bypass()):
+                return view(**kwargs)
+            
+            name = namespace(**kwargs)
+            key = f'{view.__name__}:{name}:{response_cache.version(name)}:{request.query_string.decode()}'
+            entry = response_cache.get(key)
+            if entry is None:
+                cache_stats[view.__name__]['misses'] += 1
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                headers = [(header, value) for header, value in response.headers if header.startswith('X-')]
+                entry = (body, hashlib.sha1(body).hexdigest(), headers)
+                response_cache.set(key, entry, app.config['CACHE_TTL'])
+            else:
+                cache_stats[view.__name__]['hits'] += 1
+            
+            body, etag, headers = entry
+            response = Response(body, mimetype='application/json', headers=headers)
+            response.set_etag(etag)
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+# Full-text search
+# circle_fts is an external-content FTS5 index over circle(title, tags,
+# description), and resource_fts one over resource(title, extracted_text).
+# The triggers keep them in sync with every insert, update and delete, so
+# routes never have to touch them directly. resource_fts only reindexes a
+# row when its title or text changes, not on every view count flush.
+CIRCLE_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS circle_fts USING fts5(
+        title, tags, description, content='circle', content_rowid='id'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS circle_fts_ai AFTER INSERT ON circle BEGIN
+        INSERT INTO circle_fts(rowid, title, tags, description)
+        VALUES (new.id, new.title, new.tags, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS circle_fts_ad AFTER DELETE ON circle BEGIN
+        INSERT INTO circle_fts(circle_fts, rowid, title, tags, description)
+        VALUES ('delete', old.id, old.title, old.tags, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS circle_fts_au AFTER UPDATE OF title, tags, description ON circle BEGIN
+        INSERT INTO circle_fts(circle_fts, rowid, title, tags, description)
+        VALUES ('delete', old.id, old.title, old.tags, old.description);
+        INSERT INTO circle_fts(rowid, title, tags, description)
+        VALUES (new.id, new.title, new.tags, new.description);
+    END""",
+]
+
+RESOURCE_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS resource_fts USING fts5(
+        title, extracted_text, content='resource', content_rowid='id'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS resource_fts_ai AFTER INSERT ON resource BEGIN
+        INSERT INTO resource_fts(rowid, title, extracted_text)
+        VALUES (new.id, new.title, new.extracted_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS resource_fts_ad AFTER DELETE ON resource BEGIN
+        INSERT INTO resource_fts(resource_fts, rowid, title, extracted_text)
+        VALUES ('delete', old.id, old.title, old.extracted_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS resource_fts_au AFTER UPDATE OF title, extracted_text ON resource BEGIN
+        INSERT INTO resource_fts(resource_fts, rowid, title, extracted_text)
+        VALUES ('delete', old.id, old.title, old.extracted_text);
+        INSERT INTO resource_fts(rowid, title, extracted_text)
+        VALUES (new.id, new.title, new.extracted_text);
+    END""",
+]
+
+SEARCH_INDEXES = {'circle_fts': CIRCLE_FTS_DDL, 'resource_fts': RESOURCE_FTS_DDL}
+
+# bm25 column weights: title, tags, description
+CIRCLE_FTS_WEIGHTS = (10.0, 5.0, 1.0)
+# and title, extracted_text
+RESOURCE_FTS_WEIGHTS = (10.0, 1.0)
+
+circle_fts = db.table('circle_fts', db.column('rowid'))
+resource_fts = db.table('resource_fts', db.column('rowid'))
+
+def fts_enabled():
+    return db.engine.dialect.name == 'sqlite'
+
+def init_search_index():
+    if not fts_enabled():
+        return
+    with db.engine.begin() as conn:
+        for name, statements in SEARCH_INDEXES.items():
+            exists = conn.execute(db.text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+            ).bindparams(name=name)).first()
+            for statement in statements:
+                conn.execute(db.text(statement))
+            if not exists:
+                # Index rows that were created before the index existed
+                conn.execute(db.text(f"INSERT INTO {name}({name}) VALUES ('rebuild')"))
+
+def build_fts_query(search=''):
+    """Turn user input into an FTS5 MATCH expression.
+
+    Every word in `search` becomes a prefix term, so "pyth" finds "Python".
+    """
+    return ' '.join('"%s"*' % word for word in re.findall(r'\w+', search))
+
+# Tags
+# Circle.tags keeps the comma-separated string clients send and display.
+# Every tag is also a Tag row linked to its circles through circle_tag, so a
+# tag filter is an index lookup on the whole name ("java" never matches
+# "javascript"). Tag.circle_count counts public circles and is maintained
+# like the other denormalized counters; 'flask rebuild-tags' rebuilds it all
+# from Circle.tags.
+TAG_MAX_LENGTH = 50
+
+def normalize_tags(value):
+    """Split a comma-separated string into unique tag names, in order.
+    
+    Names are lower-cased with runs of whitespace collapsed, so "Machine
+    Learning" and "machine  learning" are the same tag.
+    """
+    names = []
+    for tag in (value or '').split(','):
+        name = ' '.join(tag.lower().split())[:TAG_MAX_LENGTH]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+def set_circle_tags(circle, names):
+    """Link a new (flushed) circle to tag `names`, creating missing tags."""
+    if not names:
+        return
+    db.session.execute(insert_ignoring_duplicates(Tag), [{'name': name} for name in names])
+    tag_ids = [tag_id for (tag_id,) in db.session.query(Tag.id).filter(Tag.name.in_(names))]
+    db.session.execute(db.insert(CircleTag), [{'circle_id': circle.id, 'tag_id': tag_id} for tag_id in tag_ids])
+    if circle.privacy == 'public':
+        db.session.execute(db.update(Tag).where(Tag.id.in_(tag_ids)).values(
+            circle_count=Tag.circle_count + 1
+        ).execution_options(synchronize_session=False))
+
+def with_tags(query, tags):
+    """Restrict a Circle query to circles that have every tag in `tags`."""
+    for name in tags:
+        tagged = db.select(CircleTag.circle_id).join(Tag, Tag.id == CircleTag.tag_id).where(Tag.name == name)
+        query = query.filter(Circle.id.in_(tagged))
+    return query
+
+def prefix_range(column, prefix):
+    # A range over the index instead of LIKE 'prefix%', which SQLite only
+    # runs off an index under case_sensitive_like
+    return db.and_(column >= prefix, column < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+def rebuild_tags():
+    """Recreate every Tag and circle_tag row from Circle.tags; returns the tag count."""
+    links, counts = [], defaultdict(int)
+    for circle_id, tags, privacy in db.session.query(Circle.id, Circle.tags, Circle.privacy).yield_per(10000):
+        for name in normalize_tags(tags):
+            links.append((circle_id, name))
+            counts[name] += privacy == 'public'
+    db.session.execute(db.delete(CircleTag))
+    db.session.execute(db.delete(Tag))
+    tag_ids = {}
+    if counts:
+        tag_ids = dict(db.session.execute(
+            db.insert(Tag).returning(Tag.name, Tag.id, sort_by_parameter_order=True),
+            [{'name': name, 'circle_count': count} for name, count in counts.items()]
+        ).all())
+        db.session.execute(db.insert(CircleTag), [{'circle_id': circle_id, 'tag_id': tag_ids[name]}
+                                                  for circle_id, name in links])
+    db.session.commit()
+    invalidate('tags')
+    return len(tag_ids)
+
+@app.cli.command('rebuild-tags')
+def rebuild_tags_command():
+    """Rebuild tags, circle_tag links and tag counts from Circle.tags."""
+    print(f'Rebuilt {rebuild_tags()} tags')
+
+# Recommendations
+# Circles are compared as two sparse vectors: their tags, weighted by idf so
+# a rare tag says more than a common one, and the users who joined or follow
+# them. Similarity mixes the two cosines by RECOMMENDATION_TAG_WEIGHT. Each
+# circle's nearest neighbours are stored in circle_similarity, so
+# recommending is one indexed lookup that sums the neighbour scores of the
+# user's circles. 'flask rebuild-recommendations' recomputes every circle;
+# in between, circles whose tags or members change are queued here and
+# refreshed by a background job.
+stale_circles = set()
+stale_circles_lock = threading.Lock()
+
+def mark_recommendations_stale(*circle_ids):
+    with stale_circles_lock:
+        stale_circles.update(circle_ids)
+
+class SimilarityIndex:
+    """Sparse circle vectors to compute circle_similarity rows from.
+    
+    Without circle_ids every circle is loaded. With them, only what their
+    neighbours() need: their tags, every circle sharing one of those tags
+    (found through ix_circle_tag_tag_id) with all of its tags, and every
+    circle sharing one of their members. idf comes from the stored
+    Tag.circle_count and a user vector's length from the member and
+    follower counters, so neither needs a full scan.
+    """
+    
+    def __init__(self, circle_ids=None):
+        self.tags = defaultdict(set)
+        self.circles_by_tag = defaultdict(list)
+        self.users = defaultdict(set)
+        self.circles_of = defaultdict(list)
+        self.interest, self.public = {}, set()
         
-        # Update reputation level
-        if user.points >= 1000:
-            user.reputation_level = 5
-        elif user.points >= 500:
-            user.reputation_level = 4
-        elif user.points >= 200:
-            user.reputation_level = 3
-        elif user.points >= 50:
-            user.reputation_level = 2
+        links = db.session.query(CircleTag.circle_id, CircleTag.tag_id)
+        memberships = db.session.query(CircleMember.user_id, CircleMember.circle_id)
+        circles = db.session.query(Circle.id, Circle.privacy, Circle.member_count, Circle.follower_count)
+        tags = db.session.query(Tag.id, Tag.circle_count)
+        if circle_ids is not None:
+            shared_tags = db.select(CircleTag.tag_id).where(CircleTag.circle_id.in_(circle_ids))
+            tag_neighbours = db.select(CircleTag.circle_id).where(CircleTag.tag_id.in_(shared_tags))
+            members = db.select(CircleMember.user_id).where(CircleMember.circle_id.in_(circle_ids))
+            member_neighbours = db.select(CircleMember.circle_id).where(CircleMember.user_id.in_(members))
+            links = links.filter(CircleTag.circle_id.in_(tag_neighbours))
+            memberships = memberships.filter(CircleMember.user_id.in_(members))
+            circles = circles.filter(db.or_(Circle.id.in_(circle_ids), Circle.id.in_(tag_neighbours),
+                                            Circle.id.in_(member_neighbours)))
+            tags = tags.filter(Tag.id.in_(db.select(CircleTag.tag_id).where(CircleTag.circle_id.in_(tag_neighbours))))
         
+        for circle_id, tag_id in links.yield_per(10000):
+            self.tags[circle_id].add(tag_id)
+            self.circles_by_tag[tag_id].append(circle_id)
+        for user_id, circle_id in memberships.yield_per(10000):
+            self.users[circle_id].add(user_id)
+            self.circles_of[user_id].append(circle_id)
+        for circle_id, privacy, member_count, follower_count in circles.yield_per(10000):
+            self.interest[circle_id] = member_count + follower_count
+            if privacy == 'public':
+                self.public.add(circle_id)
+        public_count = db.session.scalar(db.select(db.func.count()).select_from(Circle).where(Circle.privacy == 'public'))
+        # Tag.circle_count only counts public circles; a tag on private circles alone counts as one
+        self.idf = {tag_id: 1 + math.log(max(public_count, 1) / max(count, 1)) for tag_id, count in tags}
+        self.norms = {circle_id: math.sqrt(sum(self.idf[tag] ** 2 for tag in tag_ids))
+                      for circle_id, tag_ids in self.tags.items()}
+    
+    def neighbours(self, circle_id, limit):
+        """The `limit` most similar public circles as [(circle_id, score)]."""
+        tag_weight = app.config['RECOMMENDATION_TAG_WEIGHT']
+        scores = defaultdict(float)
+        norm = self.norms.get(circle_id)
+        if norm:
+            for tag in self.tags[circle_id]:
+                shared = tag_weight * self.idf[tag] ** 2 / norm
+                for other in self.circles_by_tag[tag]:
+                    scores[other] += shared / self.norms[other]
+        users = self.users.get(circle_id)
+        if users:
+            shared = defaultdict(int)
+            for user_id in users:
+                for other in self.circles_of[user_id]:
+                    shared[other] += 1
+            for other, count in shared.items():
+                # The counters can lag the rows by a refresh; never score above 1
+                length = max(self.interest.get(other, 0), count)
+                scores[other] += (1 - tag_weight) * count / math.sqrt(len(users) * length)
+        scores.pop(circle_id, None)
+        return heapq.nlargest(limit, ((other, score) for other, score in scores.items() if other in self.public),
+                              key=lambda item: item[1])
+
+def store_neighbours(index, circle_ids):
+    limit = app.config['RECOMMENDATION_NEIGHBORS']
+    rows = [{'circle_id': circle_id, 'similar_circle_id': other, 'score': score}
+            for circle_id in circle_ids for other, score in index.neighbours(circle_id, limit)]
+    if rows:
+        db.session.execute(db.insert(CircleSimilarity), rows)
+    return len(rows)
+
+def refresh_recommendations():
+    """Recompute the neighbours of circles whose tags or members changed.
+    
+    Only the changed circles' own lists are rewritten; other circles pick
+    up their changed similarity to these at their next refresh or rebuild.
+    """
+    with stale_circles_lock:
+        circle_ids = set(stale_circles)
+        stale_circles.clear()
+    if not circle_ids:
+        return 0
+    try:
+        index = SimilarityIndex(circle_ids)
+        # Drop circles deleted since they were queued
+        circle_ids &= index.interest.keys()
+        db.session.execute(db.delete(CircleSimilarity).where(CircleSimilarity.circle_id.in_(circle_ids)))
+        store_neighbours(index, circle_ids)
         db.session.commit()
+    except Exception:
+        db.session.rollback()
+        mark_recommendations_stale(*circle_ids)
+        raise
+    return len(circle_ids)
+
+def rebuild_recommendations():
+    """Recompute circle_similarity for every circle; returns the row count."""
+    index = SimilarityIndex()
+    db.session.execute(db.delete(CircleSimilarity))
+    count = store_neighbours(index, index.interest)
+    db.session.commit()
+    return count
+
+@app.cli.command('rebuild-recommendations')
+def rebuild_recommendations_command():
+    """Recompute every circle's similar circles for recommendations."""
+    print(f'Stored {rebuild_recommendations()} circle similarities')
+
+def recommended_circles(user_id, limit):
+    """Public circles for `user_id`, best first, as [(circle, score)].
+    
+    Circles similar to the ones the user joined, follows or created come
+    first. Users without any (or with few matches) are topped up with the
+    most joined circles.
+    """
+    own = db.union(
+        db.select(CircleMember.circle_id).where(CircleMember.user_id == user_id),
+        db.select(Circle.id).where(Circle.creator_id == user_id)
+    )
+    score = db.func.sum(CircleSimilarity.score).label('score')
+    ranked = db.session.query(CircleSimilarity.similar_circle_id, score).filter(
+        CircleSimilarity.circle_id.in_(own), CircleSimilarity.similar_circle_id.not_in(own)
+    ).group_by(CircleSimilarity.similar_circle_id).order_by(score.desc()).limit(limit).all()
+    scores = dict(ranked)
+    circles = circles_with_creator().filter(Circle.id.in_(scores), Circle.privacy == 'public').all()
+    circles.sort(key=lambda circle: scores[circle.id], reverse=True)
+    
+    if len(circles) < limit:
+        popular = circles_with_creator().filter(
+            Circle.privacy == 'public', Circle.id.not_in(own), Circle.id.not_in(scores)
+        ).order_by(Circle.member_count.desc(), Circle.id.desc()).limit(limit - len(circles)).all()
+        circles += popular
+    return [(circle, scores.get(circle.id, 0.0)) for circle in circles]
+
+# Authentication
+# Login returns a session token: the user's id, username and role signed
+# with SECRET_KEY (HMAC-SHA256), so checking one needs neither the database
+# nor a session store. Verified tokens are kept in a small LRU until they
+# expire, which also skips the signature check on repeat requests.
+# Password hashes run on a bounded thread pool. hashlib releases the GIL
+# while hashing, so request threads keep serving other routes, and the
+# bound stops a login burst from taking every core.
+if not app.config['SECRET_KEY']:
+    app.config['SECRET_KEY'] = os.urandom(32)
+    app.logger.warning('SECRET_KEY is not set; session tokens will not survive a restart '
+                       'or be accepted by other worker processes')
+
+session_tokens = URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='session')
+identity_cache = MemoryCache(app.config['IDENTITY_CACHE_SIZE'])
+def os_thread_pool(workers, name):
+    # Under gevent (see gunicorn.conf.py) the threading module is patched and
+    # a ThreadPoolExecutor would hash on the event loop, stalling every
+    # request in the worker; gevent's own pool uses real threads
+    monkey = sys.modules.get('gevent.monkey')
+    if monkey is not None and monkey.is_module_patched('threading'):
+        from gevent.threadpool import ThreadPoolExecutor as GeventThreadPoolExecutor
+        return GeventThreadPoolExecutor(workers)
+    return ThreadPoolExecutor(workers, thread_name_prefix=name)
+
+password_pool = os_thread_pool(app.config['PASSWORD_HASH_WORKERS'], 'password-hash')
+password_slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_QUEUE_LIMIT'])
+
+def error_response(message, status, headers=None):
+    return make_response(jsonify({'error': message}), status, headers or {})
+
+def issue_session_token(user):
+    return session_tokens.dumps({'id': user.id, 'username': user.username, 'role': user.role})
+
+def current_identity():
+    """The user the request's session token belongs to, or None without one.
+    
+    An invalid or expired token is rejected with 401 rather than ignored.
+    """
+    if 'identity' in g:
+        return g.identity
+    identity = None
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme == 'Bearer' and token:
+        identity = identity_cache.get(token)
+        if identity is None:
+            try:
+                identity, issued = session_tokens.loads(token, max_age=app.config['SESSION_TOKEN_TTL'],
+                                                        return_timestamp=True)
+            except BadSignature:
+                abort(error_response('Invalid or expired session token', 401))
+            age = (datetime.now(timezone.utc) - issued).total_seconds()
+            identity_cache.set(token, identity, app.config['SESSION_TOKEN_TTL'] - age)
+    g.identity = identity
+    return identity
+
+def acting_user_id(claimed=None):
+    """The id of the user a request acts for.
+    
+    With a session token that is the token's user, and a `claimed` id from
+    the body or query that names someone else is refused. Without one,
+    `claimed` is trusted as before unless REQUIRE_SESSION_TOKEN is set.
+    """
+    identity = current_identity()
+    if identity is None:
+        if app.config['REQUIRE_SESSION_TOKEN']:
+            abort(error_response('Login required', 401))
+        return claimed
+    if claimed is not None and str(claimed) != str(identity['id']):
+        abort(error_response('user_id does not match the session', 403))
+    return identity['id']
+
+def run_password_job(fn, *args):
+    if not password_slots.acquire(blocking=False):
+        abort(error_response('Too many logins in progress, try again shortly', 503, {'Retry-After': '1'}))
+    try:
+        return password_pool.submit(fn, *args).result()
+    finally:
+        password_slots.release()
+
+def hash_password(password):
+    return run_password_job(generate_password_hash, password, app.config['PASSWORD_HASH_METHOD'])
+
+def verify_and_rehash(stored, password, method):
+    # Returns (matches, new hash when the stored one uses another method or cost)
+    if not check_password_hash(stored, password):
+        return False, None
+    if stored.split('$', 1)[0] != method:
+        return True, generate_password_hash(password, method)
+    return True, None
+
+def verify_password(user, password):
+    matches, rehashed = run_password_job(verify_and_rehash, user.password, password,
+                                         app.config['PASSWORD_HASH_METHOD'])
+    if rehashed:
+        user.password = rehashed
+        db.session.commit()
+    return matches
+
+# Bulk import and export
+# Imports take a JSON array or NDJSON (one object per line). Every item is
+# validated first; the valid ones are inserted with one executemany in a
+# single transaction and the rest are reported by index. Exports stream
+# NDJSON straight from the cursor, so a circle of any size uses constant memory.
+RESOURCE_TYPES = ('pdf', 'link', 'video')
+
+def parse_due_date(value):
+    # Handle both formats: with 'T' or with space
+    if 'T' in value:
+        return datetime.fromisoformat(value)
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+
+def read_bulk_items():
+    """Return a list of (item, error) pairs from the request body."""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        items = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append((json.loads(line), None))
+            except ValueError:
+                items.append((None, 'Invalid JSON'))
+        return items
+    
+    data = request.get_json(silent=True)
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array or NDJSON body')
+    return [(item, None) for item in data]
+
+def require_text(item, field, max_length):
+    value = item.get(field)
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f'{field} is required')
+    if len(value) > max_length:
+        raise ValueError(f'{field} is longer than {max_length} characters')
+    return value
+
+def resource_row(item, circle_id):
+    resource_type = item.get('resource_type')
+    if resource_type not in RESOURCE_TYPES:
+        raise ValueError('resource_type must be one of ' + ', '.join(RESOURCE_TYPES))
+    creator_id = item.get('creator_id')
+    if not isinstance(creator_id, int):
+        raise ValueError('creator_id is required')
+    return {
+        'title': require_text(item, 'title', 200),
+        'resource_type': resource_type,
+        'content': require_text(item, 'content', 10000),
+        'creator_id': creator_id,
+        'circle_id': circle_id,
+    }
+
+def task_row(item, circle_id):
+    due_date = item.get('due_date')
+    if not isinstance(due_date, str):
+        raise ValueError('due_date is required')
+    description = item.get('description')
+    if not isinstance(description, str):
+        raise ValueError('description is required')
+    return {
+        'title': require_text(item, 'title', 200),
+        'description': description,
+        'due_date': parse_due_date(due_date),
+        'circle_id': circle_id,
+    }
+
+def bulk_insert(model, circle_id, build_row):
+    """Validate the request items with build_row and insert the valid ones.
+    
+    Returns (created, errors): created pairs each item index with its new id.
+    """
+    items = read_bulk_items()
+    if len(items) > app.config['BULK_IMPORT_MAX_ITEMS']:
+        raise ValueError(f"At most {app.config['BULK_IMPORT_MAX_ITEMS']} items per request")
+    
+    valid, errors = [], []
+    for index, (item, error) in enumerate(items):
+        if error is None and not isinstance(item, dict):
+            error = 'Expected an object'
+        if error is None:
+            try:
+                valid.append((index, build_row(item, circle_id)))
+                continue
+            except ValueError as e:
+                error = str(e)
+        errors.append({'index': index, 'error': error})
+    
+    # Check creators in one query instead of letting one bad id fail the batch
+    creator_ids = {row['creator_id'] for _, row in valid if 'creator_id' in row}
+    if creator_ids:
+        known = set(db.session.scalars(db.select(User.id).where(User.id.in_(creator_ids))))
+        for index, row in valid:
+            if 'creator_id' in row and row['creator_id'] not in known:
+                errors.append({'index': index, 'error': 'Unknown creator_id'})
+        valid = [(index, row) for index, row in valid
+                 if 'creator_id' not in row or row['creator_id'] in known]
+    
+    created = []
+    if valid:
+        ids = db.session.scalars(
+            db.insert(model).returning(model.id, sort_by_parameter_order=True),
+            [row for _, row in valid]
+        ).all()
+        db.session.commit()
+        created = [{'index': index, 'id': id} for (index, _), id in zip(valid, ids)]
+    errors.sort(key=lambda e: e['index'])
+    return created, errors
+
+def bulk_response(created, errors):
+    # 201 when anything was inserted; the caller retries only the reported items
+    status = 201 if created else 400
+    return jsonify({'created': created, 'errors': errors}), status
+
+def export_lines(circle):
+    yield json.dumps({'type': 'circle', **serialize_circle(circle)}) + '\n'
+    
+    queries = [
+        ('resource', db.select(
+            Resource.id, Resource.title, Resource.resource_type, Resource.content,
+            Resource.creator_id, Resource.upload_date, Resource.view_count
+        ).where(Resource.circle_id == circle.id).order_by(Resource.id)),
+        ('task', db.select(
+            Task.id, Task.title, Task.description, Task.due_date, Task.created_at
+        ).where(Task.circle_id == circle.id).order_by(Task.id)),
+        ('message', db.select(
+            Message.id, Message.text, Message.user_id, Message.timestamp
+        ).where(Message.circle_id == circle.id).order_by(Message.id)),
+    ]
+    for kind, query in queries:
+        # yield_per streams from the cursor (a server-side cursor on PostgreSQL)
+        rows = db.session.execute(query.execution_options(yield_per=app.config['EXPORT_BATCH_SIZE']))
+        for row in rows:
+            record = {'type': kind}
+            for key, value in row._mapping.items():
+                record[key] = value.isoformat() if isinstance(value, datetime) else value
+            yield json.dumps(record) + '\n'
+
+# Request metrics
+# Every request records its latency, SQL statement count and time spent in
+# SQL, labelled by endpoint. GET /metrics serves them in the Prometheus text
+# format. Numbers are per process, so with several server workers each one
+# has to be scraped (or the counts are for whichever worker answered).
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+    
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] += amount
+    
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f'{self.name}{format_labels(labels)} {value!r}'
+
+class Histogram:
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        # labels -> [count per bucket..., count above the last bucket, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+    
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            snapshot = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                yield f'{self.name}_bucket{format_labels(labels + (("le", bound),))} {cumulative}'
+            yield f'{self.name}_sum{format_labels(labels)} {series[-1]!r}'
+            yield f'{self.name}_count{format_labels(labels)} {cumulative}'
+
+request_duration = Histogram('learncircle_request_duration_seconds',
+                             'Time from the start of a request to its response', LATENCY_BUCKETS)
+request_db_time = Histogram('learncircle_request_db_seconds',
+                            'Time spent executing SQL per request', LATENCY_BUCKETS)
+request_statements = Histogram('learncircle_request_sql_statements',
+                               'SQL statements executed per request', STATEMENT_BUCKETS)
+requests_total = Counter('learncircle_requests_total', 'Requests handled, by status')
+slow_queries_total = Counter('learncircle_slow_queries_total', 'SQL statements slower than SLOW_QUERY_THRESHOLD')
+METRICS = (request_duration, request_db_time, request_statements, requests_total, slow_queries_total)
+
+def current_endpoint():
+    return (request.endpoint or 'unmatched') if has_request_context() else 'background'
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info['statement_start'] = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_statement(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop('statement_start', time.perf_counter())
+    sql = g.get('sql') if has_request_context() else None
+    if sql is not None:
+        sql[0] += 1
+        sql[1] += elapsed
+    if elapsed >= app.config['SLOW_QUERY_THRESHOLD']:
+        endpoint = current_endpoint()
+        slow_queries_total.inc((('endpoint', endpoint),))
+        app.logger.warning('Slow query in %s (%.1f ms%s): %s', endpoint, elapsed * 1000,
+                           ', executemany' if executemany else '', ' '.join(statement.split()))
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    g.sql = [0, 0.0]  # statements, seconds
+    profiler.enter(request.endpoint)
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get('request_start')
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    statements, db_time = g.sql
+    labels = (('endpoint', request.endpoint or 'unmatched'), ('method', request.method))
+    request_duration.observe(labels, elapsed)
+    request_db_time.observe(labels, db_time)
+    request_statements.observe(labels, statements)
+    requests_total.inc(labels + (('status', response.status_code),))
+    # Shows the split in the browser's network panel
+    response.headers['Server-Timing'] = 'app;dur=%.1f, db;dur=%.1f' % (elapsed * 1000, db_time * 1000)
+    return response
+
+@app.teardown_request
+def stop_request_profiling(exc):
+    profiler.exit()
+
+def render_metrics():
+    lines = [line for metric in METRICS for line in metric.render()]
+    # The response cache keeps its own counts, also served by /api/cache/stats
+    lines.append('# HELP learncircle_cache_lookups_total Response cache lookups')
+    lines.append('# TYPE learncircle_cache_lookups_total counter')
+    for endpoint, stats in sorted(cache_stats.items()):
+        for result, count in (('hit', stats['hits']), ('miss', stats['misses'])):
+            labels = (('endpoint', endpoint), ('result', result))
+            lines.append(f'learncircle_cache_lookups_total{format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+# Sampling profiler
+# Off unless PROFILER_ENABLED is set, and then idle until switched on through
+# POST /api/profiler. While running, a thread samples the stacks of the
+# threads serving the chosen endpoints every PROFILER_INTERVAL seconds.
+# GET /api/profiler returns the samples in the folded format that
+# flamegraph.pl, speedscope and inferno read.
+# Under gevent (see gunicorn.conf.py) requests run in greenlets, which
+# sys._current_frames() does not know about, and a patched thread would
+# only sample when a request yields. So the sampler runs on a real thread
+# and reads a switched-out greenlet's stack from its gr_frame, and the
+# running one's from the worker's OS thread.
+class SamplingProfiler:
+    def __init__(self):
+        self.running = False
+        self.endpoints = set()
+        self.interval = None
+        self.samples = 0
+        self._active = {}  # thread id or greenlet -> (endpoint, OS thread id) for profiled requests in flight
+        self._stacks = defaultdict(int)
+        monkey = sys.modules.get('gevent.monkey')
+        if monkey is not None and monkey.is_module_patched('threading'):
+            import greenlet
+            self._current = greenlet.getcurrent
+            self._os_thread_id = monkey.get_original('threading', 'get_ident')
+            self._start_thread = monkey.get_original('_thread', 'start_new_thread')
+            self._sleep = monkey.get_original('time', 'sleep')
+            self._lock = monkey.get_original('_thread', 'allocate_lock')()
+        else:
+            self._current = self._os_thread_id = threading.get_ident
+            self._start_thread = lambda target, args: threading.Thread(target=target, args=args, name='profiler',
+                                                                       daemon=True).start()
+            self._sleep = time.sleep
+            self._lock = threading.Lock()
+    
+    def enter(self, endpoint):
+        if self.running and (not self.endpoints or endpoint in self.endpoints):
+            self._active[self._current()] = (endpoint or 'unmatched', self._os_thread_id())
+    
+    def exit(self):
+        self._active.pop(self._current(), None)
+    
+    def start(self, endpoints=(), interval=None):
+        with self._lock:
+            self.endpoints = set(endpoints)
+            self.interval = interval or app.config['PROFILER_INTERVAL']
+            self._stacks.clear()
+            self.samples = 0
+            if not self.running:
+                self.running = True
+                self._start_thread(self._sample, ())
+    
+    def stop(self):
+        self.running = False
+        self._active.clear()
+    
+    def folded(self):
+        with self._lock:
+            return ''.join(f'{stack} {count}\n' for stack, count in sorted(self._stacks.items()))
+    
+    def _sample(self):
+        while self.running:
+            frames = sys._current_frames()
+            with self._lock:
+                for task, (endpoint, thread_id) in list(self._active.items()):
+                    # gr_frame is None while the greenlet runs, and plain threads have none
+                    frame = getattr(task, 'gr_frame', None) or frames.get(thread_id)
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                        frame = frame.f_back
+                    if stack:
+                        self._stacks[';'.join([endpoint] + stack[::-1])] += 1
+                        self.samples += 1
+            self._sleep(self.interval)
+
+profiler = SamplingProfiler()
+
+# Response encoding
+# jsonify() goes through orjson when it is installed, which encodes the big
+# list responses several times faster than the json module. JSON and text
+# bodies of COMPRESS_MIN_SIZE or more are compressed with brotli (when the
+# brotli package is installed) or gzip, whichever the client prefers.
+# Responses from cached() have an ETag of their uncompressed body, so their
+# compressed bodies are kept under it and a cache hit compresses nothing.
+# Registered after the request metrics hook, so it runs first and its time
+# counts towards the request.
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask's JSON provider with orjson doing the work. Needs the orjson
+    package. Keys keep their insertion order rather than being sorted."""
+    
+    def __init__(self, app):
+        import orjson
+        super().__init__(app)
+        self._orjson = orjson
+    
+    def _encode(self, obj):
+        option = self._orjson.OPT_NON_STR_KEYS
+        if self.compact is False or (self.compact is None and self._app.debug):
+            option |= self._orjson.OPT_INDENT_2
+        return self._orjson.dumps(obj, default=self.default, option=option)
+    
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # json.dumps arguments orjson has no equivalent for
+            return super().dumps(obj, **kwargs)
+        return self._encode(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return self._orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        return self._app.response_class(self._encode(self._prepare_response_obj(args, kwargs)),
+                                        mimetype=self.mimetype)
+
+if app.config['JSON_SERIALIZER'] == 'orjson':
+    app.json = OrjsonProvider(app)
+
+compressed_bodies = MemoryCache(app.config['COMPRESS_CACHE_SIZE'])
+
+def compress(data, encoding):
+    if encoding == 'br':
+        import brotli
+        return brotli.compress(data, quality=app.config['COMPRESS_BROTLI_QUALITY'])
+    # mtime=0 so the same body always compresses to the same bytes
+    return gzip.compress(data, compresslevel=app.config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+@app.after_request
+def compress_response(response):
+    # Files and streams go out as they are: uploads are mostly PDFs, and
+    # chat streams and exports have to flush as they go
+    if (response.mimetype not in app.config['COMPRESS_MIMETYPES'] or response.direct_passthrough
+            or response.is_streamed):
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+    encoding = request.accept_encodings.best_match(app.config['COMPRESS_ENCODINGS'])
+    body = response.get_data()
+    if encoding is None or len(body) < app.config['COMPRESS_MIN_SIZE']:
+        return response
+    
+    etag, weak = response.get_etag()
+    key = f'{etag}:{encoding}' if etag and not weak else None
+    compressed = compressed_bodies.get(key) if key else None
+    if compressed is None:
+        compressed = compress(body, encoding)
+        if key:
+            compressed_bodies.set(key, compressed, app.config['CACHE_TTL'])
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    if etag:
+        # Another representation of the same content; If-None-Match still
+        # matches it, since it compares weakly
+        response.set_etag(etag, weak=True)
+    return response
+
+def send_page(filename):
+    # Sent from memory rather than as a file: send_from_directory's
+    # passthrough body is skipped by compress_response, and the page is
+    # plain text that compresses to a fraction of its size
+    path = os.path.join(app.root_path, filename)
+    with open(path, 'rb') as f:
+        body = f.read()
+    response = Response(body, mimetype='text/html')
+    response.set_etag(hashlib.sha1(body).hexdigest())
+    response.last_modified = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 # API Routes
 @app.route('/')
 def index():
-    return send_from_directory('.', 'index.html')
+    return send_page('index.html')
 
 @app.route('/index.html')
 def index_html():
-    return send_from_directory('.', 'index.html')
+    return send_page('index.html')
 
 @app.route('/api/register', methods=['POST'])
 def register():
@@ -149,7 +2443,7 @@ def register():
     if User.query.filter_by(email=data['email']).first():
         return jsonify({'error': 'Email already exists'}), 400
     
-    hashed_password = generate_password_hash(data['password'])
+    hashed_password = hash_password(data['password'])
     user = User(
         username=data['username'],
         email=data['email'],
@@ -172,32 +2466,40 @@ def login():
     data = request.json
     user = User.query.filter_by(username=data['username']).first()
     
-    if user and check_password_hash(user.password, data['password']):
+    if user and verify_password(user, data['password']):
         return jsonify({
             'id': user.id,
             'username': user.username,
             'email': user.email,
             'role': user.role,
             'points': user.points,
-            'reputation_level': user.reputation_level
+            'reputation_level': user.reputation_level,
+            'token': issue_session_token(user),
+            'token_expires_in': app.config['SESSION_TOKEN_TTL']
         })
     
     return jsonify({'error': 'Invalid credentials'}), 401
 
 @app.route('/api/circles', methods=['GET', 'POST'])
+@cached(lambda: 'circles', bypass=lambda: 'search' in request.args)
 def circles():
     if request.method == 'POST':
         data = request.json
+        tags = normalize_tags(data.get('tags', ''))
         circle = Circle(
             title=data['title'],
             description=data['description'],
-            tags=data.get('tags', ''),
-            creator_id=data['creator_id'],
+            tags=', '.join(tags),
+            creator_id=acting_user_id(data.get('creator_id')),
             privacy=data.get('privacy', 'public')
         )
         
         db.session.add(circle)
+        db.session.flush()
+        set_circle_tags(circle, tags)
         db.session.commit()
+        invalidate('circles', f'user:{circle.creator_id}', 'tags')
+        mark_recommendations_stale(circle.id)
         
         return jsonify({
             'id': circle.id,
@@ -211,106 +2513,155 @@ def circles():
     
     # GET - Search and filter circles
     search = request.args.get('search', '')
-    circles = Circle.query.filter(Circle.privacy == 'public')
-    
-    if search:
-        circles = circles.filter(
-            db.or_(
-                Circle.title.ilike(f'%{search}%'),
-                Circle.tags.ilike(f'%{search}%'),
-                Circle.description.ilike(f'%{search}%')
+    tags = [name for tag in request.args.getlist('tag') for name in normalize_tags(tag)]
+    circles = with_tags(circles_with_creator().filter(Circle.privacy == 'public'), tags)
+    
+    ranked = False
+    if fts_enabled():
+        match = build_fts_query(search)
+        if match:
+            rank = db.func.bm25(db.literal_column('circle_fts'), *CIRCLE_FTS_WEIGHTS)
+            circles = circles.join(circle_fts, circle_fts.c.rowid == Circle.id).filter(
+                db.text('circle_fts MATCH :match').bindparams(match=match)
+            ).order_by(rank)
+            ranked = True
+    else:
+        if search:
+            circles = circles.filter(
+                db.or_(
+                    Circle.title.ilike(f'%{search}%'),
+                    Circle.tags.ilike(f'%{search}%'),
+                    Circle.description.ilike(f'%{search}%')
+                )
             )
-        )
     
-    circles = circles.all()
+    if ranked:
+        # Ranked search results are capped at one page of best matches
+        circles = circles.limit(page_limit()).all()
+        return jsonify([serialize_circle(c) for c in circles])
     
-    return jsonify([{
-        'id': c.id,
-        'title': c.title,
-        'description': c.description,
-        'tags': c.tags,
-        'creator_id': c.creator_id,
-        'creator_username': c.creator.username,
-        'privacy': c.privacy,
-        'created_at': c.created_at.isoformat(),
-        'member_count': len(c.members)
-    } for c in circles])
+    try:
+        page = keyset_page(circles, Circle.created_at, Circle.id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return paged_response([serialize_circle(c) for c in page.items], page)
+
+@app.route('/api/tags', methods=['GET'])
+@cached(lambda: 'tags')
+def get_tags():
+    # Autocomplete: the most used tags starting with ?prefix=, or overall
+    prefix = ' '.join(request.args.get('prefix', '').lower().split())
+    limit = max(1, min(request.args.get('limit', 10, type=int), app.config['PAGE_SIZE_MAX']))
+    tags = Tag.query.filter(Tag.circle_count > 0)
+    if prefix:
+        tags = tags.filter(prefix_range(Tag.name, prefix))
+    tags = tags.order_by(Tag.circle_count.desc(), Tag.name).limit(limit)
+    
+    return jsonify([{'name': tag.name, 'circle_count': tag.circle_count} for tag in tags])
 
 @app.route('/api/circles/<int:circle_id>', methods=['GET'])
+@cached(lambda circle_id: f'circle:{circle_id}')
 def get_circle(circle_id):
-    circle = Circle.query.get_or_404(circle_id)
+    circle = circles_with_creator().filter(Circle.id == circle_id).first_or_404()
     
-    return jsonify({
-        'id': circle.id,
-        'title': circle.title,
-        'description': circle.description,
-        'tags': circle.tags,
-        'creator_id': circle.creator_id,
-        'creator_username': circle.creator.username,
-        'privacy': circle.privacy,
-        'created_at': circle.created_at.isoformat(),
-        'member_count': len(circle.members)
-    })
+    return jsonify(serialize_circle(circle))
+
+@app.route('/api/circles/<int:circle_id>/export', methods=['GET'])
+def export_circle(circle_id):
+    circle = circles_with_creator().filter(Circle.id == circle_id).first_or_404()
+    return Response(
+        stream_with_context(export_lines(circle)),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename="circle-{circle_id}.ndjson"'}
+    )
 
 @app.route('/api/circles/<int:circle_id>/join', methods=['POST'])
 def join_circle(circle_id):
     data = request.json
-    user_id = data['user_id']
+    user_id = acting_user_id(data.get('user_id'))
     
     existing = CircleMember.query.filter_by(user_id=user_id, circle_id=circle_id).first()
     
     if existing:
         return jsonify({'message': 'Already a member'}), 200
     
-    member = CircleMember(user_id=user_id, circle_id=circle_id, is_member=True)
-    db.session.add(member)
-    db.session.commit()
-    
-    # Award points to creator
-    circle = Circle.query.get(circle_id)
-    award_points(circle.creator_id, 5, f'New member joined {circle.title}')
+    circle = Circle.query.get_or_404(circle_id)
+    try:
+        # Flushed first, so a duplicate fails here rather than in the
+        # autoflush of the statements below
+        db.session.add(CircleMember(user_id=user_id, circle_id=circle_id, is_member=True))
+        db.session.flush()
+        increment(Circle, circle_id, member_count=1)
+        # Award points to creator
+        award_points(circle.creator_id, 5, f'New member joined {circle.title}', f'join:{circle_id}:{user_id}', circle_id)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        if not CircleMember.query.filter_by(user_id=user_id, circle_id=circle_id).first():
+            raise
+        # A concurrent request inserted the same (user, circle) first
+        return jsonify({'message': 'Already a member'}), 200
+    invalidate_membership(circle, user_id)
     
     return jsonify({'message': 'Joined successfully'}), 201
 
 @app.route('/api/circles/<int:circle_id>/follow', methods=['POST'])
 def follow_circle(circle_id):
     data = request.json
-    user_id = data['user_id']
+    user_id = acting_user_id(data.get('user_id'))
+    circle = Circle.query.get_or_404(circle_id)
     
-    member = CircleMember.query.filter_by(user_id=user_id, circle_id=circle_id).first()
+    try:
+        follow(circle, user_id)
+    except IntegrityError:
+        db.session.rollback()
+        if not CircleMember.query.filter_by(user_id=user_id, circle_id=circle_id).first():
+            raise
+        # A concurrent request inserted the same (user, circle) first; the
+        # retry finds that row and updates it instead
+        follow(circle, user_id)
+    invalidate_membership(circle, user_id)
     
+    return jsonify({'message': 'Following successfully'}), 201
+
+def follow(circle, user_id):
+    member = CircleMember.query.filter_by(user_id=user_id, circle_id=circle.id).first()
     if member:
+        if not member.is_following:
+            increment(Circle, circle.id, follower_count=1)
         member.is_following = True
     else:
-        member = CircleMember(user_id=user_id, circle_id=circle_id, is_following=True, is_member=False)
-        db.session.add(member)
+        db.session.add(CircleMember(user_id=user_id, circle_id=circle.id, is_following=True, is_member=False))
+        # Flushed first, so a duplicate fails here rather than in the autoflush below
+        db.session.flush()
+        increment(Circle, circle.id, follower_count=1)
     
+    # Award points to creator, once per follower
+    award_points(circle.creator_id, 10, f'New follower on {circle.title}', f'follow:{circle.id}:{user_id}', circle.id)
     db.session.commit()
-    
-    # Award points to creator
-    circle = Circle.query.get(circle_id)
-    award_points(circle.creator_id, 10, f'New follower on {circle.title}')
-    
-    return jsonify({'message': 'Following successfully'}), 201
 
 @app.route('/api/circles/<int:circle_id>/unfollow', methods=['POST'])
 def unfollow_circle(circle_id):
     data = request.json
-    user_id = data['user_id']
+    user_id = acting_user_id(data.get('user_id'))
     
     member = CircleMember.query.filter_by(user_id=user_id, circle_id=circle_id).first()
     
     if member:
+        if member.is_following:
+            increment(Circle, circle_id, follower_count=-1)
         member.is_following = False
         if not member.is_member:
             db.session.delete(member)
         db.session.commit()
+        invalidate_membership(Circle.query.get(circle_id), user_id)
     
     return jsonify({'message': 'Unfollowed successfully'}), 200
 
 @app.route('/api/circles/<int:circle_id>/membership', methods=['GET'])
 def get_membership(circle_id):
-    user_id = request.args.get('user_id')
+    user_id = acting_user_id(request.args.get('user_id'))
     
     member = CircleMember.query.filter_by(user_id=user_id, circle_id=circle_id).first()
     
@@ -332,13 +2683,14 @@ def create_resource():
     resource = Resource(
         title=data['title'],
         circle_id=data['circle_id'],
-        creator_id=data['creator_id'],
+        creator_id=acting_user_id(data.get('creator_id')),
         resource_type=data['resource_type'],
         content=data['content']
     )
     
     db.session.add(resource)
     db.session.commit()
+    invalidate(f'circle:{int(resource.circle_id)}:resources')
     
     return jsonify({
         'id': resource.id,
@@ -347,6 +2699,43 @@ def create_resource():
         'upload_date': resource.upload_date.isoformat()
     }), 201
 
+@app.route('/api/circles/<int:circle_id>/resources/bulk', methods=['POST'])
+def bulk_create_resources(circle_id):
+    Circle.query.get_or_404(circle_id)
+    session_user_id = acting_user_id()
+    
+    def build_row(item, circle_id):
+        # With a session every item is created as the session's user
+        if session_user_id is not None:
+            if item.get('creator_id', session_user_id) != session_user_id:
+                raise ValueError('creator_id does not match the session')
+            item = dict(item, creator_id=session_user_id)
+        return resource_row(item, circle_id)
+    
+    try:
+        created, errors = bulk_insert(Resource, circle_id, build_row)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if created:
+        invalidate(f'circle:{circle_id}:resources')
+    return bulk_response(created, errors)
+
+def serialize_resource(resource):
+    return {
+        'id': resource.id,
+        'circle_id': resource.circle_id,
+        'title': resource.title,
+        'resource_type': resource.resource_type,
+        'content': resource.content,
+        'upload_date': resource.upload_date.isoformat(),
+        'view_count': resource.view_count,
+        'creator_id': resource.creator_id,
+        'creator_username': resource.creator.username,
+        'processing_status': resource.processing_status,
+        'thumbnail_url': f'/previews/{resource.thumbnail}' if resource.thumbnail else None
+    }
+
 @app.route('/api/resources/upload', methods=['POST'])
 def upload_resource():
     if 'file' not in request.files:
@@ -355,80 +2744,263 @@ def upload_resource():
     file = request.files['file']
     title = request.form.get('title')
     circle_id = request.form.get('circle_id')
-    creator_id = request.form.get('creator_id')
+    creator_id = acting_user_id(request.form.get('creator_id'))
     
     if file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
     
-    filename = secure_filename(file.filename)
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
+    partial_path, _ = partial_upload_paths(uuid.uuid4().hex)
+    with open(partial_path, 'wb') as f:
+        copy_stream(file.stream, f)
+    filename = store_upload(partial_path, file.filename)
     
     resource = Resource(
         title=title,
         circle_id=circle_id,
         creator_id=creator_id,
         resource_type='pdf',
-        content=filename
+        content=filename,
+        processing_status=initial_preview_status('pdf')
     )
     
     db.session.add(resource)
     db.session.commit()
+    invalidate(f'circle:{int(resource.circle_id)}:resources')
+    if resource.processing_status == 'pending':
+        start_preview(resource.id, resource.content)
     
     return jsonify({
         'id': resource.id,
         'title': resource.title,
-        'resource_type': resource.resource_type
+        'resource_type': resource.resource_type,
+        'processing_status': resource.processing_status
+    }), 201
+
+@app.route('/api/uploads', methods=['POST'])
+def start_upload():
+    # Resumable upload: start a session, PUT chunks with Content-Range, then complete
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    try:
+        filename = require_text(data, 'filename', 255)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid file size'}), 400
+    if size <= 0 or size > app.config['MAX_UPLOAD_SIZE']:
+        return jsonify({'error': 'Invalid file size'}), 400
+    
+    upload_id = uuid.uuid4().hex
+    partial_path, meta_path = partial_upload_paths(upload_id)
+    open(partial_path, 'wb').close()
+    with open(meta_path, 'w') as f:
+        json.dump({'filename': filename, 'size': size}, f)
+    
+    return jsonify({
+        'upload_id': upload_id,
+        'received': 0,
+        'chunk_size': app.config['UPLOAD_CHUNK_SIZE']
+    }), 201
+
+def load_upload(upload_id):
+    if not UPLOAD_ID.match(upload_id):
+        return None, None, None
+    partial_path, meta_path = partial_upload_paths(upload_id)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None, None, None
+    return partial_path, meta_path, meta
+
+@app.route('/api/uploads/<upload_id>', methods=['GET', 'PUT'])
+def upload_chunk(upload_id):
+    partial_path, meta_path, meta = load_upload(upload_id)
+    if meta is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    received = os.path.getsize(partial_path)
+    if received > meta['size']:
+        # Only a file written before chunks were locked can get here
+        return jsonify({'error': 'Upload is larger than its declared size; start a new one'}), 409
+    
+    if request.method == 'GET':
+        return jsonify({'upload_id': upload_id, 'received': received, 'size': meta['size']})
+    
+    match = re.match(r'^bytes (\d+)-(\d+)/(\d+)$', request.headers.get('Content-Range', ''))
+    if not match:
+        return jsonify({'error': 'Content-Range header required'}), 400
+    start, end, total = (int(group) for group in match.groups())
+    if total != meta['size'] or end < start or end >= total:
+        return jsonify({'error': 'Invalid Content-Range'}), 400
+    
+    # One chunk at a time per upload: two PUTs at the same offset would both
+    # pass the offset check below and write the same bytes twice
+    if not lock_upload(partial_path):
+        return jsonify({'error': 'Another chunk of this upload is being written', 'received': received}), 409, {
+            'Retry-After': '1'
+        }
+    try:
+        if not os.path.exists(meta_path):
+            # Completed while this request waited
+            return jsonify({'error': 'Upload not found'}), 404
+        received = os.path.getsize(partial_path)
+        if start != received:
+            # Client is out of sync; it resumes from the offset we report
+            return jsonify({'error': 'Unexpected chunk offset', 'received': received}), 409
+        with open(partial_path, 'r+b') as f:
+            f.seek(start)
+            written = copy_stream(request.stream, f, limit=end - start + 1)
+            # end < size, so the file never grows past it
+            f.truncate()
+    finally:
+        unlock_upload(partial_path)
+    
+    return jsonify({'upload_id': upload_id, 'received': start + written, 'size': meta['size']})
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    partial_path, meta_path, meta = load_upload(upload_id)
+    if meta is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    # Everything that can refuse the request is checked before the upload
+    # is consumed, so the client can fix it and complete again
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    creator_id = acting_user_id(data.get('creator_id'))
+    resource_type = data.get('resource_type', 'pdf')
+    try:
+        title = require_text(data, 'title', 200)
+        if resource_type not in RESOURCE_TYPES:
+            raise ValueError('resource_type must be one of ' + ', '.join(RESOURCE_TYPES))
+        if creator_id is None:
+            raise ValueError('creator_id is required')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    circle_id = data.get('circle_id')
+    if not isinstance(circle_id, int) or db.session.get(Circle, circle_id) is None:
+        return jsonify({'error': 'Circle not found'}), 404
+    
+    if not lock_upload(partial_path):
+        return jsonify({'error': 'A chunk of this upload is still being written'}), 409
+    try:
+        if not os.path.exists(meta_path):
+            return jsonify({'error': 'Upload not found'}), 404
+        received = os.path.getsize(partial_path)
+        if received != meta['size']:
+            return jsonify({'error': 'Upload incomplete', 'received': received}), 409
+        
+        filename = store_upload(partial_path, meta['filename'])
+        os.remove(meta_path)
+    finally:
+        unlock_upload(partial_path)
+    
+    resource = Resource(
+        title=title,
+        circle_id=circle_id,
+        creator_id=creator_id,
+        resource_type=resource_type,
+        content=filename,
+        processing_status=initial_preview_status(resource_type)
+    )
+    
+    db.session.add(resource)
+    db.session.commit()
+    invalidate(f'circle:{int(resource.circle_id)}:resources')
+    if resource.processing_status == 'pending':
+        start_preview(resource.id, resource.content)
+    
+    return jsonify({
+        'id': resource.id,
+        'title': resource.title,
+        'resource_type': resource.resource_type,
+        'processing_status': resource.processing_status
     }), 201
 
 @app.route('/api/circles/<int:circle_id>/resources', methods=['GET'])
+@cached(lambda circle_id: f'circle:{circle_id}:resources')
 def get_circle_resources(circle_id):
-    resources = Resource.query.filter_by(circle_id=circle_id).all()
+    resources = Resource.query.filter_by(circle_id=circle_id).options(
+        db.joinedload(Resource.creator)
+    )
     
-    return jsonify([{
-        'id': r.id,
-        'title': r.title,
-        'resource_type': r.resource_type,
-        'content': r.content,
-        'upload_date': r.upload_date.isoformat(),
-        'view_count': r.view_count,
-        'creator_username': r.creator.username
-    } for r in resources])
+    try:
+        columns = wants_columns()
+        page = keyset_page(resources, Resource.upload_date, Resource.id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    items = [serialize_resource(r) for r in page.items]
+    return paged_response(columnar(items, 'creator_id', 'creator_username') if columns else items, page)
+
+@app.route('/api/resources/<int:resource_id>', methods=['GET'])
+def get_resource(resource_id):
+    # Cheap enough to poll while an upload is processed
+    resource = Resource.query.options(db.joinedload(Resource.creator)).filter_by(id=resource_id).first_or_404()
+    
+    return jsonify(serialize_resource(resource))
+
+@app.route('/api/resources', methods=['GET'])
+def search_resources():
+    # Titles and the text of processed PDFs, in public circles or in ?circle_id=
+    search = request.args.get('search', '')
+    circle_id = request.args.get('circle_id', type=int)
+    snippet = db.null()
+    resources = db.session.query(Resource).options(db.joinedload(Resource.creator))
+    if circle_id is not None:
+        resources = resources.filter(Resource.circle_id == circle_id)
+    else:
+        resources = resources.join(Circle, Circle.id == Resource.circle_id).filter(Circle.privacy == 'public')
+    
+    if fts_enabled():
+        match = build_fts_query(search)
+        if not match:
+            return jsonify([])
+        rank = db.func.bm25(db.literal_column('resource_fts'), *RESOURCE_FTS_WEIGHTS)
+        snippet = db.func.snippet(db.literal_column('resource_fts'), 1, '[', ']', '...', 16)
+        resources = resources.join(resource_fts, resource_fts.c.rowid == Resource.id).filter(
+            db.text('resource_fts MATCH :match').bindparams(match=match)
+        ).order_by(rank)
+    else:
+        if not search:
+            return jsonify([])
+        resources = resources.filter(
+            db.or_(Resource.title.ilike(f'%{search}%'), Resource.extracted_text.ilike(f'%{search}%'))
+        ).order_by(Resource.upload_date.desc())
+    
+    # Ranked like circle search: one page of best matches
+    rows = resources.add_columns(snippet).limit(page_limit()).all()
+    return jsonify([dict(serialize_resource(resource), snippet=text) for resource, text in rows])
 
 @app.route('/api/resources/<int:resource_id>/view', methods=['POST'])
 def view_resource(resource_id):
     resource = Resource.query.get_or_404(resource_id)
-    resource.view_count += 1
-    db.session.commit()
     
-    # Award points to creator every 10 views
-    if resource.view_count % 10 == 0:
-        award_points(resource.creator_id, 5, f'Resource "{resource.title}" reached {resource.view_count} views')
+    # Counted in memory and written in batches by flush_view_counts, which
+    # also awards the creator 5 points every 10 views
+    pending = view_counter.increment(resource_id)
     
-    return jsonify({'view_count': resource.view_count})
+    return jsonify({'view_count': (resource.view_count or 0) + pending})
 
 @app.route('/api/tasks', methods=['POST'])
 def create_task():
     try:
         data = request.json
         
-        # Parse the due_date
-        due_date_str = data['due_date']
-        # Handle both formats: with 'T' or with space
-        if 'T' in due_date_str:
-            due_date = datetime.fromisoformat(due_date_str)
-        else:
-            due_date = datetime.strptime(due_date_str, '%Y-%m-%d %H:%M:%S')
-        
         task = Task(
             title=data['title'],
             description=data['description'],
-            due_date=due_date,
+            due_date=parse_due_date(data['due_date']),
             circle_id=data['circle_id']
         )
         
         db.session.add(task)
         db.session.commit()
+        invalidate(f'circle:{task.circle_id}:tasks')
         
         return jsonify({
             'id': task.id,
@@ -441,6 +3013,7 @@ def create_task():
         return jsonify({'error': str(e)}), 400
 
 @app.route('/api/circles/<int:circle_id>/tasks', methods=['GET'])
+@cached(lambda circle_id: f'circle:{circle_id}:tasks')
 def get_circle_tasks(circle_id):
     tasks = Task.query.filter_by(circle_id=circle_id).all()
     
@@ -450,37 +3023,120 @@ def get_circle_tasks(circle_id):
         'description': t.description,
         'due_date': t.due_date.isoformat(),
         'created_at': t.created_at.isoformat(),
-        'completion_count': len(t.completions)
+        'completion_count': t.completion_count
     } for t in tasks])
 
+@app.route('/api/circles/<int:circle_id>/tasks/bulk', methods=['POST'])
+def bulk_create_tasks(circle_id):
+    Circle.query.get_or_404(circle_id)
+    try:
+        created, errors = bulk_insert(Task, circle_id, task_row)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if created:
+        invalidate(f'circle:{circle_id}:tasks')
+    return bulk_response(created, errors)
+
 @app.route('/api/tasks/<int:task_id>/complete', methods=['POST'])
 def complete_task(task_id):
     data = request.json
-    user_id = data['user_id']
+    user_id = acting_user_id(data.get('user_id'))
     
     existing = TaskCompletion.query.filter_by(task_id=task_id, user_id=user_id).first()
     
     if existing:
         return jsonify({'message': 'Task already completed'}), 200
     
-    completion = TaskCompletion(task_id=task_id, user_id=user_id)
-    db.session.add(completion)
-    db.session.commit()
-    
-    # Award points to task creator
-    task = Task.query.get(task_id)
+    task = Task.query.get_or_404(task_id)
     circle = Circle.query.get(task.circle_id)
-    award_points(circle.creator_id, 15, f'Student completed task "{task.title}"')
+    try:
+        # Flushed first, so a duplicate fails here rather than in the
+        # autoflush of the statements below
+        db.session.add(TaskCompletion(task_id=task_id, user_id=user_id))
+        db.session.flush()
+        increment(Task, task_id, completion_count=1)
+        increment(User, user_id, completed_tasks_count=1)
+        # Award points to task creator
+        award_points(circle.creator_id, 15, f'Student completed task "{task.title}"', f'complete:{task_id}:{user_id}',
+                     circle.id)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        if not TaskCompletion.query.filter_by(task_id=task_id, user_id=user_id).first():
+            raise
+        # A concurrent request completed it first
+        return jsonify({'message': 'Task already completed'}), 200
+    invalidate(f'circle:{circle.id}:tasks', f'user:{user_id}')
     
     return jsonify({'message': 'Task completed'}), 201
 
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({endpoint: dict(stats, hit_rate=stats['hits'] / ((stats['hits'] + stats['misses']) or 1))
+                    for endpoint, stats in cache_stats.items()})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/profiler', methods=['GET', 'POST'])
+def sampling_profiler():
+    if not app.config['PROFILER_ENABLED']:
+        abort(404)
+    
+    if request.method == 'POST':
+        data = request.json
+        if data.get('enabled'):
+            try:
+                interval = float(data['interval']) if data.get('interval') else None
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Invalid interval'}), 400
+            if interval is not None and interval <= 0:
+                return jsonify({'error': 'Invalid interval'}), 400
+            profiler.start(data.get('endpoints') or (), interval)
+        else:
+            profiler.stop()
+        return jsonify({'running': profiler.running, 'endpoints': sorted(profiler.endpoints),
+                        'interval': profiler.interval, 'samples': profiler.samples})
+    
+    return Response(profiler.folded(), mimetype='text/plain')
+
+@app.route('/api/leaderboard', methods=['GET'])
+def get_leaderboard():
+    try:
+        board = current_board(request.args.get('period', 'all'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return leaderboard_response(board)
+
+@app.route('/api/circles/<int:circle_id>/leaderboard', methods=['GET'])
+def get_circle_leaderboard(circle_id):
+    return leaderboard_response(f'circle:{circle_id}')
+
 @app.route('/api/users/<int:user_id>/profile', methods=['GET'])
+@cached(lambda user_id: f'user:{user_id}')
 def get_profile(user_id):
-    user = User.query.get_or_404(user_id)
+    # One statement: the user row joined to a UNION of the (capped) followed
+    # and created circle lists; every count comes from a stored counter
+    limit = app.config['PAGE_SIZE_MAX']
+    followed = db.select(db.literal('followed').label('kind'), Circle.id, Circle.title, Circle.member_count).join(
+        CircleMember, CircleMember.circle_id == Circle.id
+    ).where(CircleMember.user_id == user_id, CircleMember.is_following == True).limit(limit).subquery()
+    created = db.select(db.literal('created').label('kind'), Circle.id, Circle.title, Circle.member_count).where(
+        Circle.creator_id == user_id
+    ).limit(limit).subquery()
+    circles = db.union_all(db.select(followed), db.select(created)).subquery()
     
-    followed_circles = CircleMember.query.filter_by(user_id=user_id, is_following=True).all()
-    created_circles = Circle.query.filter_by(creator_id=user_id).all()
-    completed_tasks = TaskCompletion.query.filter_by(user_id=user_id).all()
+    rows = db.session.query(User, circles.c.kind, circles.c.id, circles.c.title, circles.c.member_count).outerjoin(
+        circles, db.true()
+    ).filter(User.id == user_id).all()
+    if not rows:
+        abort(404)
+    user = rows[0][0]
+    followed_circles = [row for row in rows if row.kind == 'followed']
+    created_circles = [row for row in rows if row.kind == 'created']
     
     return jsonify({
         'id': user.id,
@@ -491,24 +3147,68 @@ def get_profile(user_id):
         'badges': user.badges,
         'reputation_level': user.reputation_level,
         'followed_circles': [{
-            'id': m.circle.id,
-            'title': m.circle.title
-        } for m in followed_circles],
+            'id': c.id,
+            'title': c.title
+        } for c in followed_circles],
         'created_circles': [{
             'id': c.id,
             'title': c.title,
-            'member_count': len(c.members)
+            'member_count': c.member_count
         } for c in created_circles],
-        'completed_tasks_count': len(completed_tasks)
+        'completed_tasks_count': user.completed_tasks_count
     })
 
+@app.route('/api/users/<int:user_id>/recommendations', methods=['GET'])
+def get_recommendations(user_id):
+    user_id = acting_user_id(user_id)
+    limit = max(1, min(request.args.get('limit', 10, type=int), app.config['PAGE_SIZE_MAX']))
+    
+    return jsonify([dict(serialize_circle(circle), score=round(score, 4))
+                    for circle, score in recommended_circles(user_id, limit)])
+
+def serialize_notification(notification):
+    return {
+        'id': notification.id,
+        'kind': notification.kind,
+        'message': notification.message,
+        'task_id': notification.task_id,
+        'circle_id': notification.circle_id,
+        'created_at': notification.created_at.isoformat(),
+        'read': notification.read_at is not None
+    }
+
+@app.route('/api/users/<int:user_id>/notifications', methods=['GET'])
+def get_notifications(user_id):
+    user_id = acting_user_id(user_id)
+    notifications = Notification.query.filter_by(user_id=user_id)
+    if request.args.get('unread') == '1':
+        notifications = notifications.filter(Notification.read_at.is_(None))
+    
+    try:
+        page = keyset_page(notifications, Notification.created_at, Notification.id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return paged_response([serialize_notification(n) for n in page.items], page)
+
+@app.route('/api/notifications/<int:notification_id>/read', methods=['POST'])
+def read_notification(notification_id):
+    notification = Notification.query.get_or_404(notification_id)
+    acting_user_id(notification.user_id)
+    
+    if notification.read_at is None:
+        notification.read_at = datetime.utcnow()
+        db.session.commit()
+    
+    return jsonify(serialize_notification(notification))
+
 @app.route('/api/comments', methods=['POST'])
 def create_comment():
     data = request.json
     
     comment = Comment(
         text=data['text'],
-        user_id=data['user_id'],
+        user_id=acting_user_id(data.get('user_id')),
         resource_id=data['resource_id']
     )
     
@@ -523,15 +3223,23 @@ def create_comment():
 
 @app.route('/api/resources/<int:resource_id>/comments', methods=['GET'])
 def get_comments(resource_id):
-    comments = Comment.query.filter_by(resource_id=resource_id).order_by(Comment.timestamp.desc()).all()
+    comments = Comment.query.filter_by(resource_id=resource_id).options(
+        db.joinedload(Comment.user)
+    )
     
-    return jsonify([{
+    try:
+        page = keyset_page(comments, Comment.timestamp, Comment.id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Comments are shown newest first
+    return paged_response([{
         'id': c.id,
         'text': c.text,
         'user_id': c.user_id,
         'username': c.user.username,
         'timestamp': c.timestamp.isoformat()
-    } for c in comments])
+    } for c in reversed(page.items)], page)
 
 @app.route('/api/circles/<int:circle_id>/messages', methods=['GET', 'POST'])
 def circle_messages(circle_id):
@@ -540,12 +3248,13 @@ def circle_messages(circle_id):
         
         message = Message(
             text=data['text'],
-            user_id=data['user_id'],
+            user_id=acting_user_id(data.get('user_id')),
             circle_id=circle_id
         )
         
         db.session.add(message)
         db.session.commit()
+        publish_message(message)
         
         return jsonify({
             'id': message.id,
@@ -553,21 +3262,68 @@ def circle_messages(circle_id):
             'timestamp': message.timestamp.isoformat()
         }), 201
     
-    messages = Message.query.filter_by(circle_id=circle_id).order_by(Message.timestamp.asc()).all()
+    messages = Message.query.filter_by(circle_id=circle_id).options(
+        db.joinedload(Message.user)
+    )
     
-    return jsonify([{
-        'id': m.id,
-        'text': m.text,
-        'user_id': m.user_id,
-        'username': m.user.username,
-        'timestamp': m.timestamp.isoformat()
-    } for m in messages])
+    try:
+        columns = wants_columns()
+        page = keyset_page(messages, Message.timestamp, Message.id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    items = [serialize_message(m) for m in page.items]
+    return paged_response(columnar(items, 'user_id', 'username') if columns else items, page)
+
+@app.route('/api/circles/<int:circle_id>/messages/stream', methods=['GET'])
+def stream_circle_messages(circle_id):
+    # EventSource sends Last-Event-ID on reconnect; ?last_id= seeds the first connect
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_id')
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        return jsonify({'error': 'Invalid last event id'}), 400
+    
+    # Subscribe before reading the backlog so nothing posted in between is
+    # missed; sse_stream drops anything the backlog already covered
+    subscription = broker.subscribe(circle_id)
+    backlog = []
+    if last_id is not None:
+        messages = Message.query.filter(
+            Message.circle_id == circle_id, Message.id > last_id
+        ).options(db.joinedload(Message.user)).order_by(Message.id.asc()).limit(app.config['PAGE_SIZE_MAX']).all()
+        backlog = [serialize_message(m) for m in messages]
+        if len(backlog) == app.config['PAGE_SIZE_MAX']:
+            # Too far behind to replay; tell the client to reload the history
+            broker.unsubscribe(circle_id, subscription)
+            return Response('retry: 3000\nevent: reset\ndata: {}\n\n', mimetype='text/event-stream')
+    
+    return Response(
+        sse_stream(circle_id, subscription, backlog, app.config['CHAT_STREAM_HEARTBEAT']),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    # Range requests, If-None-Match and If-Modified-Since are handled by
+    # send_file's conditional mode. Content-addressed files never change, so
+    # their hash is a strong ETag and they can be cached for a year.
+    match = CONTENT_ADDRESSED_NAME.match(filename)
+    if match:
+        return send_from_directory(app.config['UPLOAD_FOLDER'], filename,
+                                   conditional=True, etag=match.group(1), max_age=31536000)
+    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, conditional=True)
+
+@app.route('/previews/<filename>')
+def preview_file(filename):
+    # Named by the PDF's content hash, so they never change either
+    match = THUMBNAIL_NAME.match(filename)
+    if not match:
+        abort(404)
+    return send_from_directory(PREVIEW_FOLDER, filename, conditional=True, etag=match.group(1), max_age=31536000)
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        upgrade()
     app.run(debug=True)
\ No newline at end of file
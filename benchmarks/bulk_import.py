@@ -0,0 +1,89 @@
+"""Compare one-at-a-time creation with the bulk import endpoints.
+
+Usage:
+    python -m benchmarks.bulk_import [--items 500]
+
+Creates the same resources and tasks through POST /api/resources and
+POST /api/tasks (one commit each), then through the /bulk endpoints as a
+JSON array and as NDJSON, and finally streams the circle back through
+/export to check every row made it.
+"""
+import argparse
+import json
+import sys
+import time
+
+from benchmarks.common import scratch_app
+
+
+def timed(label, count, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<28} {count:>6} items {elapsed * 1000:>9.1f} ms  ({count / elapsed:,.0f} items/sec)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=500)
+    args = parser.parse_args()
+
+    learncircle = scratch_app()
+    app, db = learncircle.app, learncircle.db
+    client = app.test_client()
+
+    with app.app_context():
+        creator = learncircle.User(username='creator', email='creator@example.com', password='x', role='creator')
+        db.session.add(creator)
+        db.session.flush()
+        circle = learncircle.Circle(title='Import', description='import', creator_id=creator.id)
+        db.session.add(circle)
+        db.session.commit()
+        creator_id, circle_id = creator.id, circle.id
+
+    resources = [{'title': f'Resource {i}', 'resource_type': 'link', 'content': f'https://example.com/{i}',
+                  'creator_id': creator_id} for i in range(args.items)]
+    tasks = [{'title': f'Task {i}', 'description': 'Read the chapter', 'due_date': '2030-01-01T09:00:00'}
+             for i in range(args.items)]
+    failures = []
+
+    def check(response, status):
+        if response.status_code != status or (status == 201 and response.json.get('errors')):
+            failures.append(response.status_code)
+
+    def one_at_a_time():
+        for resource in resources:
+            check(client.post('/api/resources', json={**resource, 'circle_id': circle_id}), 201)
+        for task in tasks:
+            check(client.post('/api/tasks', json={**task, 'circle_id': circle_id}), 201)
+
+    def bulk_json():
+        check(client.post(f'/api/circles/{circle_id}/resources/bulk', json=resources), 201)
+        check(client.post(f'/api/circles/{circle_id}/tasks/bulk', json=tasks), 201)
+
+    def bulk_ndjson():
+        for kind, items in (('resources', resources), ('tasks', tasks)):
+            body = '\n'.join(json.dumps(item) for item in items)
+            check(client.post(f'/api/circles/{circle_id}/{kind}/bulk', data=body,
+                              content_type='application/x-ndjson'), 201)
+
+    total = 2 * args.items
+    timed('one request per item', total, one_at_a_time)
+    timed('bulk, JSON array', total, bulk_json)
+    timed('bulk, NDJSON', total, bulk_ndjson)
+
+    lines = []
+    timed('export, NDJSON', 3 * total, lambda: lines.extend(client.get(f'/api/circles/{circle_id}/export').data.splitlines()))
+    counts = {}
+    for line in lines:
+        kind = json.loads(line)['type']
+        counts[kind] = counts.get(kind, 0) + 1
+    if counts.get('resource') != 3 * args.items or counts.get('task') != 3 * args.items:
+        failures.append(f'export counts {counts}')
+
+    print('all items imported and exported' if not failures else f'{len(failures)} failures: {failures[:5]}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
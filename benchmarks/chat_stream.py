@@ -0,0 +1,81 @@
+"""Load test for the chat stream broker.
+
+Usage:
+    python -m benchmarks.chat_stream [--subscribers 1000] [--messages 500]
+
+Opens N idle subscribers on one circle, each drained by its own thread
+through sse_stream() as a WSGI worker thread would, then publishes
+messages and reports delivery throughput and memory per subscriber.
+"""
+import argparse
+import threading
+import time
+import tracemalloc
+
+from benchmarks.common import scratch_app
+
+
+def rss_kb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--subscribers', type=int, default=1000)
+    parser.add_argument('--messages', type=int, default=500)
+    args = parser.parse_args()
+
+    learncircle = scratch_app()
+    broker = learncircle.broker
+    circle_id = 1
+    threading.stack_size(256 * 1024)
+
+    received = [0] * args.subscribers
+    done = threading.Barrier(args.subscribers + 1)
+
+    def subscriber(index, subscription):
+        # Ends early if the broker drops this subscriber for falling behind
+        for frame in learncircle.sse_stream(circle_id, subscription, [], heartbeat=60):
+            if frame.startswith('id:'):
+                received[index] += 1
+                if received[index] == args.messages:
+                    break
+        done.wait()
+
+    tracemalloc.start()
+    rss_before = rss_kb()
+    traced_before = tracemalloc.get_traced_memory()[0]
+    threads = []
+    for index in range(args.subscribers):
+        thread = threading.Thread(target=subscriber, args=(index, broker.subscribe(circle_id)), daemon=True)
+        thread.start()
+        threads.append(thread)
+    time.sleep(1)
+    rss_per_client = (rss_kb() - rss_before) / args.subscribers
+    traced_per_client = (tracemalloc.get_traced_memory()[0] - traced_before) / args.subscribers
+    tracemalloc.stop()
+
+    payload = {'id': 0, 'text': 'x' * 80, 'user_id': 1, 'username': 'bench', 'timestamp': '2024-01-01T00:00:00'}
+    start = time.perf_counter()
+    for message_id in range(1, args.messages + 1):
+        broker.publish(circle_id, message_id, dict(payload, id=message_id))
+    publish_elapsed = time.perf_counter() - start
+    done.wait()
+    elapsed = time.perf_counter() - start
+
+    delivered = sum(received)
+    print(f'subscribers:            {args.subscribers}')
+    print(f'messages published:     {args.messages}')
+    print(f'deliveries:             {delivered} ({args.subscribers * args.messages - delivered} dropped)')
+    print(f'published messages/sec: {args.messages / publish_elapsed:,.0f} (fan-out to all queues)')
+    print(f'delivered frames/sec:   {delivered / elapsed:,.0f}')
+    print(f'RSS per idle client:    {rss_per_client:.1f} KiB (includes thread stack)')
+    print(f'heap per idle client:   {traced_per_client / 1024:.1f} KiB (tracemalloc)')
+
+
+if __name__ == '__main__':
+    main()
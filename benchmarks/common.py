@@ -0,0 +1,27 @@
+"""Helpers shared by the benchmark scripts."""
+import os
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def scratch_app(database_url=None):
+    """Import app.py against a throwaway database and create its schema.
+
+    DATABASE_URL has to be set before app.py is imported, so call this
+    before any `from app import ...` in the benchmark.
+    """
+    workdir = tempfile.mkdtemp(prefix='learncircle-bench-')
+    os.environ['DATABASE_URL'] = database_url or 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+    import app as learncircle
+    from flask_migrate import stamp
+    with learncircle.app.app_context():
+        learncircle.db.create_all()
+        learncircle.init_search_index()
+        # create_all built the latest schema, so `flask db upgrade` has nothing to do
+        stamp()
+    return learncircle
@@ -0,0 +1,110 @@
+"""Leaderboard benchmark: materialized board + RankIndex vs sorting users.
+
+Usage:
+    python -m benchmarks.leaderboard [--users 1000000] [--lookups 2000] [--events 10000]
+
+Compares top-50 and single-user rank lookups served from leaderboard_entry
+and the in-memory RankIndex against the naive queries over user.points.
+Also reports what keeping the RankIndex costs: loading a board, which each
+process pays on the first request for it, and folding in --events points
+awarded after the load, which is all sync() does from then on.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from benchmarks.common import scratch_app
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--events', type=int, default=10_000)
+    args = parser.parse_args()
+
+    learncircle = scratch_app()
+    app, db = learncircle.app, learncircle.db
+    User, LeaderboardEntry = learncircle.User, learncircle.LeaderboardEntry
+    rng = random.Random(7)
+
+    with app.app_context():
+        start = time.perf_counter()
+        points = [int(rng.paretovariate(1.2) * 10) for _ in range(args.users)]
+        for offset in range(0, args.users, 50_000):
+            batch = range(offset, min(offset + 50_000, args.users))
+            db.session.execute(db.insert(User), [
+                {'id': i + 1, 'username': f'u{i}', 'email': f'u{i}@example.com', 'password': 'x',
+                 'role': 'creator', 'points': points[i], 'reputation_level': 1} for i in batch
+            ])
+            db.session.execute(db.insert(LeaderboardEntry), [
+                {'board': 'global', 'user_id': i + 1, 'points': points[i]} for i in batch
+            ])
+        db.session.commit()
+        print(f'seeded {args.users:,} users in {time.perf_counter() - start:.1f}s')
+
+        probe = [rng.randint(1, args.users) for _ in range(args.lookups)]
+
+        naive_top = timed(lambda: User.query.order_by(User.points.desc()).limit(50).all(), args.runs)
+        board_top = timed(lambda: LeaderboardEntry.query.filter_by(board='global').order_by(
+            LeaderboardEntry.points.desc(), LeaderboardEntry.user_id).limit(50).all(), args.runs)
+
+        def naive_rank(user_id):
+            user_points = db.session.get(User, user_id).points
+            return User.query.filter(User.points > user_points).count() + 1
+
+        start = time.perf_counter()
+        for user_id in probe[:20]:
+            naive_rank(user_id)
+        naive_rank_ms = (time.perf_counter() - start) * 1000 / 20
+
+        start = time.perf_counter()
+        index = learncircle.rank_indexes.get('global')
+        load_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        for user_id in probe:
+            index.rank(user_id)
+        rank_us = (time.perf_counter() - start) * 1e6 / len(probe)
+
+        start = time.perf_counter()
+        for user_id in probe:
+            index.update(user_id, 5)
+        update_us = (time.perf_counter() - start) * 1e6 / len(probe)
+
+        # Points applied by another process's worker, seen here only through points_history
+        awarded = [(rng.randint(1, args.users), rng.randint(1, 20)) for _ in range(args.events)]
+        db.session.execute(db.insert(learncircle.PointsHistory), [
+            {'user_id': user_id, 'points': points, 'reason': 'bench'} for user_id, points in awarded
+        ])
+        board_deltas = {}
+        for user_id, points in awarded:
+            board_deltas[('global', user_id)] = board_deltas.get(('global', user_id), 0) + points
+        learncircle.add_leaderboard_points(board_deltas)
+        db.session.commit()
+        start = time.perf_counter()
+        learncircle.rank_indexes.sync()
+        sync_ms = (time.perf_counter() - start) * 1000
+
+        print(f'top 50, ORDER BY user.points:        {naive_top:8.2f} ms')
+        print(f'top 50, leaderboard_entry index:     {board_top:8.2f} ms')
+        print(f'rank, COUNT(points > x) over users:  {naive_rank_ms:8.2f} ms')
+        print(f'rank, RankIndex lookup:              {rank_us / 1000:8.4f} ms ({rank_us:.1f} us)')
+        print(f'RankIndex incremental update:        {update_us:8.1f} us')
+        print(f'RankIndex first load of the board:   {load_ms:8.0f} ms (each process, first request for the board)')
+        print(f'RankIndex sync of new events:        {sync_ms:8.1f} ms ({args.events:,} events; no reloads after the first)')
+
+
+if __name__ == '__main__':
+    main()
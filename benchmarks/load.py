@@ -0,0 +1,401 @@
+"""HTTP load test with a scripted student/creator workload.
+
+Usage:
+    python -m benchmarks.load [--scale small] [--virtual-users 16] [--duration 30]
+                              [--label NAME] [--compare latest|PATH] [--server-env KEY=VALUE ...]
+    python -m benchmarks.load --url http://host:port --scale medium ...
+
+Without --url it seeds a scratch database with benchmarks.seed (same size
+options) and starts app.py in a threaded server subprocess on a free port.
+Against --url the server must hold data seeded with the same --scale and
+--seed, since the script logs in as the seeded accounts.
+
+Each virtual user logs in as a random seeded account and runs a session of
+weighted actions: browse and search circles, read resources, tasks, chat
+and comments, post messages, view resources, complete tasks, join, and
+check profiles and leaderboards. Creators also add resources and tasks.
+After --warmup seconds the script records every request for --duration
+seconds. It then reports throughput and p50/p90/p99 latency per route.
+
+Results are written to benchmarks/results/<time>-<label>.json together
+with the commit, settings and data sizes. --compare prints the change
+against an earlier result file, or against the latest one.
+"""
+import argparse
+import glob
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+
+from benchmarks.common import REPO_ROOT
+from benchmarks.seed import TOPICS, WORDS, add_size_arguments, sizes_from
+
+RESULTS_DIR = os.path.join(REPO_ROOT, 'benchmarks', 'results')
+SESSION_LENGTH = 25  # actions before a virtual user logs in as someone else
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] if samples else 0.0
+
+
+class VirtualUser:
+    """One simulated client with its own keep-alive connection."""
+
+    def __init__(self, host, port, sizes, rng):
+        self.host, self.port = host, port
+        self.sizes = sizes
+        self.rng = rng
+        self.connection = http.client.HTTPConnection(host, port, timeout=60)
+        self.samples = {}  # route -> [latency ms]
+        self.errors = {}  # route -> count
+        self.recording = False
+        self.user = None
+        self.circle_ids = []
+
+    def request(self, route, method, path, body=None, query=None):
+        if query:
+            path += '?' + urlencode(query)
+        headers = {}
+        if self.user and 'token' in self.user:
+            headers['Authorization'] = f'Bearer {self.user["token"]}'
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        start = time.perf_counter()
+        try:
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+            payload = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            payload, status = b'', 599
+        elapsed = (time.perf_counter() - start) * 1000
+        if self.recording:
+            self.samples.setdefault(route, []).append(elapsed)
+            if status >= 400:
+                self.errors[route] = self.errors.get(route, 0) + 1
+        if status >= 400 or not payload:
+            return None
+        return json.loads(payload)
+
+    def circle(self):
+        # Mostly something the user just saw listed, sometimes any circle
+        if self.circle_ids and self.rng.random() < 0.7:
+            return self.rng.choice(self.circle_ids)
+        return self.rng.randint(1, self.sizes['circles'])
+
+    def log_in(self):
+        account = self.rng.randint(1, self.sizes['users'])
+        self.user = None
+        self.user = self.request('POST /api/login', 'POST', '/api/login',
+                                 {'username': f'user{account}', 'password': 'password'})
+
+    def list_circles(self):
+        circles = self.request('GET /api/circles', 'GET', '/api/circles')
+        if circles:
+            self.circle_ids = [c['id'] for c in circles]
+
+    def search_circles(self):
+        query = {'search': self.rng.choice(TOPICS + WORDS)}
+        if self.rng.random() < 0.3:
+            query['tag'] = self.rng.choice(TOPICS)
+        self.request('GET /api/circles?search=', 'GET', '/api/circles', query=query)
+
+    def get_circle(self):
+        self.request('GET /api/circles/<id>', 'GET', f'/api/circles/{self.circle()}')
+
+    def get_resources(self):
+        self.request('GET /api/circles/<id>/resources', 'GET', f'/api/circles/{self.circle()}/resources')
+
+    def get_tasks(self):
+        self.request('GET /api/circles/<id>/tasks', 'GET', f'/api/circles/{self.circle()}/tasks')
+
+    def get_messages(self):
+        self.request('GET /api/circles/<id>/messages', 'GET', f'/api/circles/{self.circle()}/messages')
+
+    def post_message(self):
+        self.request('POST /api/circles/<id>/messages', 'POST', f'/api/circles/{self.circle()}/messages',
+                     {'text': ' '.join(self.rng.choices(WORDS, k=8)), 'user_id': self.user['id']})
+
+    def view_resource(self):
+        resource_id = self.rng.randint(1, self.sizes['resources'])
+        self.request('POST /api/resources/<id>/view', 'POST', f'/api/resources/{resource_id}/view')
+
+    def get_comments(self):
+        resource_id = self.rng.randint(1, self.sizes['resources'])
+        self.request('GET /api/resources/<id>/comments', 'GET', f'/api/resources/{resource_id}/comments')
+
+    def post_comment(self):
+        self.request('POST /api/comments', 'POST', '/api/comments',
+                     {'text': ' '.join(self.rng.choices(WORDS, k=12)), 'user_id': self.user['id'],
+                      'resource_id': self.rng.randint(1, self.sizes['resources'])})
+
+    def complete_task(self):
+        task_id = self.rng.randint(1, self.sizes['tasks'])
+        self.request('POST /api/tasks/<id>/complete', 'POST', f'/api/tasks/{task_id}/complete',
+                     {'user_id': self.user['id']})
+
+    def join_circle(self):
+        self.request('POST /api/circles/<id>/join', 'POST', f'/api/circles/{self.circle()}/join',
+                     {'user_id': self.user['id']})
+
+    def follow_circle(self):
+        self.request('POST /api/circles/<id>/follow', 'POST', f'/api/circles/{self.circle()}/follow',
+                     {'user_id': self.user['id']})
+
+    def get_membership(self):
+        self.request('GET /api/circles/<id>/membership', 'GET', f'/api/circles/{self.circle()}/membership',
+                     query={'user_id': self.user['id']})
+
+    def get_profile(self):
+        user_id = self.user['id'] if self.rng.random() < 0.5 else self.rng.randint(1, self.sizes['users'])
+        self.request('GET /api/users/<id>/profile', 'GET', f'/api/users/{user_id}/profile')
+
+    def get_recommendations(self):
+        self.request('GET /api/users/<id>/recommendations', 'GET', f'/api/users/{self.user["id"]}/recommendations')
+
+    def get_leaderboard(self):
+        self.request('GET /api/leaderboard', 'GET', '/api/leaderboard',
+                     query={'period': self.rng.choice(('all', 'week', 'month'))})
+
+    def get_circle_leaderboard(self):
+        self.request('GET /api/circles/<id>/leaderboard', 'GET', f'/api/circles/{self.circle()}/leaderboard')
+
+    def create_resource(self):
+        self.request('POST /api/resources', 'POST', '/api/resources', {
+            'title': ' '.join(self.rng.choices(WORDS, k=4)), 'circle_id': self.circle(),
+            'creator_id': self.user['id'], 'resource_type': 'link', 'content': 'https://example.com/load'})
+
+    def create_task(self):
+        self.request('POST /api/tasks', 'POST', '/api/tasks', {
+            'title': ' '.join(self.rng.choices(WORDS, k=3)), 'description': ' '.join(self.rng.choices(WORDS, k=10)),
+            'due_date': '2030-01-01T09:00:00', 'circle_id': self.circle()})
+
+    # (action, weight, creators only)
+    ACTIONS = [
+        (list_circles, 14, False), (search_circles, 5, False), (get_circle, 10, False),
+        (get_resources, 12, False), (get_tasks, 6, False), (get_messages, 14, False),
+        (post_message, 6, False), (view_resource, 8, False), (get_comments, 4, False),
+        (post_comment, 2, False), (complete_task, 3, False), (join_circle, 2, False),
+        (follow_circle, 1, False), (get_membership, 2, False), (get_profile, 5, False),
+        (get_recommendations, 3, False),
+        (get_leaderboard, 3, False), (get_circle_leaderboard, 2, False),
+        (create_resource, 2, True), (create_task, 1, True),
+    ]
+
+    def run(self, warmup_until, stop_at):
+        while time.perf_counter() < stop_at:
+            self.recording = time.perf_counter() >= warmup_until
+            self.log_in()
+            if self.user is None:
+                continue
+            actions = [(action, weight) for action, weight, creators_only in self.ACTIONS
+                       if not creators_only or self.user['role'] == 'creator']
+            functions, weights = zip(*actions)
+            for action in self.rng.choices(functions, weights, k=SESSION_LENGTH):
+                if time.perf_counter() >= stop_at:
+                    break
+                self.recording = time.perf_counter() >= warmup_until
+                action(self)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve(port):
+    sys.path.insert(0, REPO_ROOT)
+    import logging
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    from app import app
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    WSGIRequestHandler.protocol_version = 'HTTP/1.1'  # keep-alive, like a production server
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+
+def seed_database(sizes, seed, days):
+    """Seed a scratch SQLite database in a subprocess and return its URL."""
+    workdir = tempfile.mkdtemp(prefix='learncircle-load-')
+    database_url = 'sqlite:///' + os.path.join(workdir, 'load.db')
+    command = [sys.executable, '-m', 'benchmarks.seed', '--database-url', database_url,
+               '--seed', str(seed), '--days', str(days)]
+    for name, value in sizes.items():
+        command += [f'--{name}', str(value)]
+    print(f'seeding {database_url} ...', flush=True)
+    subprocess.run(command, cwd=REPO_ROOT, check=True, stdout=subprocess.DEVNULL)
+    return database_url
+
+
+def wait_until_ready(port, server, timeout=30):
+    """Poll until the server answers; returns seconds waited."""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if server.poll() is not None:
+            raise SystemExit(f'server exited with status {server.returncode}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/api/leaderboard')
+            if connection.getresponse().status == 200:
+                return time.perf_counter() - start
+        except OSError:
+            time.sleep(0.02)
+    server.kill()
+    raise SystemExit('server did not start')
+
+
+def start_local_server(args, sizes):
+    database_url = seed_database(sizes, args.seed, args.days)
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=database_url, PYTHONPATH=REPO_ROOT,
+               **dict(item.split('=', 1) for item in args.server_env))
+    server = subprocess.Popen([sys.executable, '-m', 'benchmarks.load', '--serve', str(port)],
+                              cwd=os.path.dirname(database_url[len('sqlite:///'):]), env=env)
+    wait_until_ready(port, server)
+    return server, f'http://127.0.0.1:{port}'
+
+
+def run_load(url, sizes, virtual_users, warmup, duration, seed):
+    """Drive `url` with the workload and return (total, per-route) stats."""
+    target = urlsplit(url)
+    start = time.perf_counter()
+    warmup_until, stop_at = start + warmup, start + warmup + duration
+    users = [VirtualUser(target.hostname, target.port or 80, sizes, random.Random(seed * 1000 + i))
+             for i in range(virtual_users)]
+    threads = [threading.Thread(target=user.run, args=(warmup_until, stop_at)) for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(users, duration)
+
+
+def git_revision():
+    def git(*command):
+        return subprocess.run(['git', *command], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+    return {'commit': git('rev-parse', '--short', 'HEAD'), 'dirty': bool(git('status', '--porcelain', '--untracked-files=no'))}
+
+
+def summarize(users, duration):
+    samples, errors = {}, {}
+    for user in users:
+        for route, latencies in user.samples.items():
+            samples.setdefault(route, []).extend(latencies)
+        for route, count in user.errors.items():
+            errors[route] = errors.get(route, 0) + count
+
+    def stats(latencies, failed):
+        latencies = sorted(latencies)
+        return {
+            'requests': len(latencies), 'errors': failed, 'throughput': len(latencies) / duration,
+            'mean': sum(latencies) / len(latencies) if latencies else 0.0,
+            'p50': percentile(latencies, 0.5), 'p90': percentile(latencies, 0.9),
+            'p99': percentile(latencies, 0.99), 'max': latencies[-1] if latencies else 0.0,
+        }
+
+    everything = [latency for latencies in samples.values() for latency in latencies]
+    return (stats(everything, sum(errors.values())),
+            {route: stats(latencies, errors.get(route, 0)) for route, latencies in sorted(samples.items())})
+
+
+def print_report(total, routes):
+    print(f'{"route":<36} {"req":>7} {"err":>5} {"req/s":>8} {"p50":>8} {"p90":>8} {"p99":>8} {"max":>8}')
+    for route, stats in list(routes.items()) + [('TOTAL', total)]:
+        print(f'{route:<36} {stats["requests"]:>7} {stats["errors"]:>5} {stats["throughput"]:>8.1f} '
+              f'{stats["p50"]:>8.2f} {stats["p90"]:>8.2f} {stats["p99"]:>8.2f} {stats["max"]:>8.1f}')
+    print('latencies in ms')
+
+
+def print_comparison(previous, current):
+    def change(before, after):
+        return f'{(after - before) / before * 100:+6.1f}%' if before else '    n/a'
+
+    print(f'\ncompared with {previous["label"]} ({previous["started_at"]}, {previous["git"]["commit"]})')
+    print(f'{"route":<36} {"req/s":>9} {"p50":>9} {"p99":>9}')
+    routes = list(current['routes'].items()) + [('TOTAL', current['total'])]
+    for route, stats in routes:
+        before = previous['total'] if route == 'TOTAL' else previous['routes'].get(route)
+        if before:
+            print(f'{route:<36} {change(before["throughput"], stats["throughput"]):>9} '
+                  f'{change(before["p50"], stats["p50"]):>9} {change(before["p99"], stats["p99"]):>9}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='benchmark a running server instead of starting one')
+    add_size_arguments(parser)
+    parser.add_argument('--virtual-users', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30, help='seconds recorded')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds run before recording')
+    parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE',
+                        help='environment for the local server, e.g. SQLITE_JOURNAL_MODE=DELETE')
+    parser.add_argument('--label', default='load', help='name for the saved result')
+    parser.add_argument('--compare', help="earlier result file, or 'latest'")
+    parser.add_argument('--no-save', action='store_true')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    sizes = sizes_from(args)
+    previous_results = sorted(glob.glob(os.path.join(RESULTS_DIR, '*.json')))
+    server = None
+    if args.url:
+        url = args.url
+    else:
+        server, url = start_local_server(args, sizes)
+
+    started_at = datetime.now()
+    print(f'{args.virtual_users} virtual users against {url}: {args.warmup:g}s warmup, {args.duration:g}s recorded',
+          flush=True)
+    try:
+        total, routes = run_load(url, sizes, args.virtual_users, args.warmup, args.duration, args.seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    print_report(total, routes)
+
+    result = {
+        'label': args.label, 'started_at': started_at.isoformat(timespec='seconds'), 'git': git_revision(),
+        'target': args.url or 'local', 'server_env': args.server_env, 'sizes': sizes, 'seed': args.seed,
+        'virtual_users': args.virtual_users, 'duration': args.duration, 'warmup': args.warmup,
+        'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+        'total': total, 'routes': routes,
+    }
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f'{started_at:%Y%m%d-%H%M%S}-{args.label}.json')
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f'saved {os.path.relpath(path, REPO_ROOT)}')
+
+    if args.compare:
+        if args.compare == 'latest':
+            if not previous_results:
+                print('no earlier results to compare with')
+                return
+            compare_path = previous_results[-1]
+        else:
+            compare_path = args.compare
+        with open(compare_path) as f:
+            print_comparison(json.load(f), result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Check that concurrent points workers apply every event exactly once.
+
+Usage:
+    python -m benchmarks.points_worker [--events 5000] [--users 10] [--processes 3] [--batch-size 200]
+
+Queues --events one-point PointsEvents for --users users in a SQLite file,
+then starts --processes processes that all run process_points_events() on
+it at the same moment, the way every server worker, the exit drain and
+'flask rebuild-points' can. Afterwards User.points must add up to the
+number of events, with one PointsHistory row per event and no event left
+unprocessed.
+Exits non-zero on any mismatch.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+from benchmarks.common import REPO_ROOT, scratch_app
+
+
+def worker(database_url, batch_size, start, results):
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    sys.path.insert(0, REPO_ROOT)
+    import app as learncircle
+    learncircle.app.config['SLOW_QUERY_THRESHOLD'] = float('inf')
+    with learncircle.app.app_context():
+        start.wait()
+        results.put(learncircle.process_points_events(batch_size))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--processes', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=200)
+    args = parser.parse_args()
+
+    learncircle = scratch_app()
+    app, db = learncircle.app, learncircle.db
+    with app.app_context():
+        db.session.execute(db.insert(learncircle.User), [
+            {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'password': 'x', 'role': 'student'}
+            for i in range(1, args.users + 1)
+        ])
+        db.session.execute(db.insert(learncircle.PointsEvent), [
+            {'user_id': i % args.users + 1, 'points': 1, 'reason': 'bench', 'idempotency_key': f'bench:{i}'}
+            for i in range(args.events)
+        ])
+        db.session.commit()
+        database_url = str(db.engine.url)
+
+    context = multiprocessing.get_context('spawn')
+    start, results = context.Event(), context.Queue()
+    processes = [context.Process(target=worker, args=(database_url, args.batch_size, start, results))
+                 for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    # Give every process time to import the app before releasing them together
+    time.sleep(2)
+    started = time.perf_counter()
+    start.set()
+    applied = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+
+    failures = sum(1 for process in processes if process.exitcode)
+    with app.app_context():
+        points = db.session.scalar(db.select(db.func.sum(learncircle.User.points)))
+        history = db.session.scalar(db.select(db.func.count()).select_from(learncircle.PointsHistory))
+        pending = learncircle.PointsEvent.query.filter(learncircle.PointsEvent.processed_at.is_(None)).count()
+    for label, value, expected in (('points', points, args.events), ('history rows', history, args.events),
+                                   ('events applied', sum(applied), args.events), ('pending events', pending, 0)):
+        if value != expected:
+            failures += 1
+            print(f'FAIL {label}={value} expected={expected}')
+
+    print(f'{args.events} events by {args.processes} processes in {elapsed:.2f}s, '
+          f'applied {" + ".join(map(str, applied))}')
+    print('every event applied once' if not failures else f'{failures} failures')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
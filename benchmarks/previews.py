@@ -0,0 +1,133 @@
+"""Time PDF uploads with previews rendered inline versus on the process pool.
+
+Usage:
+    python -m benchmarks.previews [--pdfs 40] [--pages 20] [--workers 1 2 4]
+
+Needs PyMuPDF, which also generates the PDFs: --pdfs different documents
+of --pages text pages each. The script first renders every preview inline,
+which is what each upload would have cost if the request did the work
+itself. Then, for each --workers, it uploads all of them through
+POST /api/resources/upload once the pool's processes have started,
+recording each request's latency and the time until every resource is
+'ready'. Finally it uploads them all again, when every preview is already
+in the content-hash cache.
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.common import scratch_app
+
+
+def make_pdfs(count, pages):
+    import pymupdf
+    pdfs = []
+    for i in range(count):
+        document = pymupdf.open()
+        for page_number in range(pages):
+            page = document.new_page()
+            text = f'Document {i} page {page_number}: ' + 'eigenvalues of symmetric matrices are real. ' * 40
+            page.insert_textbox(page.rect + (50, 50, -50, -50), text)
+        pdfs.append(document.tobytes())
+        document.close()
+    return pdfs
+
+
+def percentile(samples, fraction):
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def upload_all(client, pdfs, circle_id):
+    latencies, ids = [], []
+    for i, pdf in enumerate(pdfs):
+        started = time.perf_counter()
+        response = client.post('/api/resources/upload', data={
+            'file': (io.BytesIO(pdf), f'doc{i}.pdf'), 'title': f'Doc {i}', 'circle_id': str(circle_id), 'creator_id': '1'
+        })
+        latencies.append((time.perf_counter() - started) * 1000)
+        ids.append(response.json['id'])
+    return latencies, ids
+
+
+def wait_until_processed(learncircle, ids):
+    Resource = learncircle.Resource
+    while True:
+        with learncircle.app.app_context():
+            pending = Resource.query.filter(Resource.id.in_(ids), Resource.processing_status == 'pending').count()
+        if not pending:
+            return
+        time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pdfs', type=int, default=40)
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+
+    learncircle = scratch_app()
+    if not learncircle.pdf_previews_available():
+        sys.exit('PyMuPDF is needed for this benchmark: pip install pymupdf')
+    app, db = learncircle.app, learncircle.db
+    # Keep uploads and previews out of the repository
+    app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp(prefix='uploads-', dir=os.getcwd())
+    learncircle.PARTIAL_FOLDER = tempfile.mkdtemp(prefix='partial-', dir=os.getcwd())
+    with app.app_context():
+        db.session.add(learncircle.User(username='bench', email='bench@example.com', password='x', role='creator'))
+        db.session.add(learncircle.Circle(title='Bench', description='x', creator_id=1))
+        db.session.commit()
+    client = app.test_client()
+
+    started = time.perf_counter()
+    pdfs = make_pdfs(args.pdfs, args.pages)
+    print(f'made {args.pdfs} PDFs of {args.pages} pages, {sum(map(len, pdfs)) / len(pdfs) / 1024:.0f}KB each, '
+          f'in {time.perf_counter() - started:.1f}s; {os.cpu_count()} CPUs')
+
+    inline = []
+    workdir = tempfile.mkdtemp(dir=os.getcwd())
+    for i, pdf in enumerate(pdfs):
+        source = os.path.join(workdir, f'{i}.pdf')
+        with open(source, 'wb') as f:
+            f.write(pdf)
+        started = time.perf_counter()
+        learncircle.render_pdf_preview(source, source + '.png', source + '.txt', app.config['PREVIEW_THUMBNAIL_WIDTH'],
+                                       app.config['PREVIEW_TEXT_MAX_PAGES'], app.config['PREVIEW_TEXT_MAX_CHARS'])
+        inline.append((time.perf_counter() - started) * 1000)
+    print(f'{"mode":<16} {"upload p50":>11} {"upload p95":>11} {"all ready":>10} {"PDFs/s":>7}')
+    print(f'{"inline":<16} {statistics.median(inline):>9.1f}ms {percentile(inline, 0.95):>9.1f}ms '
+          f'{sum(inline) / 1000:>9.2f}s {len(inline) / sum(inline) * 1000:>7.1f}')
+
+    for workers in args.workers:
+        if learncircle.preview_executor is not None:
+            learncircle.preview_executor.shutdown()
+            learncircle.preview_executor = None
+        app.config['PREVIEW_WORKERS'] = workers
+        learncircle.PREVIEW_FOLDER = tempfile.mkdtemp(prefix='previews-', dir=os.getcwd())
+        # Start every worker first; each one imports the app
+        started = time.perf_counter()
+        list(learncircle.preview_pool().map(time.sleep, [0.2] * workers))
+        startup = time.perf_counter() - started
+        started = time.perf_counter()
+        latencies, ids = upload_all(client, pdfs, 1)
+        wait_until_processed(learncircle, ids)
+        elapsed = time.perf_counter() - started
+        print(f'{f"pool, {workers} workers":<16} {statistics.median(latencies):>9.1f}ms '
+              f'{percentile(latencies, 0.95):>9.1f}ms {elapsed:>9.2f}s {len(ids) / elapsed:>7.1f}  '
+              f'(workers started in {startup:.1f}s)')
+
+    started = time.perf_counter()
+    latencies, ids = upload_all(client, pdfs, 1)
+    wait_until_processed(learncircle, ids)
+    elapsed = time.perf_counter() - started
+    print(f'{"cached":<16} {statistics.median(latencies):>9.1f}ms {percentile(latencies, 0.95):>9.1f}ms '
+          f'{elapsed:>9.2f}s {len(ids) / elapsed:>7.1f}')
+    learncircle.preview_executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Query-count regression check for the list endpoints.
+
+Usage:
+    python -m benchmarks.query_counts
+
+Seeds a scratch database at two sizes and counts the SQL statements each
+endpoint issues. The count must match EXPECTED at every size; a mismatch
+(usually an N+1 creeping back in) exits non-zero.
+"""
+import sys
+from contextlib import contextmanager
+
+from benchmarks.common import scratch_app
+
+# endpoint name -> SQL statements per request, independent of row count
+EXPECTED = {
+    'circles': 1,
+    'circles_search': 1,
+    'get_circle': 1,
+    'get_circle_resources': 1,
+    'get_circle_tasks': 1,
+    'get_comments': 1,
+    'circle_messages': 1,
+    'get_profile': 1,
+}
+
+
+@contextmanager
+def count_statements(engine):
+    from sqlalchemy import event
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def seed(learncircle, rows):
+    """Add `rows` users, each joining, posting, commenting and completing once."""
+    db = learncircle.db
+    circle = learncircle.Circle.query.first()
+    resource = learncircle.Resource.query.first()
+    task = learncircle.Task.query.first()
+    start = learncircle.User.query.count()
+    for i in range(start, start + rows):
+        user = learncircle.User(username=f'user{i}', email=f'user{i}@example.com', password='x', role='student')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add_all([
+            learncircle.CircleMember(user_id=user.id, circle_id=circle.id, is_following=True),
+            learncircle.Circle(title=f'Circle {i}', description='python notes', tags='python', creator_id=user.id),
+            learncircle.Resource(title=f'Notes {i}', circle_id=circle.id, creator_id=user.id,
+                                 resource_type='link', content='https://example.com'),
+            learncircle.TaskCompletion(task_id=task.id, user_id=user.id),
+            learncircle.Comment(text='thanks', user_id=user.id, resource_id=resource.id),
+            learncircle.Message(text='hello', user_id=user.id, circle_id=circle.id),
+        ])
+    db.session.commit()
+
+
+def measure(learncircle, client):
+    circle_id = learncircle.Circle.query.first().id
+    resource_id = learncircle.Resource.query.first().id
+    urls = {
+        'circles': '/api/circles',
+        'circles_search': '/api/circles?search=python',
+        'get_circle': f'/api/circles/{circle_id}',
+        'get_circle_resources': f'/api/circles/{circle_id}/resources',
+        'get_circle_tasks': f'/api/circles/{circle_id}/tasks',
+        'get_comments': f'/api/resources/{resource_id}/comments',
+        'circle_messages': f'/api/circles/{circle_id}/messages',
+        'get_profile': f'/api/users/{learncircle.User.query.order_by(learncircle.User.id.desc()).first().id}/profile',
+    }
+    counts = {}
+    for name, url in urls.items():
+        learncircle.db.session.expunge_all()
+        with count_statements(learncircle.db.engine) as statements:
+            response = client.get(url)
+        assert response.status_code == 200, (url, response.status_code)
+        counts[name] = len(statements)
+    return counts
+
+
+def main():
+    learncircle = scratch_app()
+    db = learncircle.db
+    # Measure the handlers, not the response cache; seeding bypasses the
+    # write endpoints that would invalidate it
+    learncircle.app.config['CACHE_TTL'] = 0
+    failures = 0
+    with learncircle.app.app_context():
+        creator = learncircle.User(username='creator', email='creator@example.com', password='x', role='creator')
+        db.session.add(creator)
+        db.session.flush()
+        circle = learncircle.Circle(title='Python', description='python', tags='python', creator_id=creator.id)
+        db.session.add(circle)
+        db.session.flush()
+        db.session.add_all([
+            learncircle.Resource(title='Intro', circle_id=circle.id, creator_id=creator.id,
+                                 resource_type='link', content='https://example.com'),
+            learncircle.Task(title='Exercise', description='do it', due_date=circle.created_at,
+                             circle_id=circle.id),
+        ])
+        db.session.commit()
+
+        client = learncircle.app.test_client()
+        for rows in (5, 50):
+            seed(learncircle, rows)
+            for name, count in measure(learncircle, client).items():
+                ok = count == EXPECTED[name]
+                failures += not ok
+                print(f'{"ok  " if ok else "FAIL"} {name:<22} rows+={rows:<3} statements={count} expected={EXPECTED[name]}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Time task reminders and overdue digests for one very large circle.
+
+Usage:
+    python -m benchmarks.reminders [--members 100000] [--tasks 10] [--completed 0.3]
+                                   [--batch-sizes 1000 10000] [--naive-sample 500]
+
+Builds a circle with --members members, --tasks tasks due within the
+hour and --tasks tasks that went overdue yesterday. Each member has
+already completed a --completed share of them. For every batch size, the
+script times the scheduler run that sends the reminders and the digests,
+then repeats it under tracemalloc to record peak Python memory. The last
+line extrapolates a per-user scan from --naive-sample members: queries
+per member for the tasks in their circles and their completions, reading
+only, without writing anything.
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from benchmarks.common import scratch_app
+
+
+def build(learncircle, members, tasks, completed, rng):
+    db = learncircle.db
+    now = datetime.utcnow()
+    db.session.execute(db.insert(learncircle.User), [
+        {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'password': 'x', 'role': 'student'}
+        for i in range(1, members + 2)
+    ])
+    db.session.execute(db.insert(learncircle.Circle), [{'id': 1, 'title': 'Huge', 'description': 'x',
+                                                       'creator_id': members + 1, 'member_count': members}])
+    db.session.execute(db.insert(learncircle.CircleMember), [
+        {'user_id': i, 'circle_id': 1, 'is_member': True, 'is_following': False} for i in range(1, members + 1)
+    ])
+    due = [now + timedelta(minutes=rng.randint(1, 59)) for _ in range(tasks)]
+    overdue = [now - timedelta(hours=rng.randint(20, 30)) for _ in range(tasks)]
+    db.session.execute(db.insert(learncircle.Task), [
+        {'id': i, 'title': f'Task {i}', 'description': 'x', 'circle_id': 1, 'due_date': when}
+        for i, when in enumerate(due + overdue, start=1)
+    ])
+    db.session.execute(db.insert(learncircle.TaskCompletion), [
+        {'task_id': task_id, 'user_id': user_id}
+        for task_id in range(1, 2 * tasks + 1) for user_id in range(1, members + 1) if rng.random() < completed
+    ])
+    db.session.commit()
+
+
+def naive_scan(learncircle, user_ids, now, lead):
+    # What a per-user job does: that user's circles, their tasks, their completions
+    db, Task = learncircle.db, learncircle.Task
+    for user_id in user_ids:
+        circle_ids = [c for (c,) in db.session.query(learncircle.CircleMember.circle_id).filter_by(user_id=user_id)]
+        tasks = Task.query.filter(Task.circle_id.in_(circle_ids), Task.due_date <= now + lead).all()
+        done = {t for (t,) in db.session.query(learncircle.TaskCompletion.task_id).filter_by(user_id=user_id)}
+        [task for task in tasks if task.id not in done]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--members', type=int, default=100_000)
+    parser.add_argument('--tasks', type=int, default=10)
+    parser.add_argument('--completed', type=float, default=0.3)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--naive-sample', type=int, default=500)
+    args = parser.parse_args()
+
+    learncircle = scratch_app()
+    app, db = learncircle.app, learncircle.db
+    app.config['SLOW_QUERY_THRESHOLD'] = float('inf')  # the bulk inserts would be reported
+    app.config['OVERDUE_DIGEST_HOUR'] = 0
+    with app.app_context():
+        started = time.perf_counter()
+        build(learncircle, args.members, args.tasks, args.completed, random.Random(1))
+        print(f'built {args.members:,} members x {2 * args.tasks} tasks in {time.perf_counter() - started:.1f}s')
+
+        print(f'{"batch size":>10} {"notifications":>14} {"seconds":>8} {"per sec":>9} {"peak memory":>12}')
+
+        def run(batch_size):
+            db.session.execute(db.delete(learncircle.Notification))
+            db.session.commit()
+            app.config['NOTIFICATION_BATCH_SIZE'] = batch_size
+            learncircle.reminder_queue = learncircle.ReminderQueue(app.config['REMINDER_BUCKET'])
+            started = time.perf_counter()
+            sent = learncircle.run_reminders()
+            return sent, time.perf_counter() - started
+
+        for batch_size in args.batch_sizes:
+            sent, elapsed = run(batch_size)
+            # tracemalloc slows allocation down several times, so memory gets a run of its own
+            tracemalloc.start()
+            run(batch_size)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f'{batch_size:>10} {sent:>14,} {elapsed:>8.2f} {sent / elapsed:>9,.0f} {peak / 2 ** 20:>10.1f}MB')
+
+        sample = list(range(1, min(args.naive_sample, args.members) + 1))
+        started = time.perf_counter()
+        naive_scan(learncircle, sample, datetime.utcnow(), timedelta(seconds=app.config['REMINDER_LEAD_TIME']))
+        per_user = (time.perf_counter() - started) / len(sample)
+        print(f'per-user scan: {per_user * 1000:.2f}ms per member, '
+              f'about {per_user * args.members:.0f}s for {args.members:,} members')
+
+
+if __name__ == '__main__':
+    main()
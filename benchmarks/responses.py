@@ -0,0 +1,113 @@
+"""Measure bytes on the wire and encoding CPU for the chat and resource lists.
+
+Usage:
+    python -m benchmarks.responses [--users 20] [--limits 50 200] [--runs 200]
+
+Fills one circle with PAGE_SIZE_MAX messages and resources from --users
+members. For each page size it prints:
+
+- the body size in the row format (one object per item) and with
+  ?format=columns, sent as it is, gzipped, and brotli-compressed (when the
+  brotli package is installed);
+- the time to encode one page with the json module and with orjson, and
+  to compress it;
+- the median time of the whole request through the test client, for each
+  serializer, format and encoding.
+
+The response cache is disabled, so every request builds its body.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from benchmarks.common import scratch_app
+
+WORDS = ('matrix eigenvalue proof lemma graph vector kernel basis span rank norm limit series integral '
+         'derivative gradient tensor field ring group module prime').split()
+
+
+def build(learncircle, users, count, rng):
+    db = learncircle.db
+    db.session.execute(db.insert(learncircle.User), [
+        {'id': i, 'username': f'{rng.choice(WORDS)}_{rng.choice(WORDS)}{i}', 'email': f'user{i}@example.com',
+         'password': 'x', 'role': 'student'}
+        for i in range(1, users + 1)
+    ])
+    db.session.execute(db.insert(learncircle.Circle), [{'id': 1, 'title': 'Linear algebra', 'description': 'x',
+                                                       'creator_id': 1}])
+    db.session.execute(db.insert(learncircle.Message), [
+        {'text': ' '.join(rng.choices(WORDS, k=rng.randint(4, 30))), 'user_id': rng.randint(1, users), 'circle_id': 1}
+        for _ in range(count)
+    ])
+    db.session.execute(db.insert(learncircle.Resource), [
+        {'title': ' '.join(rng.choices(WORDS, k=rng.randint(2, 6))).title(), 'circle_id': 1,
+         'creator_id': rng.randint(1, users), 'resource_type': 'link', 'view_count': rng.randint(0, 500),
+         'content': f'https://example.com/notes/{rng.choice(WORDS)}-{i}'}
+        for i in range(count)
+    ])
+    db.session.commit()
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--limits', type=int, nargs='+', default=[50, 200])
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    learncircle = scratch_app()
+    app = learncircle.app
+    app.config['CACHE_TTL'] = 0
+    from flask.json.provider import DefaultJSONProvider
+    providers = {'json': DefaultJSONProvider(app)}
+    if app.config['JSON_SERIALIZER'] == 'orjson':
+        providers['orjson'] = learncircle.OrjsonProvider(app)
+    encodings = [None] + app.config['COMPRESS_ENCODINGS'][::-1]
+    with app.app_context():
+        build(learncircle, args.users, app.config['PAGE_SIZE_MAX'], random.Random(7))
+    client = app.test_client()
+
+    def line(label, cells):
+        print(f'  {label:<24}' + ''.join(f'{cell:>10}' for cell in cells))
+
+    for endpoint in ('messages', 'resources'):
+        for limit in args.limits:
+            url = f'/api/circles/1/{endpoint}?limit={limit}'
+            print(f'{endpoint}, {limit} per page')
+            line('', [encoding or 'identity' for encoding in encodings])
+            for shape in ('rows', 'columns'):
+                sizes = [len(client.get(f'{url}&format={shape}', headers={'Accept-Encoding': encoding or 'identity'}).data)
+                         for encoding in encodings]
+                line(f'bytes, {shape}', [f'{size:,}' for size in sizes])
+
+            for shape in ('rows', 'columns'):
+                with app.test_request_context(f'{url}&format={shape}'):
+                    payload = client.get(f'{url}&format={shape}').json
+                    for name, provider in providers.items():
+                        micros = timed(lambda: provider.response(payload), args.runs)
+                        line(f'encode, {shape}, {name}', [f'{micros:.0f}us'])
+                    body = providers['json'].response(payload).get_data()
+                    micros = [timed(lambda: learncircle.compress(body, encoding), args.runs)
+                              for encoding in encodings[1:]]
+                    line(f'compress, {shape}', [''] + [f'{m:.0f}us' for m in micros])
+
+            for name, provider in providers.items():
+                app.json = provider
+                for shape in ('rows', 'columns'):
+                    micros = [timed(lambda: client.get(f'{url}&format={shape}',
+                                                       headers={'Accept-Encoding': encoding or 'identity'}), args.runs)
+                              for encoding in encodings]
+                    line(f'request, {shape}, {name}', [f'{m:.0f}us' for m in micros])
+
+if __name__ == '__main__':
+    main()
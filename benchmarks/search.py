@@ -0,0 +1,109 @@
+"""Compare circle search latency: FTS5 and tag indexes vs the old LIKE scan.
+
+Usage:
+    python -m benchmarks.search [--sizes 10000 100000 1000000] [--runs 20]
+
+Runs against a throwaway SQLite database. The circle table is grown in
+steps so each size reuses the rows inserted for the previous one.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from benchmarks.common import scratch_app
+
+WORDS = ('python java javascript rust go sql algebra calculus physics chemistry '
+         'biology history drawing music guitar spanish french writing design '
+         'statistics machine learning data web mobile cloud security').split()
+
+# Filler vocabulary so descriptions look like prose rather than tag soup
+FILLER = [''.join(random.Random(i).choices('abcdefghijklmnopqrstuvwxyz', k=7)) for i in range(5000)]
+
+QUERIES = [('python', ()), ('mach', ()), ('calculus physics', ()), ('', ('java',)),
+           ('web', ('javascript',)), (FILLER[7], ())]
+
+
+def random_circle(i, creator_id):
+    words = random.sample(WORDS, 6)
+    return {
+        'title': f'{words[0].title()} {words[1]} circle {i}',
+        'description': ' '.join(random.choices(FILLER, k=30) + words[:2]),
+        'tags': ', '.join(words[2:5]),
+        'creator_id': creator_id,
+        'privacy': 'public',
+    }
+
+
+def like_query(search, tags):
+    from app import Circle, db
+    circles = Circle.query.filter(Circle.privacy == 'public')
+    if search:
+        circles = circles.filter(db.or_(
+            Circle.title.ilike(f'%{search}%'),
+            Circle.tags.ilike(f'%{search}%'),
+            Circle.description.ilike(f'%{search}%'),
+        ))
+    for tag in tags:
+        circles = circles.filter(Circle.tags.ilike(f'%{tag}%'))
+    return circles
+
+
+def fts_query(search, tags):
+    from app import CIRCLE_FTS_WEIGHTS, Circle, build_fts_query, circle_fts, db, with_tags
+    circles = with_tags(Circle.query.filter(Circle.privacy == 'public'), tags)
+    if not search:
+        return circles.order_by(Circle.created_at.desc(), Circle.id.desc())
+    rank = db.func.bm25(db.literal_column('circle_fts'), *CIRCLE_FTS_WEIGHTS)
+    return circles.join(circle_fts, circle_fts.c.rowid == Circle.id).filter(
+        db.text('circle_fts MATCH :match').bindparams(match=build_fts_query(search))
+    ).order_by(rank)
+
+
+def time_query(build, runs, limit):
+    samples = []
+    for _ in range(runs):
+        for search, tags in QUERIES:
+            start = time.perf_counter()
+            query = build(search, tags)
+            if limit:
+                query = query.limit(limit)
+            query.all()
+            samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=0,
+                        help='cap on rows fetched per query (default: all, like the endpoint)')
+    args = parser.parse_args()
+
+    scratch_app()
+    from app import Circle, User, app, db, rebuild_tags
+
+    random.seed(42)
+    with app.app_context():
+        creator = User(username='bench', email='bench@example.com', password='x', role='creator')
+        db.session.add(creator)
+        db.session.commit()
+
+        print(f'{"circles":>10} {"LIKE p50":>10} {"LIKE p99":>10} {"FTS p50":>10} {"FTS p99":>10}')
+        count = 0
+        for size in sorted(args.sizes):
+            rows = [random_circle(i, creator.id) for i in range(count, size)]
+            db.session.execute(db.insert(Circle), rows)
+            db.session.commit()
+            rebuild_tags()
+            count = size
+
+            like_p50, like_p99 = time_query(like_query, args.runs, args.limit)
+            fts_p50, fts_p99 = time_query(fts_query, args.runs, args.limit)
+            print(f'{size:>10} {like_p50:>8.2f}ms {like_p99:>8.2f}ms {fts_p50:>8.2f}ms {fts_p99:>8.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""Fill a database with realistic synthetic data.
+
+Usage:
+    python -m benchmarks.seed --database-url sqlite:////tmp/load.db [--scale medium]
+                              [--users N] [--circles N] [--messages N] ... [--seed 1]
+
+Generates every model in app.py: users, circles, memberships and follows,
+resources, tasks, task completions, comments, messages and the points
+history their actions earned. It then rebuilds points and leaderboards
+from that history. Circle popularity is Zipf-like, so a few circles are
+large and most are small. Chat and comment activity follows membership.
+The same --seed always produces the same data.
+
+Every seeded account has the password 'password'. Usernames are user1,
+user2, ...; the first ones are the creators.
+The target database must be empty; its schema is created if missing.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from benchmarks.common import scratch_app
+
+SCALES = {
+    'small': {'users': 200, 'circles': 20, 'resources': 400, 'tasks': 200,
+              'messages': 5000, 'comments': 1000},
+    'medium': {'users': 5000, 'circles': 500, 'resources': 10000, 'tasks': 5000,
+               'messages': 200000, 'comments': 30000},
+    'large': {'users': 50000, 'circles': 5000, 'resources': 100000, 'tasks': 50000,
+              'messages': 2000000, 'comments': 300000},
+}
+
+TOPICS = ['python', 'javascript', 'rust', 'sql', 'calculus', 'statistics', 'physics', 'chemistry',
+          'biology', 'history', 'spanish', 'french', 'design', 'music', 'writing', 'economics',
+          'machine-learning', 'algorithms', 'networking', 'security']
+WORDS = ('study notes chapter review exercise practice question answer exam deadline lecture '
+         'summary problem solution example proof theorem project reading group session week '
+         'help explain understand concept topic guide tutorial video slides quiz homework').split()
+
+# Points awarded by the routes, mirrored so the history looks like real use
+JOIN_POINTS, FOLLOW_POINTS, COMPLETION_POINTS, VIEW_POINTS = 5, 10, 15, 5
+
+CHUNK_SIZE = 10000
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def insert(db, model, rows):
+    """executemany `rows` (any iterable of dicts) in chunks; returns the row count."""
+    count, chunk = 0, []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            db.session.execute(db.insert(model), chunk)
+            count, chunk = count + len(chunk), []
+    if chunk:
+        db.session.execute(db.insert(model), chunk)
+        count += len(chunk)
+    return count
+
+
+def seed(learncircle, users, circles, resources, tasks, messages, comments, days=90, seed_value=1):
+    """Insert the synthetic data set and return the number of rows per table."""
+    db = learncircle.db
+    if db.session.query(learncircle.User.id).first() is not None:
+        raise SystemExit('The target database already has users; seed an empty database')
+
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    start = now - timedelta(days=days)
+
+    def moment(after=start):
+        return after + (now - after) * rng.random()
+
+    password = learncircle.generate_password_hash('password')
+    creators = max(1, min(users, circles // 2 or 1))
+    user_created = {i: moment() for i in range(1, users + 1)}
+    counts = {}
+    counts['user'] = insert(db, learncircle.User, (
+        {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'password': password,
+         'role': 'creator' if i <= creators else 'student', 'points': 0, 'badges': '',
+         'reputation_level': 1, 'completed_tasks_count': 0, 'created_at': user_created[i]}
+        for i in range(1, users + 1)
+    ))
+
+    circle_ids = range(1, circles + 1)
+    circle_rows = []
+    for i in circle_ids:
+        topics = rng.sample(TOPICS, rng.randint(1, 3))
+        creator_id = rng.randint(1, creators)
+        circle_rows.append({
+            'id': i, 'title': f'{topics[0].replace("-", " ").title()} {sentence(rng, 2)}',
+            'description': sentence(rng, 12), 'tags': ','.join(topics), 'creator_id': creator_id,
+            'privacy': 'private' if rng.random() < 0.1 else 'public',
+            'member_count': 0, 'follower_count': 0, 'created_at': moment(user_created[creator_id]),
+        })
+    # Popularity falls off with rank, so a few circles hold most members
+    popularity = [1 / rank ** 1.1 for rank in circle_ids]
+    rng.shuffle(popularity)
+    popularity = list(accumulate(popularity))
+
+    members = {i: [] for i in circle_ids}
+    member_rows, history = [], []
+    for user_id in range(1, users + 1):
+        for circle_id in set(rng.choices(circle_ids, cum_weights=popularity, k=rng.randint(1, 6))):
+            circle = circle_rows[circle_id - 1]
+            if circle['creator_id'] == user_id:
+                continue
+            is_member = rng.random() < 0.9
+            is_following = not is_member or rng.random() < 0.5
+            when = moment(max(circle['created_at'], user_created[user_id]))
+            member_rows.append({'user_id': user_id, 'circle_id': circle_id, 'is_member': is_member,
+                                'is_following': is_following, 'joined_at': when})
+            if is_member:
+                members[circle_id].append(user_id)
+                circle['member_count'] += 1
+                history.append((circle['creator_id'], JOIN_POINTS, f'New member joined {circle["title"]}',
+                                circle_id, when))
+            if is_following:
+                circle['follower_count'] += 1
+                history.append((circle['creator_id'], FOLLOW_POINTS, f'New follower on {circle["title"]}',
+                                circle_id, when))
+    counts['circle'] = insert(db, learncircle.Circle, circle_rows)
+    counts['circle_member'] = insert(db, learncircle.CircleMember, member_rows)
+
+    # Content and chat go to circles in proportion to their size, and are
+    # written by their members (or the creator of an empty circle)
+    by_size = list(accumulate(len(members[i]) + 1 for i in circle_ids))
+
+    def author(circle):
+        return rng.choice(members[circle['id']]) if members[circle['id']] else circle['creator_id']
+
+    resource_rows = []
+    for i, circle in enumerate(rng.choices(circle_rows, cum_weights=by_size, k=resources), start=1):
+        resource_type = rng.choice(('link', 'link', 'video', 'pdf'))
+        resource = {
+            'id': i, 'title': sentence(rng, 4), 'circle_id': circle['id'], 'creator_id': circle['creator_id'],
+            'resource_type': resource_type,
+            'content': f'{i:064x}.pdf' if resource_type == 'pdf' else f'https://example.com/{resource_type}/{i}',
+            'upload_date': moment(circle['created_at']), 'view_count': int(rng.paretovariate(1.2)) - 1,
+        }
+        resource_rows.append(resource)
+        for milestone in range(1, resource['view_count'] // 10 + 1):
+            history.append((circle['creator_id'], VIEW_POINTS,
+                            f'Resource "{resource["title"]}" reached {milestone * 10} views',
+                            circle['id'], moment(resource['upload_date'])))
+    counts['resource'] = insert(db, learncircle.Resource, resource_rows)
+
+    # Tasks are spread evenly: a big circle has more completions per task, not more tasks
+    task_rows, completion_rows, completions_per_user = [], [], {}
+    for i, circle in enumerate(rng.choices(circle_rows, k=tasks), start=1):
+        created = moment(circle['created_at'])
+        task = {'id': i, 'title': sentence(rng, 3), 'description': sentence(rng, 10), 'circle_id': circle['id'],
+                'due_date': created + timedelta(days=rng.randint(1, 30)), 'created_at': created,
+                'completion_count': 0}
+        for user_id in members[circle['id']]:
+            if rng.random() < 0.2:
+                when = moment(created)
+                completion_rows.append({'task_id': i, 'user_id': user_id, 'completion_date': when})
+                task['completion_count'] += 1
+                completions_per_user[user_id] = completions_per_user.get(user_id, 0) + 1
+                history.append((circle['creator_id'], COMPLETION_POINTS,
+                                f'Student completed task "{task["title"]}"', circle['id'], when))
+        task_rows.append(task)
+    counts['task'] = insert(db, learncircle.Task, task_rows)
+    counts['task_completion'] = insert(db, learncircle.TaskCompletion, completion_rows)
+    if completions_per_user:
+        user_table = learncircle.User.__table__
+        db.session.execute(
+            user_table.update().where(user_table.c.id == db.bindparam('user_id')).values(
+                completed_tasks_count=db.bindparam('count')
+            ),
+            [{'user_id': user_id, 'count': count} for user_id, count in completions_per_user.items()]
+        )
+
+    # Popular resources get the comments
+    commented = rng.choices(resource_rows, cum_weights=list(accumulate(r['view_count'] + 1 for r in resource_rows)),
+                            k=comments) if resource_rows else []
+    counts['comment'] = insert(db, learncircle.Comment, (
+        {'text': sentence(rng, rng.randint(3, 20)), 'user_id': author(circle_rows[r['circle_id'] - 1]),
+         'resource_id': r['id'], 'timestamp': moment(r['upload_date'])}
+        for r in commented
+    ))
+
+    # Messages in timestamp order, so ids rise with time as they do in use
+    message_times = sorted(moment() for _ in range(messages))
+    counts['message'] = insert(db, learncircle.Message, (
+        {'text': sentence(rng, rng.randint(2, 25)), 'user_id': author(circle), 'circle_id': circle['id'],
+         'timestamp': when}
+        for circle, when in zip(rng.choices(circle_rows, cum_weights=by_size, k=messages), message_times)
+    ))
+
+    counts['points_history'] = insert(db, learncircle.PointsHistory, (
+        {'user_id': user_id, 'points': points, 'reason': reason[:200], 'circle_id': circle_id, 'timestamp': when}
+        for user_id, points, reason, circle_id, when in history
+    ))
+    db.session.commit()
+    counts['tag'] = learncircle.rebuild_tags()
+    learncircle.rebuild_points()
+    counts['circle_similarity'] = learncircle.rebuild_recommendations()
+    return counts
+
+
+def add_size_arguments(parser):
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    for name in SCALES['small']:
+        parser.add_argument(f'--{name}', type=int, help=f'override the number of {name} for --scale')
+    parser.add_argument('--days', type=int, default=90, help='spread activity over this many days')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+
+
+def sizes_from(args):
+    sizes = dict(SCALES[args.scale])
+    for name in sizes:
+        if getattr(args, name) is not None:
+            sizes[name] = getattr(args, name)
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True, help='SQLAlchemy URL of an empty database')
+    add_size_arguments(parser)
+    args = parser.parse_args()
+
+    learncircle = scratch_app(args.database_url)
+    learncircle.app.config['SLOW_QUERY_THRESHOLD'] = float('inf')  # every bulk insert would be reported
+    started = time.perf_counter()
+    with learncircle.app.app_context():
+        counts = seed(learncircle, days=args.days, seed_value=args.seed, **sizes_from(args))
+        learncircle.db.engine.dispose()
+    for table, count in counts.items():
+        print(f'{table:<16} {count:>10,}')
+    print(f'seeded in {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Compare ways of serving app.py: startup time, throughput and slow clients.
+
+Usage:
+    python -m benchmarks.serving [--modes app.run,gunicorn-gevent] [--virtual-users 16]
+                                 [--duration 20] [--slow-clients 400] [--scale small]
+
+Modes:
+    app.run           `python app.py`: Flask's debug server with the reloader
+    werkzeug          threaded werkzeug server without debug (as benchmarks.load uses)
+    gunicorn-gthread  gunicorn.conf.py with WORKER_CLASS=gthread
+    gunicorn-gevent   gunicorn.conf.py as shipped
+
+Each mode gets a copy of the same seeded database. The script measures the
+time from launch to the first answered request, then runs the
+benchmarks.load workload. It then opens --slow-clients connections that
+hold the server without finishing: half are chat streams, and half are
+upload chunks that send a few bytes and stall. With those open it runs
+the workload again. A server that gives each connection a thread or a
+worker slot slows down or stops answering; an event-loop server should not.
+"""
+import argparse
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import REPO_ROOT
+from benchmarks.load import free_port, run_load, seed_database, wait_until_ready
+from benchmarks.seed import add_size_arguments, sizes_from
+
+MODES = {
+    'app.run': lambda port: ([sys.executable, os.path.join(REPO_ROOT, 'app.py')], {}),
+    'werkzeug': lambda port: ([sys.executable, '-m', 'benchmarks.load', '--serve', str(port)], {}),
+    'gunicorn-gthread': lambda port: ([sys.executable, '-m', 'gunicorn', 'app:app'],
+                                      {'BIND': f'127.0.0.1:{port}', 'WORKER_CLASS': 'gthread'}),
+    'gunicorn-gevent': lambda port: ([sys.executable, '-m', 'gunicorn', 'app:app'],
+                                     {'BIND': f'127.0.0.1:{port}'}),
+}
+
+
+def open_slow_clients(port, count):
+    """Open `count` connections that never finish; returns their sockets."""
+    sockets = []
+    for i in range(count):
+        sock = socket.create_connection(('127.0.0.1', port), timeout=10)
+        if i % 2 == 0:
+            # A chat stream: the response never ends
+            request = f'GET /api/circles/{i % 10 + 1}/messages/stream HTTP/1.1\r\nHost: bench\r\n\r\n'
+        else:
+            # An upload chunk whose body stops after 16 of its 1 MB
+            request = ('PUT /api/uploads/slowclient HTTP/1.1\r\nHost: bench\r\n'
+                       'Content-Range: bytes 0-1048575/1048576\r\nContent-Length: 1048576\r\n\r\n' + 'x' * 16)
+        sock.sendall(request.encode())
+        sockets.append(sock)
+    return sockets
+
+
+def measure(mode, database_path, args, sizes):
+    workdir = tempfile.mkdtemp(prefix=f'learncircle-{mode}-')
+    database = os.path.join(workdir, 'serving.db')
+    # The seeded database is in WAL mode, so recent pages may still be in its -wal file
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(database_path + suffix):
+            shutil.copy(database_path + suffix, database + suffix)
+    # app.run always listens on 5000
+    port = 5000 if mode == 'app.run' else free_port()
+    command, overrides = MODES[mode](port)
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{database}', PYTHONPATH=REPO_ROOT, SECRET_KEY='benchmark',
+               **overrides)
+    started = time.perf_counter()
+    server = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                              start_new_session=True)
+    try:
+        wait_until_ready(port, server, timeout=60)
+        startup = time.perf_counter() - started
+        url = f'http://127.0.0.1:{port}'
+        idle, _ = run_load(url, sizes, args.virtual_users, args.warmup, args.duration, args.seed)
+        slow = open_slow_clients(port, args.slow_clients)
+        try:
+            loaded, _ = run_load(url, sizes, args.virtual_users, args.warmup, args.duration, args.seed)
+        finally:
+            for sock in slow:
+                sock.close()
+    finally:
+        # The reloader and gunicorn both run child processes, so signal the whole group
+        os.killpg(server.pid, signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(server.pid, signal.SIGKILL)
+    return startup, idle, loaded
+
+
+def columns(stats):
+    if not stats['requests']:
+        return f'{"no responses":>23} {stats["errors"]:>6}'
+    return f'{stats["throughput"]:>7.1f} {stats["p50"]:>7.1f} {stats["p99"]:>8.1f} {stats["errors"]:>6}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', default=','.join(MODES), help='comma-separated, from: ' + ', '.join(MODES))
+    parser.add_argument('--virtual-users', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20, help='seconds recorded per run')
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--slow-clients', type=int, default=400)
+    add_size_arguments(parser)
+    args = parser.parse_args()
+
+    sizes = sizes_from(args)
+    database_path = seed_database(sizes, args.seed, args.days)[len('sqlite:///'):]
+
+    print(f'{"mode":<18} {"startup":>8} | {"req/s":>7} {"p50":>7} {"p99":>8} {"errors":>6} | '
+          f'with {args.slow_clients} slow clients: {"req/s":>7} {"p50":>7} {"p99":>8} {"errors":>6}')
+    for mode in args.modes.split(','):
+        startup, idle, loaded = measure(mode, database_path, args, sizes)
+        print(f'{mode:<18} {startup:>7.2f}s | {columns(idle)} | {"":>27}{columns(loaded)}', flush=True)
+    print('latencies in ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Compare tag filtering through the tag index with the old LIKE scan, and time autocomplete.
+
+Usage:
+    python -m benchmarks.tags [--sizes 10000 100000] [--runs 20]
+
+Runs against a throwaway SQLite database. Circles get 1-4 tags from a
+vocabulary where some names contain others ("java" and "javascript", "go"
+and "django"), so the LIKE filter's false positives show up in the
+result counts.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from benchmarks.common import scratch_app
+
+TAGS = ['java', 'javascript', 'go', 'golang', 'django', 'python', 'rust', 'sql', 'mysql', 'postgresql',
+        'c', 'c++', 'r', 'ruby', 'art', 'machine learning', 'deep learning', 'calculus', 'physics',
+        'chemistry', 'music', 'design', 'web', 'security']
+FILTERS = ['java', 'go', 'sql', 'r', 'machine learning']
+PREFIXES = ['j', 'go', 'p', 'mach', 'x']
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    learncircle = scratch_app()
+    learncircle.app.config['SLOW_QUERY_THRESHOLD'] = float('inf')  # the bulk inserts would be reported
+    from app import Circle, Tag, User, app, db, prefix_range, rebuild_tags, with_tags
+
+    rng = random.Random(42)
+    with app.app_context():
+        creator = User(username='bench', email='bench@example.com', password='x', role='creator')
+        db.session.add(creator)
+        db.session.commit()
+
+        count = 0
+        for size in sorted(args.sizes):
+            db.session.execute(db.insert(Circle), [
+                {'title': f'Circle {i}', 'description': 'x', 'tags': ', '.join(rng.sample(TAGS, rng.randint(1, 4))),
+                 'creator_id': creator.id, 'privacy': 'public'}
+                for i in range(count, size)
+            ])
+            db.session.commit()
+            rebuild_tags()
+            count = size
+
+            print(f'{size} circles')
+            print(f'  {"tag filter":<18} {"LIKE":>9} {"rows":>7} {"index":>9} {"rows":>7}')
+            for tag in FILTERS:
+                public = Circle.query.filter(Circle.privacy == 'public')
+                like_ms, like_rows = timed(lambda: public.filter(Circle.tags.ilike(f'%{tag}%')).all(), args.runs)
+                index_ms, index_rows = timed(lambda: with_tags(public, [tag]).all(), args.runs)
+                print(f'  {tag:<18} {like_ms:>7.2f}ms {len(like_rows):>7} {index_ms:>7.2f}ms {len(index_rows):>7}')
+
+            print(f'  {"autocomplete":<18} {"p50":>9}  top matches')
+            for prefix in PREFIXES:
+                query = Tag.query.filter(Tag.circle_count > 0, prefix_range(Tag.name, prefix)).order_by(
+                    Tag.circle_count.desc(), Tag.name
+                ).limit(10)
+                ms, tags = timed(query.all, args.runs)
+                print(f'  {prefix!r:<18} {ms:>7.2f}ms  {", ".join(tag.name for tag in tags[:5])}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Stress test for the batched view counter.
+
+Usage:
+    python -m benchmarks.view_counter [--threads 16] [--views 500] [--resources 5]
+
+Hammers POST /api/resources/<id>/view from many threads while the flusher
+runs on a short interval, then checks that every view reached
+Resource.view_count and that the creator got 5 points per 10 views once
+the points worker has caught up.
+Exits non-zero on any mismatch.
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+
+from benchmarks.common import scratch_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--views', type=int, default=500, help='views per thread')
+    parser.add_argument('--resources', type=int, default=5)
+    parser.add_argument('--flush-interval', type=float, default=0.05)
+    args = parser.parse_args()
+
+    learncircle = scratch_app()
+    app, db = learncircle.app, learncircle.db
+    app.config['VIEW_FLUSH_INTERVAL'] = args.flush_interval
+    # Statement wall time here is mostly threads waiting on each other
+    app.config['SLOW_QUERY_THRESHOLD'] = float('inf')
+
+    with app.app_context():
+        creator = learncircle.User(username='creator', email='creator@example.com', password='x', role='creator')
+        db.session.add(creator)
+        db.session.flush()
+        circle = learncircle.Circle(title='Stress', description='stress', creator_id=creator.id)
+        db.session.add(circle)
+        db.session.flush()
+        resources = [learncircle.Resource(title=f'R{i}', circle_id=circle.id, creator_id=creator.id,
+                                          resource_type='link', content='https://example.com')
+                     for i in range(args.resources)]
+        db.session.add_all(resources)
+        db.session.commit()
+        creator_id = creator.id
+        resource_ids = [r.id for r in resources]
+
+    expected = {resource_id: 0 for resource_id in resource_ids}
+    expected_lock = threading.Lock()
+    errors = []
+
+    def viewer(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        local = {}
+        for _ in range(args.views):
+            resource_id = rng.choice(resource_ids)
+            response = client.post(f'/api/resources/{resource_id}/view')
+            if response.status_code != 200:
+                errors.append(response.status_code)
+            local[resource_id] = local.get(resource_id, 0) + 1
+        with expected_lock:
+            for resource_id, count in local.items():
+                expected[resource_id] += count
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=viewer, args=(seed,)) for seed in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    failures = len(errors)
+    with app.app_context():
+        learncircle.flush_view_counts()
+        learncircle.process_points_events()
+        db.session.expire_all()
+        for resource_id, count in expected.items():
+            stored = db.session.get(learncircle.Resource, resource_id).view_count
+            if stored != count:
+                failures += 1
+                print(f'FAIL resource {resource_id}: view_count={stored} expected={count}')
+        points = db.session.get(learncircle.User, creator_id).points
+        expected_points = sum(count // 10 * 5 for count in expected.values())
+        if points != expected_points:
+            failures += 1
+            print(f'FAIL creator points={points} expected={expected_points}')
+
+    total = args.threads * args.views
+    print(f'{total} views from {args.threads} threads in {elapsed:.2f}s ({total / elapsed:,.0f} views/sec)')
+    print('no lost increments' if not failures else f'{failures} failures')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
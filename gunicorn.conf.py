@@ -0,0 +1,66 @@
+"""Production server settings: `gunicorn app:app` picks this file up.
+
+Workers are gevent, so every request runs in a greenlet. Anything that
+waits on a socket or a queue (chunked uploads, file downloads, chat
+streams, slow clients) parks its greenlet rather than holding a worker.
+One process handles `worker_connections` clients at once.
+
+Chat fan-out and the response cache live in each process unless
+CHAT_BROKER=redis and CACHE_BACKEND=redis are set. Until they are, a
+single worker is used; set WEB_CONCURRENCY to override.
+
+Every setting can be overridden from the environment:
+    BIND                 address to listen on (default 0.0.0.0:8000)
+    WEB_CONCURRENCY      worker processes
+    WORKER_CLASS         gevent (default), gthread or sync
+    WORKER_CONNECTIONS   concurrent clients per gevent worker (default 1000)
+    THREADS              threads per gthread worker (default 8)
+
+SECRET_KEY has to be set whenever there is more than one worker; the
+server refuses to start without it.
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+
+shared_state = os.environ.get('CHAT_BROKER') == 'redis' and os.environ.get('CACHE_BACKEND') == 'redis'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1 if shared_state else 1))
+worker_class = os.environ.get('WORKER_CLASS', 'gevent')
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+threads = int(os.environ.get('THREADS', 8))
+
+# gevent has to patch the standard library before app.py creates its locks,
+# queues and thread pools, so each worker imports the app itself
+preload_app = False
+
+# Chat streams stay open for as long as the page does. For gevent workers
+# the timeout only covers a stuck worker, never one long request
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = os.environ.get('ACCESS_LOG')  # '-' for stdout
+errorlog = '-'
+
+
+def on_starting(server):
+    if server.cfg.workers > 1 and not os.environ.get('SECRET_KEY'):
+        # Each worker would make up its own key and reject the others' session tokens
+        sys.exit('SECRET_KEY must be set when running more than one worker')
+    # Apply migrations once, before any worker starts. This runs in a child
+    # process so the master never imports app.py unpatched
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'db', 'upgrade'], cwd=chdir, check=True)
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            return
+        # Lets psycopg2 wait on PostgreSQL cooperatively too
+        patch_psycopg()
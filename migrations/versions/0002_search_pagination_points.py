@@ -0,0 +1,134 @@
+"""full-text search, pagination indexes, points events, leaderboards and counters
+
+Everything the models gained before migrations existed. Existing points
+history has no circle or leaderboard rows; run `flask rebuild-points` once
+after upgrading to build the leaderboards from it.
+
+Revision ID: 0002_search_pagination_points
+Revises: 0001_baseline
+Create Date: 2026-10-17 09:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_search_pagination_points'
+down_revision = '0001_baseline'
+branch_labels = None
+depends_on = None
+
+
+CIRCLE_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS circle_fts USING fts5(
+        title, tags, description, content='circle', content_rowid='id'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS circle_fts_ai AFTER INSERT ON circle BEGIN
+        INSERT INTO circle_fts(rowid, title, tags, description)
+        VALUES (new.id, new.title, new.tags, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS circle_fts_ad AFTER DELETE ON circle BEGIN
+        INSERT INTO circle_fts(circle_fts, rowid, title, tags, description)
+        VALUES ('delete', old.id, old.title, old.tags, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS circle_fts_au AFTER UPDATE ON circle BEGIN
+        INSERT INTO circle_fts(circle_fts, rowid, title, tags, description)
+        VALUES ('delete', old.id, old.title, old.tags, old.description);
+        INSERT INTO circle_fts(rowid, title, tags, description)
+        VALUES (new.id, new.title, new.tags, new.description);
+    END""",
+]
+
+
+def upgrade():
+    op.create_table('leaderboard_entry',
+        sa.Column('board', sa.String(length=40), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('points', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('board', 'user_id')
+    )
+    op.create_index('ix_leaderboard_rank', 'leaderboard_entry', ['board', 'points', 'user_id'])
+
+    op.create_table('points_event',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('points', sa.Integer(), nullable=False),
+        sa.Column('reason', sa.String(length=200), nullable=False),
+        sa.Column('circle_id', sa.Integer(), nullable=True),
+        sa.Column('idempotency_key', sa.String(length=200), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['circle_id'], ['circle.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('idempotency_key')
+    )
+    op.create_index('ix_points_event_pending', 'points_event', ['processed_at', 'id'])
+
+    with op.batch_alter_table('points_history', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('circle_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_points_history_circle_id', 'circle', ['circle_id'], ['id'])
+
+    op.create_index('ix_message_circle_timestamp', 'message', ['circle_id', 'timestamp', 'id'])
+    op.create_index('ix_comment_resource_timestamp', 'comment', ['resource_id', 'timestamp', 'id'])
+
+    with op.batch_alter_table('circle', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('member_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('follower_count', sa.Integer(), server_default='0', nullable=False))
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('completion_count', sa.Integer(), server_default='0', nullable=False))
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('completed_tasks_count', sa.Integer(), server_default='0', nullable=False))
+    backfill_counters()
+
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in CIRCLE_FTS_DDL:
+            op.execute(statement)
+        op.execute("INSERT INTO circle_fts(circle_fts) VALUES ('rebuild')")
+
+
+def backfill_counters():
+    circle = sa.table('circle', sa.column('id'), sa.column('member_count'), sa.column('follower_count'))
+    task = sa.table('task', sa.column('id'), sa.column('completion_count'))
+    user = sa.table('user', sa.column('id'), sa.column('completed_tasks_count'))
+    member = sa.table('circle_member', sa.column('circle_id'), sa.column('is_member'), sa.column('is_following'))
+    completion = sa.table('task_completion', sa.column('task_id'), sa.column('user_id'))
+
+    def count(table, *where):
+        return sa.select(sa.func.count()).select_from(table).where(*where).scalar_subquery()
+
+    op.execute(circle.update().values(
+        member_count=count(member, member.c.circle_id == circle.c.id, member.c.is_member == sa.true()),
+        follower_count=count(member, member.c.circle_id == circle.c.id, member.c.is_following == sa.true()),
+    ))
+    op.execute(task.update().values(completion_count=count(completion, completion.c.task_id == task.c.id)))
+    op.execute(user.update().values(completed_tasks_count=count(completion, completion.c.user_id == user.c.id)))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        for trigger in ('circle_fts_ai', 'circle_fts_ad', 'circle_fts_au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS circle_fts')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('completed_tasks_count')
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.drop_column('completion_count')
+    with op.batch_alter_table('circle', schema=None) as batch_op:
+        batch_op.drop_column('follower_count')
+        batch_op.drop_column('member_count')
+
+    op.drop_index('ix_comment_resource_timestamp', table_name='comment')
+    op.drop_index('ix_message_circle_timestamp', table_name='message')
+
+    with op.batch_alter_table('points_history', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_points_history_circle_id', type_='foreignkey')
+        batch_op.drop_column('circle_id')
+
+    op.drop_index('ix_points_event_pending', table_name='points_event')
+    op.drop_table('points_event')
+    op.drop_index('ix_leaderboard_rank', table_name='leaderboard_entry')
+    op.drop_table('leaderboard_entry')
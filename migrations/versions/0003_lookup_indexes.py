@@ -0,0 +1,86 @@
+"""unique membership/completion indexes and foreign key indexes
+
+Duplicate circle_member and task_completion rows left by the old
+check-then-insert race are merged before the unique indexes are built, and
+the denormalized counters are recounted afterwards.
+
+Revision ID: 0003_lookup_indexes
+Revises: 0002_search_pagination_points
+Create Date: 2026-10-17 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_lookup_indexes'
+down_revision = '0002_search_pagination_points'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('uq_circle_member_user_circle', 'circle_member', ['user_id', 'circle_id'], True),
+    ('ix_circle_member_circle_id', 'circle_member', ['circle_id'], False),
+    ('uq_task_completion_task_user', 'task_completion', ['task_id', 'user_id'], True),
+    ('ix_task_completion_user_id', 'task_completion', ['user_id'], False),
+    ('ix_resource_circle_upload_date', 'resource', ['circle_id', 'upload_date', 'id'], False),
+    ('ix_resource_creator_id', 'resource', ['creator_id'], False),
+    ('ix_task_circle_id', 'task', ['circle_id'], False),
+    ('ix_circle_creator_id', 'circle', ['creator_id'], False),
+    ('ix_circle_privacy_created', 'circle', ['privacy', 'created_at', 'id'], False),
+    ('ix_points_history_user_id', 'points_history', ['user_id'], False),
+]
+
+
+def merge_duplicate_members():
+    member = sa.table('circle_member', sa.column('id'), sa.column('user_id'), sa.column('circle_id'),
+                      sa.column('is_member'), sa.column('is_following'))
+    duplicate = member.alias('duplicate')
+    same_pair = sa.and_(duplicate.c.user_id == member.c.user_id, duplicate.c.circle_id == member.c.circle_id)
+
+    # Keep the oldest row per (user, circle), carrying over any flag set on a duplicate
+    op.execute(member.update().values(
+        is_member=sa.exists().where(same_pair, duplicate.c.is_member == sa.true()),
+        is_following=sa.exists().where(same_pair, duplicate.c.is_following == sa.true()),
+    ))
+    keep = sa.select(sa.func.min(member.c.id)).group_by(member.c.user_id, member.c.circle_id)
+    op.execute(member.delete().where(member.c.id.not_in(keep)))
+
+
+def remove_duplicate_completions():
+    completion = sa.table('task_completion', sa.column('id'), sa.column('task_id'), sa.column('user_id'))
+    keep = sa.select(sa.func.min(completion.c.id)).group_by(completion.c.task_id, completion.c.user_id)
+    op.execute(completion.delete().where(completion.c.id.not_in(keep)))
+
+
+def recount():
+    circle = sa.table('circle', sa.column('id'), sa.column('member_count'), sa.column('follower_count'))
+    task = sa.table('task', sa.column('id'), sa.column('completion_count'))
+    user = sa.table('user', sa.column('id'), sa.column('completed_tasks_count'))
+    member = sa.table('circle_member', sa.column('circle_id'), sa.column('is_member'), sa.column('is_following'))
+    completion = sa.table('task_completion', sa.column('task_id'), sa.column('user_id'))
+
+    def count(table, *where):
+        return sa.select(sa.func.count()).select_from(table).where(*where).scalar_subquery()
+
+    op.execute(circle.update().values(
+        member_count=count(member, member.c.circle_id == circle.c.id, member.c.is_member == sa.true()),
+        follower_count=count(member, member.c.circle_id == circle.c.id, member.c.is_following == sa.true()),
+    ))
+    op.execute(task.update().values(completion_count=count(completion, completion.c.task_id == task.c.id)))
+    op.execute(user.update().values(completed_tasks_count=count(completion, completion.c.user_id == user.c.id)))
+
+
+def upgrade():
+    merge_duplicate_members()
+    remove_duplicate_completions()
+    recount()
+    for name, table, columns, unique in INDEXES:
+        op.create_index(name, table, columns, unique=unique)
+
+
+def downgrade():
+    for name, table, columns, unique in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,37 @@
+"""circle similarity table for recommendations
+
+The table starts empty, and recommendations fall back to the most joined
+circles until it is filled; run `flask rebuild-recommendations` once after
+upgrading.
+
+Revision ID: 0004_circle_similarity
+Revises: 0003_lookup_indexes
+Create Date: 2026-10-17 12:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_circle_similarity'
+down_revision = '0003_lookup_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('circle_similarity',
+        sa.Column('circle_id', sa.Integer(), nullable=False),
+        sa.Column('similar_circle_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['circle_id'], ['circle.id']),
+        sa.ForeignKeyConstraint(['similar_circle_id'], ['circle.id']),
+        sa.PrimaryKeyConstraint('circle_id', 'similar_circle_id')
+    )
+    op.create_index('ix_circle_privacy_member_count', 'circle', ['privacy', 'member_count', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_circle_privacy_member_count', table_name='circle')
+    op.drop_table('circle_similarity')
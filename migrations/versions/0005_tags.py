@@ -0,0 +1,85 @@
+"""tag and circle_tag tables, filled from the comma-separated circle.tags
+
+circle.tags is left as it is. Every name in it is normalized the way
+normalize_tags() in app.py does it (lower-cased, whitespace collapsed,
+duplicates dropped) and becomes a tag row linked to the circle.
+
+Revision ID: 0005_tags
+Revises: 0004_circle_similarity
+Create Date: 2026-10-17 14:20:00.000000
+
+"""
+from collections import defaultdict
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_tags'
+down_revision = '0004_circle_similarity'
+branch_labels = None
+depends_on = None
+
+
+TAG_MAX_LENGTH = 50
+BATCH_SIZE = 10000
+
+
+def normalize_tags(value):
+    names = []
+    for tag in (value or '').split(','):
+        name = ' '.join(tag.lower().split())[:TAG_MAX_LENGTH]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def copy_tags():
+    circle = sa.table('circle', sa.column('id'), sa.column('tags'), sa.column('privacy'))
+    tag = sa.table('tag', sa.column('id'), sa.column('name'), sa.column('circle_count'))
+    circle_tag = sa.table('circle_tag', sa.column('circle_id'), sa.column('tag_id'))
+    connection = op.get_bind()
+
+    links, counts = [], defaultdict(int)
+    for circle_id, tags, privacy in connection.execute(sa.select(circle.c.id, circle.c.tags, circle.c.privacy)):
+        for name in normalize_tags(tags):
+            links.append((circle_id, name))
+            counts[name] += privacy == 'public'
+    if not counts:
+        return
+
+    connection.execute(tag.insert(), [{'name': name, 'circle_count': count} for name, count in counts.items()])
+    tag_ids = dict(connection.execute(sa.select(tag.c.name, tag.c.id)).all())
+    for start in range(0, len(links), BATCH_SIZE):
+        connection.execute(circle_tag.insert(), [{'circle_id': circle_id, 'tag_id': tag_ids[name]}
+                                                 for circle_id, name in links[start:start + BATCH_SIZE]])
+
+
+def upgrade():
+    op.create_table('tag',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('circle_count', sa.Integer(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name')
+    )
+    op.create_index('ix_tag_circle_count', 'tag', ['circle_count', 'name'])
+
+    op.create_table('circle_tag',
+        sa.Column('circle_id', sa.Integer(), nullable=False),
+        sa.Column('tag_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['circle_id'], ['circle.id']),
+        sa.ForeignKeyConstraint(['tag_id'], ['tag.id']),
+        sa.PrimaryKeyConstraint('circle_id', 'tag_id')
+    )
+    op.create_index('ix_circle_tag_tag_id', 'circle_tag', ['tag_id', 'circle_id'])
+
+    copy_tags()
+
+
+def downgrade():
+    op.drop_index('ix_circle_tag_tag_id', table_name='circle_tag')
+    op.drop_table('circle_tag')
+    op.drop_index('ix_tag_circle_count', table_name='tag')
+    op.drop_table('tag')
@@ -0,0 +1,43 @@
+"""notifications and the task due date index for reminders
+
+Revision ID: 0006_task_reminders
+Revises: 0005_tags
+Create Date: 2026-10-17 16:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_task_reminders'
+down_revision = '0005_tags'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('notification',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('message', sa.String(length=500), nullable=False),
+        sa.Column('task_id', sa.Integer(), nullable=True),
+        sa.Column('circle_id', sa.Integer(), nullable=True),
+        sa.Column('key', sa.String(length=100), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('read_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['circle_id'], ['circle.id']),
+        sa.ForeignKeyConstraint(['task_id'], ['task.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('key')
+    )
+    op.create_index('ix_notification_user_created', 'notification', ['user_id', 'created_at', 'id'])
+    op.create_index('ix_task_due_date', 'task', ['due_date', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_task_due_date', table_name='task')
+    op.drop_index('ix_notification_user_created', table_name='notification')
+    op.drop_table('notification')
@@ -0,0 +1,73 @@
+"""resource processing status, thumbnails and extracted text, with resource_fts
+
+Uploaded PDFs that are already stored become 'pending' when PyMuPDF is
+installed, and the preview sweep in app.py processes them a few at a
+time. Without it they become 'unavailable', and the sweep queues them once
+it is installed.
+
+Revision ID: 0007_resource_previews
+Revises: 0006_task_reminders
+Create Date: 2026-10-17 18:10:00.000000
+
+"""
+from alembic import op
+import importlib.util
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007_resource_previews'
+down_revision = '0006_task_reminders'
+branch_labels = None
+depends_on = None
+
+
+RESOURCE_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS resource_fts USING fts5(
+        title, extracted_text, content='resource', content_rowid='id'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS resource_fts_ai AFTER INSERT ON resource BEGIN
+        INSERT INTO resource_fts(rowid, title, extracted_text)
+        VALUES (new.id, new.title, new.extracted_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS resource_fts_ad AFTER DELETE ON resource BEGIN
+        INSERT INTO resource_fts(resource_fts, rowid, title, extracted_text)
+        VALUES ('delete', old.id, old.title, old.extracted_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS resource_fts_au AFTER UPDATE OF title, extracted_text ON resource BEGIN
+        INSERT INTO resource_fts(resource_fts, rowid, title, extracted_text)
+        VALUES ('delete', old.id, old.title, old.extracted_text);
+        INSERT INTO resource_fts(rowid, title, extracted_text)
+        VALUES (new.id, new.title, new.extracted_text);
+    END""",
+]
+
+
+def upgrade():
+    with op.batch_alter_table('resource', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('processing_status', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('thumbnail', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('extracted_text', sa.Text(), nullable=True))
+    op.create_index('ix_resource_processing_status', 'resource', ['processing_status', 'upload_date'])
+
+    resource = sa.table('resource', sa.column('resource_type'), sa.column('processing_status'))
+    status = 'pending' if importlib.util.find_spec('pymupdf') is not None else 'unavailable'
+    op.execute(resource.update().where(resource.c.resource_type == 'pdf').values(processing_status=status))
+
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in RESOURCE_FTS_DDL:
+            op.execute(statement)
+        op.execute("INSERT INTO resource_fts(resource_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        for trigger in ('resource_fts_ai', 'resource_fts_ad', 'resource_fts_au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS resource_fts')
+
+    op.drop_index('ix_resource_processing_status', table_name='resource')
+    with op.batch_alter_table('resource', schema=None) as batch_op:
+        batch_op.drop_column('extracted_text')
+        batch_op.drop_column('thumbnail')
+        batch_op.drop_column('processing_status')
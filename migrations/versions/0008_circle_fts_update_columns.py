@@ -0,0 +1,38 @@
+"""fire circle_fts_au only when an indexed circle column changes
+
+The trigger from 0002 fired on every UPDATE of circle, so each
+member_count or follower_count bump rewrote the circle's FTS row.
+
+Revision ID: 0008_circle_fts_update_columns
+Revises: 0007_resource_previews
+Create Date: 2026-10-17 20:30:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0008_circle_fts_update_columns'
+down_revision = '0007_resource_previews'
+branch_labels = None
+depends_on = None
+
+
+TRIGGER = """CREATE TRIGGER circle_fts_au AFTER UPDATE {columns}ON circle BEGIN
+        INSERT INTO circle_fts(circle_fts, rowid, title, tags, description)
+        VALUES ('delete', old.id, old.title, old.tags, old.description);
+        INSERT INTO circle_fts(rowid, title, tags, description)
+        VALUES (new.id, new.title, new.tags, new.description);
+    END"""
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS circle_fts_au')
+        op.execute(TRIGGER.format(columns='OF title, tags, description '))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS circle_fts_au')
+        op.execute(TRIGGER.format(columns=''))